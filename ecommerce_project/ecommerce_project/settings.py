@@ -44,10 +44,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'marketplace.instrumentation.PerformanceMiddleware',  # Query/latency metrics per URL name
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'marketplace.roles.RoleMiddleware',  # request.roles, cached per request/session
+    'marketplace.cart_service.CartMiddleware',  # Anonymous cart cookie
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -64,6 +67,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'marketplace.context_processors.cart',
+                'marketplace.context_processors.roles',
             ],
         },
     },
@@ -95,6 +100,35 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default; point 'default' at Redis/Memcached in production so
+# every worker shares cached responses and invalidations.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'marketplace',
+    }
+}
+
+# Anonymous catalog pages/API reads are cached until a related write invalidates them
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 300  # Seconds; invalidation normally happens long before this
+
+# Sessions (auth + cached roles; carts live in the Cart tables)
+# - 'cached_db': reads come from the cache, the database is only read on a miss
+# - 'signed_cookies': the session is kept in a signed cookie, no server storage at all
+# - 'db': Django's default, one SELECT per request that touches the session
+# The marketplace engines also skip the write when a request left the session unchanged.
+SESSION_STORAGE = 'cached_db'
+SESSION_ENGINES = {
+    'db': 'marketplace.sessions.db',
+    'cached_db': 'marketplace.sessions.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[SESSION_STORAGE]
+SESSION_CACHE_ALIAS = 'default'  # Must be shared by all workers for cached_db
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -174,3 +208,70 @@ TWITTER_CONSUMER_SECRET = ''  # Consumer Secret
 TWITTER_ACCESS_TOKEN = ''  # Access Token
 TWITTER_ACCESS_TOKEN_SECRET = ''  # Access Token Secret
 
+# Outbound notification outbox (tweets and invoice emails)
+# Messages are delivered by: python manage.py process_outbox --loop
+# Use 'marketplace.notification_service.StubTransport' to record messages instead of sending them
+NOTIFICATION_TRANSPORT = 'marketplace.notification_service.LiveTransport'
+OUTBOX_MAX_ATTEMPTS = 5  # Give up on a message after this many failed deliveries
+OUTBOX_RETRY_BACKOFF = 30  # Seconds before the first retry, doubled on every further attempt
+OUTBOX_LEASE = 300  # Seconds a worker holds a claimed batch; must exceed the time to deliver one
+
+# Carts are stored in the Cart/CartItem tables; anonymous carts are found by a cookie
+CART_COOKIE_NAME = 'cart'
+CART_COOKIE_AGE = 60 * 60 * 24 * 30  # 30 days; python manage.py purge_carts deletes older anonymous carts
+
+# Per-process cache of product snapshots used to price carts. Saves drop the
+# snapshot in the process that made them only, so other workers may price
+# carts from a stale snapshot for up to CART_SNAPSHOT_CACHE_TTL seconds.
+CART_SNAPSHOT_CACHE_SIZE = 2048  # Max products kept per process
+CART_SNAPSHOT_CACHE_TTL = 60  # Seconds before a snapshot is reloaded from the database
+
+# Product/store search
+# Defaults to FULLTEXT indexes on MariaDB/MySQL and an in-process index elsewhere.
+# Set SEARCH_BACKEND to a dotted class path to override the choice.
+SEARCH_BACKEND = None
+SEARCH_MAX_RESULTS = 1000  # Matches returned by the ranked search, best first (?search= filters are not capped)
+# The in-process index only sees its own process's writes; it is rebuilt this often (seconds)
+SEARCH_INDEX_MAX_AGE = 300
+
+# Home page catalog
+HOME_PAGE_SIZE = 24  # Products per page (and per "Load more" click)
+HOME_STREAM_CHUNK_SIZE = 200  # Rows fetched and rendered per chunk with ?stream=1
+PRODUCT_REVIEWS_PAGE_SIZE = 10  # Reviews per page on the product detail page
+
+# Performance instrumentation (marketplace.instrumentation.PerformanceMiddleware)
+# Metrics per URL name are available to staff at /api/metrics/
+PERFORMANCE_SAMPLE_WINDOW = 500  # Most recent requests kept per URL name
+
+# Max SQL queries per GET request, by URL name (session and auth lookups included).
+# Over-budget requests are logged; with QUERY_BUDGET_STRICT they raise instead,
+# which is how marketplace.testing.QueryBudgetTestMixin fails tests.
+QUERY_BUDGETS = {
+    'marketplace:home': 5,
+    'marketplace:product_detail': 6,
+    'marketplace:view_cart': 4,
+    'product-list': 5,
+    'product-detail': 5,
+    'product-search': 4,
+    'product-reviews': 5,
+    'review-list': 4,
+    'store-products': 5,
+    'store-list': 4,
+    'store-detail': 5,
+    'vendor-stores': 4,
+    'vendor-sales': 6,
+    'vendor-analytics': 6,
+    'order-list': 5,
+    'order-detail': 4,
+    'cart-list': 4,
+}
+QUERY_BUDGET_STRICT = False
+
+# Product image / store logo variants (marketplace.image_service)
+# Resized JPEG/PNG + WebP copies are written beside the original under MEDIA_ROOT
+IMAGE_VARIANT_SIZES = {
+    'thumb': (300, 300),
+    'medium': (800, 800),
+}
+IMAGE_PROCESSING_WORKERS = 2  # Size of the process pool used for resizing
+IMAGE_PROCESSING_ASYNC = True  # False = resize inline during the request (handy in tests)
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Store, Product, Order, OrderItem, Review, ResetToken
+from .models import (
+    Store, Product, Order, OrderItem, Review, ResetToken, OutboxMessage, Purchase, Cart, CartItem,
+    ProductDailySales, StoreDailySales, VendorDailySales,
+)
 
 @admin.register(Store)
 class StoreAdmin(admin.ModelAdmin):
@@ -11,6 +14,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'store', 'price', 'stock')
     list_filter = ('store',)
     search_fields = ('name', 'description')
+    readonly_fields = ('reviews_count', 'rating_sum', 'average_rating')
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -26,7 +30,46 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'buyer', 'rating', 'verified', 'created_at')
     list_filter = ('verified', 'rating')
 
+@admin.register(Purchase)
+class PurchaseAdmin(admin.ModelAdmin):
+    list_display = ('buyer', 'product', 'first_purchased_at')
+    search_fields = ('buyer__username', 'product__name')
+    raw_id_fields = ('buyer', 'product')
+
+@admin.register(ProductDailySales)
+class ProductDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'product', 'units', 'revenue', 'orders')
+    date_hierarchy = 'date'
+    raw_id_fields = ('product', 'store')
+
+@admin.register(StoreDailySales)
+class StoreDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'store', 'units', 'revenue', 'orders')
+    date_hierarchy = 'date'
+    raw_id_fields = ('store',)
+
+@admin.register(VendorDailySales)
+class VendorDailySalesAdmin(admin.ModelAdmin):
+    list_display = ('date', 'vendor', 'units', 'revenue', 'orders')
+    date_hierarchy = 'date'
+    raw_id_fields = ('vendor',)
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    raw_id_fields = ('product',)
+    extra = 0
+
+@admin.register(Cart)
+class CartAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'created_at', 'updated_at')
+    raw_id_fields = ('user',)
+    inlines = [CartItemInline]
+
 @admin.register(ResetToken)
 class ResetTokenAdmin(admin.ModelAdmin):
     list_display = ('user', 'expiry_date', 'used')
 
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('kind', 'status')
@@ -0,0 +1,185 @@
+# Sales analytics: daily rollups per product, per store and per vendor
+#
+# Checkout adds every order to ProductDailySales, StoreDailySales and
+# VendorDailySales inside its own transaction: one INSERT that ignores existing
+# (key, date) rows, then F() increments, so concurrent checkouts never lose a
+# sale. Vendor rows count an order once even when it spans several of the
+# vendor's stores. Reports read only the rollups - a year of one store is at
+# most 365 rows - so they cost the same whatever the size of the order history.
+# rebuild_rollups() recomputes them from orders (python manage.py
+# rebuild_sales_rollups).
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Store, Order, OrderItem, ProductDailySales, StoreDailySales, VendorDailySales
+
+
+REVENUE = DecimalField(max_digits=14, decimal_places=2)
+
+
+def record_order(order, items):
+    """Add the order's items (OrderItems with their product loaded) to the day's rollups"""
+    day = timezone.localdate(order.created_at)
+    products = {}
+    stores = {}
+    for item in items:
+        revenue = item.price * item.quantity
+        store_id, units, total = products.get(item.product_id, (item.product.store_id, 0, Decimal('0')))
+        products[item.product_id] = (store_id, units + item.quantity, total + revenue)
+        units, total = stores.get(store_id, (0, Decimal('0')))
+        stores[store_id] = (units + item.quantity, total + revenue)
+    vendors = {}
+    for store_id, vendor_id in Store.objects.filter(id__in=stores).values_list('id', 'vendor_id'):
+        units, total = vendors.get(vendor_id, (0, Decimal('0')))
+        store_units, store_total = stores[store_id]
+        vendors[vendor_id] = (units + store_units, total + store_total)
+
+    ProductDailySales.objects.bulk_create(
+        [ProductDailySales(product_id=product_id, store_id=store_id, date=day)
+         for product_id, (store_id, _, _) in products.items()],
+        ignore_conflicts=True,
+    )
+    StoreDailySales.objects.bulk_create(
+        [StoreDailySales(store_id=store_id, date=day) for store_id in stores],
+        ignore_conflicts=True,
+    )
+    VendorDailySales.objects.bulk_create(
+        [VendorDailySales(vendor_id=vendor_id, date=day) for vendor_id in vendors],
+        ignore_conflicts=True,
+    )
+    # Update in key order so concurrent checkouts lock rollup rows in the same order
+    for product_id, (_, units, revenue) in sorted(products.items()):
+        ProductDailySales.objects.filter(product_id=product_id, date=day).update(
+            units=F('units') + units, revenue=F('revenue') + revenue, orders=F('orders') + 1
+        )
+    for store_id, (units, revenue) in sorted(stores.items()):
+        StoreDailySales.objects.filter(store_id=store_id, date=day).update(
+            units=F('units') + units, revenue=F('revenue') + revenue, orders=F('orders') + 1
+        )
+    for vendor_id, (units, revenue) in sorted(vendors.items()):
+        VendorDailySales.objects.filter(vendor_id=vendor_id, date=day).update(
+            units=F('units') + units, revenue=F('revenue') + revenue, orders=F('orders') + 1
+        )
+
+
+def _day_range(first_day, last_day):
+    """[from, to) aware datetimes covering the days first_day to last_day, for index range scans"""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(first_day, time.min), tz),
+        timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz),
+    )
+
+
+def _rollup_rows(items, key, batch_size):
+    """GROUP BY key + day over the items, as dicts of units/revenue/orders"""
+    return (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values(*key, 'day')
+        .annotate(
+            total_units=Sum('quantity'),
+            total_revenue=Sum(F('price') * F('quantity'), output_field=REVENUE),
+            order_count=Count('order_id', distinct=True),
+        )
+        .order_by()
+        .iterator(chunk_size=batch_size)
+    )
+
+
+def rebuild_rollups(since=None, until=None, days_per_batch=31, batch_size=2000, log=print):
+    """
+    Recompute the rollups of the days [since, until] (default: all order
+    history) one window of days per transaction. Returns the rows written.
+    Orders placed while a window is rebuilt may be counted twice or not at
+    all, so run it when checkout is quiet.
+    """
+    if since is None or until is None:
+        bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+        if bounds['first'] is None:
+            return 0
+        since = since or timezone.localdate(bounds['first'])
+        until = until or timezone.localdate(bounds['last'])
+
+    written = 0
+    window_start = since
+    while window_start <= until:
+        window_end = min(window_start + timedelta(days=days_per_batch - 1), until)
+        window_from, window_to = _day_range(window_start, window_end)
+        items = OrderItem.objects.filter(order__created_at__gte=window_from, order__created_at__lt=window_to)
+
+        with transaction.atomic():
+            ProductDailySales.objects.filter(date__range=(window_start, window_end)).delete()
+            StoreDailySales.objects.filter(date__range=(window_start, window_end)).delete()
+            VendorDailySales.objects.filter(date__range=(window_start, window_end)).delete()
+
+            product_rows = [
+                ProductDailySales(product_id=row['product_id'], store_id=row['product__store_id'], date=row['day'],
+                                  units=row['total_units'], revenue=row['total_revenue'], orders=row['order_count'])
+                for row in _rollup_rows(items, ['product_id', 'product__store_id'], batch_size)
+            ]
+            store_rows = [
+                StoreDailySales(store_id=row['product__store_id'], date=row['day'],
+                                units=row['total_units'], revenue=row['total_revenue'], orders=row['order_count'])
+                for row in _rollup_rows(items, ['product__store_id'], batch_size)
+            ]
+            vendor_rows = [
+                VendorDailySales(vendor_id=row['product__store__vendor_id'], date=row['day'],
+                                 units=row['total_units'], revenue=row['total_revenue'], orders=row['order_count'])
+                for row in _rollup_rows(items, ['product__store__vendor_id'], batch_size)
+            ]
+            ProductDailySales.objects.bulk_create(product_rows, batch_size=batch_size)
+            StoreDailySales.objects.bulk_create(store_rows, batch_size=batch_size)
+            VendorDailySales.objects.bulk_create(vendor_rows, batch_size=batch_size)
+
+        written += len(product_rows) + len(store_rows) + len(vendor_rows)
+        log(f'{window_start} - {window_end}: {len(product_rows)} product rows, {len(store_rows)} store rows, '
+            f'{len(vendor_rows)} vendor rows')
+        window_start = window_end + timedelta(days=1)
+    return written
+
+
+def _figures(rows):
+    return rows.annotate(total_units=Sum('units'), total_revenue=Sum('revenue'), total_orders=Sum('orders'))
+
+
+def vendor_sales_report(vendor, start, end, store_id=None, top_products=10):
+    """
+    A vendor's sales between the dates start and end (inclusive), read from the
+    rollups only: totals, a series of the days that had sales, per-store
+    figures and the best selling products. An order that bought from two of
+    the vendor's stores counts once in the totals and days, and once for each
+    store in the per-store figures.
+    """
+    stores = StoreDailySales.objects.filter(store__vendor=vendor, date__range=(start, end))
+    products = ProductDailySales.objects.filter(store__vendor=vendor, date__range=(start, end))
+    if store_id is not None:
+        stores = stores.filter(store_id=store_id)
+        products = products.filter(store_id=store_id)
+        daily = stores
+    else:
+        daily = VendorDailySales.objects.filter(vendor=vendor, date__range=(start, end))
+
+    days = list(_figures(daily.values('date')).order_by('date'))
+    return {
+        'start': start,
+        'end': end,
+        'totals': {
+            'total_units': sum(row['total_units'] for row in days),
+            'total_revenue': sum((row['total_revenue'] for row in days), Decimal('0')),
+            'total_orders': sum(row['total_orders'] for row in days),
+        },
+        'days': days,
+        'stores': list(
+            _figures(stores.values('store_id', store_name=F('store__name'))).order_by('-total_revenue', 'store_id')
+        ),
+        'top_products': list(
+            _figures(products.values('product_id', product_name=F('product__name')))
+            .order_by('-total_revenue', 'product_id')[:top_products]
+        ),
+    }
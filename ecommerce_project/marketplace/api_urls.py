@@ -4,7 +4,10 @@ Following REST API best practices for resource naming and routing
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import StoreViewSet, ProductViewSet, ReviewViewSet, VendorViewSet
+from .api_views import (
+    StoreViewSet, ProductViewSet, ReviewViewSet, VendorViewSet, OrderViewSet, CartViewSet,
+    PerformanceMetricsView
+)
 
 # Create a router and register our viewsets
 router = DefaultRouter()
@@ -12,8 +15,11 @@ router.register(r'stores', StoreViewSet, basename='store')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'reviews', ReviewViewSet, basename='review')
 router.register(r'vendors', VendorViewSet, basename='vendor')
+router.register(r'orders', OrderViewSet, basename='order')
+router.register(r'cart', CartViewSet, basename='cart')
 
 # The API URLs are now determined automatically by the router
 urlpatterns = [
     path('', include(router.urls)),
+    path('metrics/', PerformanceMetricsView.as_view(), name='performance-metrics'),  # Admin only
 ]
@@ -1,30 +1,52 @@
 # REST API views for marketplace
 
+import csv
+from datetime import timedelta
+
 from rest_framework import viewsets, permissions, filters, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError, PermissionDenied
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.contrib.auth.models import User
-from django_filters.rest_framework import DjangoFilterBackend
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, CharFilter
 
-from .models import Store, Product, Review, Order, OrderItem
+from .models import Store, Product, Review
 from .serializers import (
     StoreSerializer, StoreListSerializer,
     ProductSerializer, ProductListSerializer,
     ReviewSerializer, UserSerializer,
-    OrderSerializer
+    OrderSerializer, SaleSerializer, SalesReportSerializer, CartSerializer, CartLineSerializer,
+    ReviewFilterSerializer
+)
+from .row_serializers import PRODUCT_LIST_ROWS, STORE_LIST_ROWS, REVIEW_ROWS
+from .search_service import search_products, filter_products, filter_stores
+from .pagination import CatalogPagination
+from .roles import RolePermissionMixin, VENDORS, BUYERS
+from .instrumentation import registry
+from .catalog_service import (
+    import_products, export_products, detect_format, open_text, ImportFormatError
+)
+from .cache_service import (
+    CachedReadMixin, tag_response, product_tags, store_tags, store_product_tags, invalidate_catalog,
+    PRODUCTS_TAG, STORES_TAG
 )
+from .purchase_service import has_purchased, sync_review_verification
+from .cart_service import (
+    get_cart, cart_lines, visitor_cart_lines, add_item, set_quantity, remove_item, clear_cart, price_cart
+)
+from .order_service import buyer_orders, vendor_sales, with_items, export_orders
+from .analytics_service import vendor_sales_report
 
 
 # Custom Permissions
 
-class IsVendorOrReadOnly(permissions.BasePermission):
-    def has_permission(self, request, view):
-        if request.method in permissions.SAFE_METHODS:
-            return True
-        
-        return (request.user and 
-                request.user.is_authenticated and 
-                request.user.groups.filter(name='Vendors').exists())
+class IsVendorOrReadOnly(RolePermissionMixin, permissions.BasePermission):
+    required_role = VENDORS
 
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
@@ -42,71 +64,245 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
         return False
 
 
-class IsBuyerOrReadOnly(permissions.BasePermission):
-    def has_permission(self, request, view):
-        if request.method in permissions.SAFE_METHODS:
-            return True
-        
-        return (request.user and 
-                request.user.is_authenticated and 
-                request.user.groups.filter(name='Buyers').exists())
+class IsBuyerOrReadOnly(RolePermissionMixin, permissions.BasePermission):
+    required_role = BUYERS
+
+
+def export_response(request, rows, filename):
+    """
+    Stream the lines yielded by rows(file_format) as CSV (default) or JSONL
+    (?type=jsonl), downloaded as <filename>.<format>
+    """
+    try:
+        file_format = detect_format('', request.query_params.get('type', 'csv'))
+    except ImportFormatError as e:
+        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(rows(file_format), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{file_format}"'
+    return response
+
+
+class ExpandMixin:
+    """
+    ?expand=a,b on the detail action, validated against `expansions` and
+    handed to the serializer as context['expand']
+    """
+    expansions = ()
+    
+    def get_expand(self):
+        """Validated ?expand=a,b values, only honoured on the detail action"""
+        if self.action != 'retrieve':
+            return ()
+        expand = [value for value in self.request.query_params.get('expand', '').split(',') if value]
+        unknown = set(expand) - set(self.expansions)
+        if unknown:
+            raise ValidationError({'expand': f"Unknown expansion(s) {', '.join(sorted(unknown))}; "
+                                             f"choose from {', '.join(self.expansions)}"})
+        return tuple(expand)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+
+
+class RowListMixin:
+    """
+    list() rendered from .values() rows by `row_serializer` (see
+    row_serializers) - the same JSON as serializer_class, without loading a
+    model instance per row
+    """
+    row_serializer = None
+    
+    def row_response(self, queryset, row_serializer=None):
+        """Paginated response of the queryset rendered by row_serializer"""
+        rows = row_serializer or self.row_serializer
+        queryset = rows.values(queryset)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(rows.serialize(page, self.get_serializer_context()))
+        return Response(rows.serialize(queryset, self.get_serializer_context()))
+    
+    def list(self, request, *args, **kwargs):
+        return self.row_response(self.filter_queryset(self.get_queryset()))
+
+
+# Custom Filters
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter (same ?search= parameter) that
+    matches through the full-text index instead of LIKE '%term%' scans: each
+    word must start a word of the indexed fields. Databases without a
+    full-text index get SearchFilter's LIKE over search_fields.
+    The view names its filter in `fulltext_filter` (see search_service).
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        filtered = view.fulltext_filter(queryset, query)
+        if filtered is None:
+            return super().filter_queryset(request, queryset, view)
+        return filtered
 
 
-class StoreViewSet(viewsets.ModelViewSet):
-    queryset = Store.objects.all().select_related('vendor').prefetch_related('products')
+class StoreViewSet(ExpandMixin, CachedReadMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Store.objects.all().select_related('vendor')
+    pagination_class = CatalogPagination
     permission_classes = [IsVendorOrReadOnly, IsOwnerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['vendor__username']
     search_fields = ['name', 'description', 'vendor__username']
+    fulltext_filter = staticmethod(filter_stores)
     ordering_fields = ['created_at', 'name']
     ordering = ['-created_at']
+    expansions = StoreSerializer.EXPANSIONS
+    row_serializer = STORE_LIST_ROWS
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Counts/prices are aggregated in SQL; products are never loaded for a list,
+            # and StoreSerializer fetches one bounded page of them for a detail view
+            return queryset.with_product_stats()
+        return queryset
     
     def get_serializer_class(self):
         if self.action == 'list':
             return StoreListSerializer
         return StoreSerializer
     
+    def cache_tags(self):
+        if self.action == 'list':
+            return [STORES_TAG]
+        tags = store_tags(self.kwargs['pk'])
+        if 'vendor.stores' in self.get_expand():
+            tags = tags + [STORES_TAG]
+        return tags
+    
     def perform_create(self, serializer):
         serializer.save(vendor=self.request.user)
     
     @action(detail=True, methods=['get'])
     def products(self, request, pk=None):
         store = self.get_object()
-        products = store.products.all()
-        serializer = ProductListSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        return self.row_response(store.products.order_by('-created_at', '-id'), PRODUCT_LIST_ROWS)
+    
+    @action(detail=True, methods=['post'], url_path='products/import')
+    def import_products(self, request, pk=None):
+        """
+        Bulk upsert products from an uploaded CSV or JSONL file (multipart field "file").
+        Columns: sku, name, description, price, stock. The format comes from the
+        file extension or ?type=csv|jsonl.
+        """
+        store = self.get_object()
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'Upload the catalog as a "file" field'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            file_format = detect_format(upload.name, request.query_params.get('type'))
+            result = import_products(store, open_text(upload), file_format)
+        except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(result.as_dict())
+    
+    @action(detail=True, methods=['get'], url_path='products/export')
+    def export_products(self, request, pk=None):
+        """Stream the store's catalog as CSV (default) or JSONL (?type=jsonl)"""
+        store = self.get_object()
+        return export_response(
+            request, lambda file_format: export_products(store, file_format), f'store-{store.id}-products'
+        )
+
+
+class ProductFilter(FilterSet):
+    # Filters on the product's own copy of the vendor, served by (vendor, -created_at)
+    store__vendor__username = CharFilter(field_name='vendor__username')
+
+    class Meta:
+        model = Product
+        fields = ['store']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all().select_related('store__vendor').prefetch_related('reviews')
+class ProductViewSet(ExpandMixin, CachedReadMixin, RowListMixin, viewsets.ModelViewSet):
+    queryset = Product.objects.all().select_related('store__vendor')
+    pagination_class = CatalogPagination
     permission_classes = [IsVendorOrReadOnly, IsOwnerOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['store', 'store__vendor__username']
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = ProductFilter
     search_fields = ['name', 'description', 'store__name']
+    fulltext_filter = staticmethod(filter_products)
     ordering_fields = ['created_at', 'price', 'stock', 'name']
     ordering = ['-created_at']
+    expansions = ProductSerializer.EXPANSIONS
+    row_serializer = PRODUCT_LIST_ROWS
     
     def get_serializer_class(self):
         if self.action == 'list':
             return ProductListSerializer
         return ProductSerializer
     
+    def cache_tags(self):
+        if self.action == 'list':
+            return [PRODUCTS_TAG]
+        return product_tags(self.kwargs['pk'])
+    
+    def get_object(self):
+        product = super().get_object()
+        # The product's store is only known now; its detail shows the store and vendor names
+        tag_response(self.request, *store_product_tags(product.store_id))
+        return product
+    
     def perform_create(self, serializer):
         store = serializer.validated_data.get('store')
         if store.vendor != self.request.user:
             raise permissions.PermissionDenied("You can only add products to your own stores")
         serializer.save()
     
+    # Keyset cursors need a (created_at, id) ordered queryset, not a ranked id list
+    @action(detail=False, methods=['get'], pagination_class=PageNumberPagination)
+    def search(self, request):
+        """Relevance-ranked product search: /api/products/search/?q=<terms>, page numbers only"""
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': 'Provide search terms with ?q='}, status=status.HTTP_400_BAD_REQUEST)
+        
+        ranked_ids = search_products(query)
+        page = self.paginate_queryset(ranked_ids)
+        page_ids = page if page is not None else ranked_ids
+        products = Product.objects.select_related('store__vendor').in_bulk(page_ids)
+        ranked = [products[product_id] for product_id in page_ids if product_id in products]
+        serializer = ProductListSerializer(ranked, many=True, context={'request': request})
+        
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['get'])
     def reviews(self, request, pk=None):
+        """
+        The product's reviews, newest first and paginated, with the stored 1-5
+        star histogram. Filter with ?verified=true|false and ?rating=1-5.
+        """
         product = self.get_object()
-        reviews = product.reviews.all().select_related('buyer')
-        serializer = ReviewSerializer(reviews, many=True, context={'request': request})
-        return Response(serializer.data)
+        filters = ReviewFilterSerializer(data=request.query_params.dict())
+        filters.is_valid(raise_exception=True)
+        reviews = product.reviews.filter_page(**filters.validated_data).order_by('-created_at')
+        response = self.row_response(reviews, REVIEW_ROWS)
+        response.data['rating_histogram'] = product.rating_histogram
+        return response
 
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(RowListMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all().select_related('product', 'buyer')
+    serializer_class = ReviewSerializer
+    row_serializer = REVIEW_ROWS
+    pagination_class = CatalogPagination
     permission_classes = [IsBuyerOrReadOnly, IsOwnerOrReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['product', 'buyer__username', 'rating', 'verified']
@@ -115,19 +311,195 @@ class ReviewViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
     
     def perform_create(self, serializer):
-        serializer.save(buyer=self.request.user)
+        # The product's rating aggregates are refreshed by signals.py
+        product = serializer.validated_data['product']
+        serializer.save(buyer=self.request.user, verified=has_purchased(self.request.user, product))
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def verify(self, request):
+        """
+        Recompute the verified flag from the purchase ledger for every review
+        matching the list filters (e.g. ?product=3), or only the "ids" posted.
+        """
+        reviews = self.filter_queryset(self.get_queryset())
+        ids = request.data.get('ids')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return Response({'detail': '"ids" must be a list of review ids'}, status=status.HTTP_400_BAD_REQUEST)
+            reviews = reviews.filter(id__in=ids)
+        
+        verified, unverified = sync_review_verification(reviews)
+        if verified or unverified:
+            # Bulk UPDATEs send no signals
+            invalidate_catalog()
+        return Response({'verified': verified, 'unverified': unverified})
+
+
+def date_param(request, name, default):
+    """A YYYY-MM-DD query parameter as a date"""
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValidationError({name: 'Use the YYYY-MM-DD format'})
+    return parsed
 
 
 class VendorViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = User.objects.filter(groups__name='Vendors').prefetch_related('stores')
+    queryset = User.objects.filter(groups__name='Vendors')
     serializer_class = UserSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['username', 'email']
     ordering = ['username']
+    max_report_days = 366  # Longest date range the analytics action answers
     
     @action(detail=True, methods=['get'])
     def stores(self, request, pk=None):
         vendor = self.get_object()
-        stores = vendor.stores.all().prefetch_related('products')
+        stores = vendor.stores.all().select_related('vendor').with_product_stats().order_by('-created_at')
         serializer = StoreListSerializer(stores, many=True, context={'request': request})
         return Response(serializer.data)
+    
+    def get_seller(self):
+        """The vendor in the URL, if the request comes from that vendor (or staff)"""
+        vendor = self.get_object()
+        if not (self.request.user.is_staff or self.request.user.pk == vendor.pk):
+            raise PermissionDenied('Only the vendor can see their sales')
+        return vendor
+    
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated],
+            pagination_class=CatalogPagination)
+    def sales(self, request, pk=None):
+        """Orders containing the vendor's products, newest first, with only the vendor's lines"""
+        vendor = self.get_seller()
+        orders = with_items(vendor_sales(vendor), vendor=vendor).order_by('-created_at', '-id')
+        page = self.paginate_queryset(orders)
+        if page is not None:
+            serializer = SaleSerializer(page, many=True, context={'request': request})
+            return self.get_paginated_response(serializer.data)
+        serializer = SaleSerializer(orders, many=True, context={'request': request})
+        return Response(serializer.data)
+    
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated],
+            url_path='sales/export')
+    def export_sales(self, request, pk=None):
+        """Stream every sale as CSV (one row per line, default) or JSONL (?type=jsonl)"""
+        vendor = self.get_seller()
+        return export_response(
+            request, lambda file_format: export_orders(vendor_sales(vendor), file_format, vendor=vendor),
+            f'vendor-{vendor.id}-sales'
+        )
+    
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def analytics(self, request, pk=None):
+        """
+        Sales between ?start= and ?end= (YYYY-MM-DD, inclusive; the last 30 days
+        by default), optionally for one ?store=. Reads the daily rollups only.
+        """
+        vendor = self.get_seller()
+        end = date_param(request, 'end', timezone.localdate())
+        start = date_param(request, 'start', end - timedelta(days=29))
+        if start > end:
+            raise ValidationError({'start': 'start must not be after end'})
+        if (end - start).days >= self.max_report_days:
+            raise ValidationError({'start': f'Ask for at most {self.max_report_days} days'})
+        store_id = request.query_params.get('store')
+        if store_id is not None and not store_id.isdigit():
+            raise ValidationError({'store': 'Expected a store id'})
+        
+        report = vendor_sales_report(vendor, start, end, store_id=int(store_id) if store_id else None)
+        return Response(SalesReportSerializer(report).data)
+
+
+class OrderViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    The buyer's order history, newest first. Items and their products come
+    from two prefetch queries per page; ?paginate=keyset skips the COUNT.
+    """
+    serializer_class = OrderSerializer
+    pagination_class = CatalogPagination
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = []
+    
+    def get_queryset(self):
+        return with_items(buyer_orders(self.request.user)).order_by('-created_at', '-id')
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the whole history as CSV (one row per line, default) or JSONL (?type=jsonl)"""
+        return export_response(
+            request, lambda file_format: export_orders(buyer_orders(request.user), file_format), 'orders'
+        )
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    The visitor's cart - the user's when logged in, otherwise the anonymous
+    cart named by the cart cookie (set on the first add).
+    - GET    /api/cart/                 -> priced lines, total, item count
+    - POST   /api/cart/                 -> {"product": id, "quantity": n} adds n
+    - PUT    /api/cart/<product id>/    -> {"quantity": n} sets the line (0 removes it)
+    - DELETE /api/cart/<product id>/    -> removes the line
+    - DELETE /api/cart/clear/           -> empties the cart
+    Every change is a single-row upsert/delete; responses are the updated cart.
+    """
+    permission_classes = [permissions.AllowAny]
+    lookup_value_regex = r'\d+'  # Product id
+    
+    def cart_response(self, lines):
+        cart_items, total = price_cart(lines)
+        count = sum(item['quantity'] for item in cart_items)
+        return Response(CartSerializer({'items': cart_items, 'total': total, 'count': count}).data)
+    
+    def list(self, request):
+        return self.cart_response(visitor_cart_lines(request))
+    
+    def create(self, request):
+        line = CartLineSerializer(data=request.data)
+        line.is_valid(raise_exception=True)
+        cart = get_cart(request, create=True)
+        if line.validated_data['quantity']:
+            add_item(cart, line.validated_data['product'].id, line.validated_data['quantity'])
+        return self.cart_response(cart_lines(cart))
+    
+    def update(self, request, pk=None):
+        line = CartLineSerializer(data={'product': pk, 'quantity': request.data.get('quantity')})
+        line.is_valid(raise_exception=True)
+        cart = get_cart(request, create=True)
+        set_quantity(cart, line.validated_data['product'].id, line.validated_data['quantity'])
+        return self.cart_response(cart_lines(cart))
+    
+    def partial_update(self, request, pk=None):
+        return self.update(request, pk)
+    
+    def destroy(self, request, pk=None):
+        cart = get_cart(request)
+        if cart is not None:
+            remove_item(cart, pk)
+        return self.cart_response(cart_lines(cart))
+    
+    @action(detail=False, methods=['delete'])
+    def clear(self, request):
+        cart = get_cart(request)
+        clear_cart(cart)
+        return self.cart_response({})
+
+
+class PerformanceMetricsView(APIView):
+    """
+    Rolling p50/p95/p99 of latency, query count, DB time and serializer time
+    per URL name, as recorded by PerformanceMiddleware in this process.
+    DELETE clears the samples.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request):
+        return Response(registry.summary())
+    
+    def delete(self, request):
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,185 @@
+# Response cache for anonymous catalog reads
+#
+# Entries are keyed on the path plus normalized query parameters and tagged
+# (e.g. "products", "product:12"). Every tag has a version stored in the cache
+# and baked into the entry key, so invalidating a tag is one cache write and
+# makes every entry that depends on it unreachable immediately.
+# Tags only known once the response is built (the store of a product page)
+# are added with tag_response(); their versions are stored in the entry and
+# checked on every hit instead.
+
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def cache_timeout():
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+
+
+# ==================== TAGS ====================
+
+CATALOG_TAG = 'catalog'
+PRODUCTS_TAG = 'products'
+STORES_TAG = 'stores'
+
+
+def product_tags(product_id):
+    return [f'product:{product_id}']
+
+
+def store_tags(store_id):
+    return [f'store:{store_id}']
+
+
+def store_product_tags(store_id):
+    """Product pages that show the store (name, vendor)"""
+    return [f'store:{store_id}:products']
+
+
+def _tag_key(tag):
+    return f'catalog:tag:{tag}'
+
+
+def tag_versions(tags):
+    """Current version of each tag; unknown tags get a fresh random version"""
+    cache = get_cache()
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(list(keys))
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        # add() so two processes initializing the same tag agree on one version
+        for key, version in missing.items():
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[_tag_key(tag)] for tag in tags]
+
+
+def invalidate_tags(*tags):
+    """Give each tag a new version, orphaning every cached entry that used it"""
+    if tags:
+        get_cache().set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags}, None)
+
+
+def invalidate_catalog():
+    """Drop every cached catalog response, e.g. after bulk updates that skip signals"""
+    invalidate_tags(CATALOG_TAG)
+
+
+# ==================== KEYS ====================
+
+def normalized_query(request):
+    """Query parameters as a stable string: sorted keys and values, blanks dropped"""
+    pairs = sorted(
+        (key, value)
+        for key in request.GET
+        for value in request.GET.getlist(key)
+        if value != ''
+    )
+    return '&'.join(f'{key}={value}' for key, value in pairs)
+
+
+def build_cache_key(namespace, request, tags):
+    # Every entry also depends on CATALOG_TAG so bulk jobs can flush everything at once
+    versions = tag_versions([CATALOG_TAG] + list(tags))
+    # Host is part of the key because paginated API responses embed absolute links
+    raw = '|'.join([namespace, request.build_absolute_uri(request.path), normalized_query(request)] + versions)
+    return f'catalog:response:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def is_cacheable(request):
+    return request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def tag_response(request, *tags):
+    """Make the cached response of this request also depend on tags found while building it"""
+    request = getattr(request, '_request', request)  # DRF requests wrap the HttpRequest
+    response_tags = getattr(request, '_response_tags', {})
+    response_tags.update(zip(tags, tag_versions(tags)))
+    request._response_tags = response_tags
+
+
+def get_entry(key):
+    """The cached value, or None when it is missing or one of its response tags changed"""
+    entry = get_cache().get(key)
+    if entry is None:
+        return None
+    value, response_tags = entry
+    if response_tags and tag_versions(list(response_tags)) != list(response_tags.values()):
+        return None
+    return value
+
+
+def set_entry(key, request, value):
+    request = getattr(request, '_request', request)
+    get_cache().set(key, (value, getattr(request, '_response_tags', {})), cache_timeout())
+
+
+# ==================== VIEWS ====================
+
+def cache_anonymous_page(get_tags):
+    """
+    Cache the rendered page of a function view for anonymous visitors.
+    get_tags(request, *args, **kwargs) returns the tags the page depends on.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            # Pages show the cart badge, so visitors with a cart get them uncached
+            has_cart = getattr(settings, 'CART_COOKIE_NAME', 'cart') in request.COOKIES
+            if not is_cacheable(request) or has_cart:
+                return view_func(request, *args, **kwargs)
+
+            key = build_cache_key(view_func.__name__, request, get_tags(request, *args, **kwargs))
+            cached = get_entry(key)
+            if cached is not None:
+                content, headers = cached
+                return HttpResponse(content, headers=headers)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                set_entry(key, request, (response.content, dict(response.items())))
+            return response
+        return wrapper
+    return decorator
+
+
+class CachedReadMixin:
+    """
+    Serve anonymous list/retrieve calls from the cache.
+    The serialized data is cached (not the rendered bytes), so JSON and the
+    browsable API share entries. Viewsets declare their tags in cache_tags().
+    """
+
+    def cache_tags(self):
+        raise NotImplementedError
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        key = build_cache_key(f'{self.basename}-{self.action}', request, self.cache_tags())
+        data = get_entry(key)
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            set_entry(key, request, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
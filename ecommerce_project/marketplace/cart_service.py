@@ -0,0 +1,281 @@
+# Database carts (one row per line) and cart pricing backed by a small
+# per-process product snapshot cache
+
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Product, Cart, CartItem
+
+
+# Just the fields the cart needs - cheap to cache and safe to share between requests
+ProductSnapshot = namedtuple('ProductSnapshot', ['id', 'name', 'price', 'stock', 'store_name'])
+
+
+class ProductSnapshotCache:
+    """
+    LRU cache of ProductSnapshots for this process.
+    Entries are dropped when a product or store is saved/deleted (see signals.py)
+    and expire after a short TTL to bound staleness across processes.
+    """
+
+    def __init__(self, max_size=2048, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, product_ids):
+        """Return {id: snapshot} for the ids that exist, loading misses in one query"""
+        now = time.monotonic()
+        found = {}
+        missing = []
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._entries.get(product_id)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(product_id)
+                    found[product_id] = entry[0]
+                else:
+                    missing.append(product_id)
+
+        if missing:
+            products = Product.objects.select_related('store').in_bulk(missing)
+            with self._lock:
+                for product_id, product in products.items():
+                    snapshot = ProductSnapshot(
+                        id=product.id,
+                        name=product.name,
+                        price=product.price,
+                        stock=product.stock,
+                        store_name=product.store.name
+                    )
+                    found[product_id] = snapshot
+                    self._entries[product_id] = (snapshot, now + self.ttl)
+                    self._entries.move_to_end(product_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        return found
+
+    def invalidate(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                self._entries.pop(product_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+product_snapshots = ProductSnapshotCache(
+    max_size=getattr(settings, 'CART_SNAPSHOT_CACHE_SIZE', 2048),
+    ttl=getattr(settings, 'CART_SNAPSHOT_CACHE_TTL', 60)
+)
+
+
+# ==================== CART STORAGE ====================
+
+def cart_cookie_name():
+    return getattr(settings, 'CART_COOKIE_NAME', 'cart')
+
+
+def cart_cookie_age():
+    return getattr(settings, 'CART_COOKIE_AGE', 60 * 60 * 24 * 30)
+
+
+def get_cart(request, create=False):
+    """
+    The current visitor's Cart: the user's cart when logged in, otherwise the
+    anonymous cart named by the cart cookie. Returns None when there is none
+    and create is False. New anonymous carts get their cookie set by CartMiddleware.
+    """
+    # State lives on the HttpRequest (not a DRF Request wrapper) so CartMiddleware sees it
+    http_request = getattr(request, '_request', request)
+    if hasattr(http_request, '_cart'):
+        if http_request._cart is not None or not create:
+            return http_request._cart
+
+    if request.user.is_authenticated:
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart is None and create:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
+    else:
+        token = request.COOKIES.get(cart_cookie_name())
+        cart = Cart.objects.filter(token=token, user=None).first() if token else None
+        if cart is None and create:
+            cart = Cart.objects.create(token=secrets.token_urlsafe(32))
+            http_request._cart_cookie = cart.token
+
+    http_request._cart = cart
+    return cart
+
+
+def cart_lines(cart):
+    """{product id: quantity} for every line of the cart (empty for no cart)"""
+    if cart is None:
+        return {}
+    return dict(cart.items.values_list('product_id', 'quantity'))
+
+
+def add_item(cart, product_id, quantity=1):
+    """Add quantity (at least 1) to a cart line: one UPDATE, or one INSERT for a new line"""
+    if quantity < 1:
+        raise ValueError(f'Cannot add a quantity of {quantity}; use set_quantity() or remove_item()')
+    updated = CartItem.objects.filter(cart=cart, product_id=product_id).update(
+        quantity=F('quantity') + quantity
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+    except IntegrityError:
+        # A concurrent request inserted the line first
+        CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=F('quantity') + quantity)
+
+
+def set_quantity(cart, product_id, quantity):
+    """Set a line's quantity: one UPDATE, or one INSERT for a new line; zero removes the line"""
+    if quantity <= 0:
+        remove_item(cart, product_id)
+        return
+    # Not bulk_create(update_conflicts=...): MySQL can't target the (cart, product) constraint
+    if CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=quantity):
+        return
+    try:
+        with transaction.atomic():
+            CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+    except IntegrityError:
+        # A concurrent request inserted the line first
+        CartItem.objects.filter(cart=cart, product_id=product_id).update(quantity=quantity)
+
+
+def remove_item(cart, product_id):
+    CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+
+
+def clear_cart(cart):
+    if cart is not None:
+        cart.items.all().delete()
+
+
+def merge_carts(user, token):
+    """Move the anonymous cart named by token into the user's cart, adding quantities"""
+    if not token:
+        return None
+    with transaction.atomic():
+        anonymous = Cart.objects.select_for_update().filter(token=token, user=None).first()
+        if anonymous is None:
+            return None
+        cart, _ = Cart.objects.get_or_create(user=user)
+        for product_id, quantity in cart_lines(anonymous).items():
+            if quantity > 0:
+                add_item(cart, product_id, quantity)
+        anonymous.delete()
+    return cart
+
+
+def purge_expired_carts(batch_size=1000):
+    """
+    Delete the anonymous carts whose cookie has expired - it is set once, when
+    the cart is created, so nobody can reach them any more. Returns the number
+    of carts deleted.
+    """
+    cutoff = timezone.now() - timedelta(seconds=cart_cookie_age())
+    expired = Cart.objects.filter(user=None, created_at__lt=cutoff).order_by('id').values_list('id', flat=True)
+    deleted = 0
+    while True:
+        ids = list(expired[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            Cart.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+
+
+def _visitor_items(request):
+    """CartItems of the visitor's cart without loading the Cart row, None without a cart"""
+    if request.user.is_authenticated:
+        return CartItem.objects.filter(cart__user=request.user)
+    token = request.COOKIES.get(cart_cookie_name())
+    if not token:
+        return None
+    return CartItem.objects.filter(cart__token=token, cart__user=None)
+
+
+def visitor_cart_lines(request):
+    """Lines of the visitor's cart in one query, remembered for the rest of the request"""
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, '_cart_lines'):
+        items = _visitor_items(request)
+        http_request._cart_lines = dict(items.values_list('product_id', 'quantity')) if items is not None else {}
+    return http_request._cart_lines
+
+
+def cart_item_count(request):
+    """Total quantity in the visitor's cart - no query without a cart or when the lines are loaded"""
+    http_request = getattr(request, '_request', request)
+    if hasattr(http_request, '_cart_lines'):
+        return sum(http_request._cart_lines.values())
+    items = _visitor_items(request)
+    if items is None:
+        return 0
+    return items.aggregate(count=Sum('quantity'))['count'] or 0
+
+
+class CartMiddleware:
+    """
+    Sets the anonymous cart cookie when a request created a cart and drops
+    it once the cart has been merged into a user's cart at login.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if getattr(request, '_cart_cookie_delete', False):
+            response.delete_cookie(cart_cookie_name())
+        elif getattr(request, '_cart_cookie', None):
+            response.set_cookie(
+                cart_cookie_name(),
+                request._cart_cookie,
+                max_age=cart_cookie_age(),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+# ==================== PRICING ====================
+
+def price_cart(cart):
+    """
+    Price cart lines ({product id: quantity}, see cart_lines()).
+    Returns (cart_items, total); lines for deleted products are skipped.
+    """
+    snapshots = product_snapshots.get_many([int(product_id) for product_id in cart])
+    cart_items = []
+    total = 0
+
+    for product_id, quantity in cart.items():
+        product = snapshots.get(int(product_id))
+        if product is None:
+            continue
+        subtotal = product.price * quantity
+        cart_items.append({
+            'product': product,
+            'quantity': quantity,
+            'subtotal': subtotal
+        })
+        total += subtotal
+
+    return cart_items, total
@@ -0,0 +1,199 @@
+# Bulk catalog import/export for vendors
+#
+# Imports stream a CSV or JSONL file, validate rows in chunks with the same
+# rules as the product API and upsert them with bulk_create/bulk_update, one
+# transaction per chunk. Rows with a sku update the store's product with that
+# sku; rows without one are always created. bulk_* operations skip post_save,
+# so one aggregated tweet is queued instead of one per product and the caches
+# and search index are refreshed once at the end.
+
+import csv
+import io
+import json
+
+from django.db import IntegrityError, transaction
+
+from .models import Product
+from .serializers import ProductImportSerializer
+from .notification_service import queue_catalog_import_tweet
+from .cache_service import invalidate_catalog
+from .cart_service import product_snapshots
+from .search_service import get_search_backend
+
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ['id', 'sku', 'name', 'description', 'price', 'stock']
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportFormatError(ValueError):
+    """The file can't be read as the requested format"""
+
+
+def detect_format(filename, requested=None):
+    file_format = (requested or filename.rsplit('.', 1)[-1]).lower()
+    if file_format not in FORMATS:
+        raise ImportFormatError(f'Unsupported format "{file_format}", use one of: {", ".join(FORMATS)}')
+    return file_format
+
+
+def read_rows(text_stream, file_format):
+    """
+    Yield (row dict, None) for every row, or (None, error message) for a JSONL
+    line that isn't a JSON object, without loading the whole file
+    """
+    if file_format == 'csv':
+        for row in csv.DictReader(text_stream):
+            yield row, None
+    else:
+        for line_number, line in enumerate(text_stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield None, f'Line {line_number}: invalid JSON ({e.msg})'
+                continue
+            if not isinstance(row, dict):
+                yield None, f'Line {line_number}: expected a JSON object'
+                continue
+            yield row, None
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, row_number, error):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'errors': error})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'invalid': self.invalid,
+            'errors': self.errors,
+        }
+
+
+def import_products(store, text_stream, file_format, chunk_size=1000):
+    """Upsert every valid row of the stream into the store's catalog"""
+    result = ImportResult()
+    touched_ids = []
+    chunk = []
+
+    for row_number, (row, error) in enumerate(read_rows(text_stream, file_format), start=1):
+        if error:
+            result.add_error(row_number, error)
+            continue
+        serializer = ProductImportSerializer(data=row)
+        if not serializer.is_valid():
+            result.add_error(row_number, serializer.errors)
+            continue
+        chunk.append(serializer.validated_data)
+        if len(chunk) >= chunk_size:
+            touched_ids += _upsert_chunk(store, chunk, result)
+            chunk = []
+    if chunk:
+        touched_ids += _upsert_chunk(store, chunk, result)
+
+    if result.created or result.updated:
+        _catalog_changed(touched_ids)
+    if result.created:
+        queue_catalog_import_tweet(store, result.created)
+    return result
+
+
+def _upsert_chunk(store, rows, result):
+    try:
+        return _write_chunk(store, rows, result)
+    except IntegrityError:
+        # A concurrent import of the same store inserted one of the new skus first.
+        # Its row is committed now, so the retry locks it and updates it instead.
+        return _write_chunk(store, rows, result)
+
+
+def _write_chunk(store, rows, result):
+    # Later rows win when a chunk repeats a sku
+    by_sku = {}
+    without_sku = []
+    for row in rows:
+        # ProductImportSerializer has already turned blank skus into None
+        sku = row.get('sku')
+        if sku:
+            by_sku[sku] = row
+        else:
+            without_sku.append(row)
+
+    with transaction.atomic():
+        existing = {
+            product.sku: product
+            for product in Product.objects.select_for_update().filter(store=store, sku__in=list(by_sku))
+        }
+        to_update = []
+        to_create = []
+        for sku, row in by_sku.items():
+            product = existing.get(sku)
+            if product is None:
+                to_create.append(Product(store=store, vendor_id=store.vendor_id, **{**row, 'sku': sku}))
+            else:
+                for field, value in row.items():
+                    setattr(product, field, value)
+                to_update.append(product)
+        to_create += [Product(store=store, vendor_id=store.vendor_id, **{**row, 'sku': None}) for row in without_sku]
+
+        if to_update:
+            Product.objects.bulk_update(to_update, ['name', 'description', 'price', 'stock'])
+        created = Product.objects.bulk_create(to_create)
+
+    result.created += len(created)
+    result.updated += len(to_update)
+    return [product.id for product in to_update]
+
+
+def _catalog_changed(updated_ids):
+    """Signals didn't fire for bulk writes - refresh caches and the search index once"""
+    def refresh():
+        product_snapshots.invalidate(updated_ids)
+        invalidate_catalog()
+        get_search_backend().reset()
+    transaction.on_commit(refresh)
+
+
+# ==================== EXPORT ====================
+
+class Echo:
+    """File-like object whose write() just returns the line, for csv.writer"""
+    def write(self, value):
+        return value
+
+
+def export_products(store, file_format, chunk_size=2000):
+    """Yield the store's catalog as CSV or JSONL lines, one chunk of rows at a time"""
+    rows = (
+        Product.objects.filter(store=store)
+        .order_by('id')
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            record = dict(zip(EXPORT_FIELDS, row))
+            record['price'] = str(record['price'])
+            yield json.dumps(record) + '\n'
+
+
+def open_text(binary_file, encoding='utf-8'):
+    """Wrap an uploaded/binary file so it can be read line by line as text"""
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline='')
@@ -0,0 +1,104 @@
+# Checkout engine: turns a cart into an order in one transaction
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Product, Order, OrderItem
+from .notification_service import queue_invoice_email
+from .cart_service import product_snapshots
+from .purchase_service import record_purchases
+from .analytics_service import record_order
+from .cache_service import invalidate_tags, product_tags, store_tags, PRODUCTS_TAG, STORES_TAG
+
+
+class CheckoutError(Exception):
+    """Base class for checkout failures"""
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f'Not enough stock for {product.name}')
+
+
+class UnknownProductError(CheckoutError):
+    def __init__(self, product_id):
+        self.product_id = product_id
+        super().__init__(f'Product {product_id} no longer exists')
+
+
+def stock_changed(products):
+    """Drop cached copies of products whose stock was changed with update()"""
+    product_snapshots.invalidate([product.id for product in products])
+    tags = [PRODUCTS_TAG, STORES_TAG]
+    for product in products:
+        tags += product_tags(product.id) + store_tags(product.store_id)
+    invalidate_tags(*tags)
+
+
+def normalize_cart(cart):
+    """Convert cart lines ({id or '<id>': qty}) into {id: qty}, dropping empty lines"""
+    lines = {}
+    for product_id, quantity in cart.items():
+        quantity = int(quantity)
+        if quantity > 0:
+            lines[int(product_id)] = lines.get(int(product_id), 0) + quantity
+    return lines
+
+
+def place_order(buyer, cart):
+    """
+    Create an order for every line in the cart.
+    - All cart products are locked with one SELECT ... FOR UPDATE
+    - Stock is decremented with conditional F() updates, so concurrent
+      buyers can never take it below zero
+    - Order items are inserted with a single bulk_create
+    - The purchase ledger records each (buyer, product) pair
+    - The day's sales rollups are incremented
+    - The invoice email is queued in the outbox, not sent inline
+    Raises CheckoutError (and rolls everything back) if a line can't be filled.
+    """
+    lines = normalize_cart(cart)
+    if not lines:
+        raise CheckoutError('Cart is empty')
+
+    with transaction.atomic():
+        # Lock rows in primary key order so concurrent checkouts can't deadlock
+        products = {
+            product.id: product
+            for product in Product.objects.select_for_update().filter(id__in=lines).order_by('id')
+        }
+
+        for product_id in sorted(lines):
+            product = products.get(product_id)
+            if product is None:
+                raise UnknownProductError(product_id)
+            quantity = lines[product_id]
+            if product.stock < quantity:
+                raise OutOfStockError(product)
+            updated = Product.objects.filter(id=product_id, stock__gte=quantity).update(
+                stock=F('stock') - quantity
+            )
+            if not updated:
+                raise OutOfStockError(product)
+            product.stock -= quantity
+
+        total = sum(products[product_id].price * quantity for product_id, quantity in lines.items())
+        order = Order.objects.create(buyer=buyer, total_price=total)
+        items = OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=products[product_id],
+                quantity=quantity,
+                price=products[product_id].price
+            )
+            for product_id, quantity in lines.items()
+        ])
+        record_purchases(buyer, list(lines))
+        record_order(order, items)
+        # Queued in the same transaction so the invoice exists if and only if the order does
+        queue_invoice_email(order)
+        # Stock changed through update(), which doesn't send post_save
+        transaction.on_commit(lambda: stock_changed(products.values()))
+
+    return order
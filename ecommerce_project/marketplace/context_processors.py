@@ -0,0 +1,18 @@
+# Template context shared by every marketplace page
+
+from .cart_service import cart_item_count
+from .roles import VENDORS, BUYERS
+
+
+def cart(request):
+    """Cart badge count: one SUM over the cart lines, nothing for visitors without a cart"""
+    return {'cart_count': cart_item_count(request)}
+
+
+def roles(request):
+    """is_vendor / is_buyer flags from the cached role lookup (request.roles, see RoleMiddleware)"""
+    user_roles = request.roles
+    return {
+        'is_vendor': VENDORS in user_roles,
+        'is_buyer': BUYERS in user_roles,
+    }
@@ -0,0 +1,46 @@
+# Image resizing worker functions
+#
+# Runs inside ProcessPoolExecutor workers, so this module deliberately imports
+# nothing from Django: workers only need Pillow and the file system.
+
+import os
+
+from PIL import Image, ImageOps
+
+
+def variant_name(source_name, variant, extension):
+    """product_images/mug.jpg -> product_images/mug__thumb.webp"""
+    stem, _ = os.path.splitext(source_name)
+    return f'{stem}__{variant}.{extension}'
+
+
+def generate_variants(media_root, source_name, sizes, webp_quality=80, jpeg_quality=85):
+    """
+    Create a resized copy of media_root/source_name for every (variant, (w, h))
+    in sizes, once in a web-friendly original format (JPEG, or PNG when the
+    image has transparency) and once as WebP. Files are written beside the
+    original. Returns {variant: name, f'{variant}_webp': name, ...}.
+    """
+    variants = {}
+    with Image.open(os.path.join(media_root, source_name)) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        for variant, size in sizes.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+
+            if has_alpha:
+                name = variant_name(source_name, variant, 'png')
+                resized.save(os.path.join(media_root, name), 'PNG', optimize=True)
+            else:
+                name = variant_name(source_name, variant, 'jpg')
+                resized.save(os.path.join(media_root, name), 'JPEG', quality=jpeg_quality, optimize=True)
+            variants[variant] = name
+
+            webp_name = variant_name(source_name, variant, 'webp')
+            resized.save(os.path.join(media_root, webp_name), 'WEBP', quality=webp_quality)
+            variants[f'{variant}_webp'] = webp_name
+
+    return variants
@@ -0,0 +1,135 @@
+# Thumbnail/WebP variants for Product.image and Store.logo
+#
+# When a product image or store logo is saved, resizing is handed to a process
+# pool so the upload request returns straight away. The generated file names
+# are stored in Product.image_variants / Store.logo_variants, which lets
+# serializers and templates build variant URLs without touching the disk.
+# Variants are written next to the original under MEDIA_ROOT, so this assumes
+# the default FileSystemStorage. They are deleted with their instance, and as
+# soon as the image they were made from is replaced or cleared.
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+from .image_processing import generate_variants
+from .models import Product, Store
+from .cache_service import invalidate_tags, product_tags, store_tags, PRODUCTS_TAG, STORES_TAG
+
+
+DEFAULT_SIZES = {
+    'thumb': (300, 300),
+    'medium': (800, 800),
+}
+
+# model -> (image field, variants field)
+IMAGE_FIELDS = {
+    Product: ('image', 'image_variants'),
+    Store: ('logo', 'logo_variants'),
+}
+
+logger = logging.getLogger('marketplace.images')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_sizes():
+    return {name: tuple(size) for name, size in getattr(settings, 'IMAGE_VARIANT_SIZES', DEFAULT_SIZES).items()}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2))
+        return _executor
+
+
+def needs_processing(instance):
+    image_field, variants_field = IMAGE_FIELDS[type(instance)]
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field) or {}
+    return bool(image) and variants.get('source') != image.name
+
+
+def schedule_variants(instance):
+    """Generate variants for a saved instance - in the pool, or inline if disabled"""
+    image_field, _ = IMAGE_FIELDS[type(instance)]
+    source_name = getattr(instance, image_field).name
+    args = (str(settings.MEDIA_ROOT), source_name, get_sizes())
+
+    if not getattr(settings, 'IMAGE_PROCESSING_ASYNC', True):
+        save_variants(type(instance), instance.pk, source_name, generate_variants(*args))
+        return
+
+    future = get_executor().submit(generate_variants, *args)
+
+    def done(future):
+        # Runs on an executor thread in this process, so it needs its own DB connection
+        close_old_connections()
+        try:
+            if future.exception() is None:
+                save_variants(type(instance), instance.pk, source_name, future.result())
+            else:
+                logger.error('Image processing failed for %s', source_name, exc_info=future.exception())
+        finally:
+            close_old_connections()
+
+    future.add_done_callback(done)
+
+
+def save_variants(model, pk, source_name, variants):
+    """Record generated variants, unless the image was replaced in the meantime"""
+    image_field, variants_field = IMAGE_FIELDS[model]
+    previous = model.objects.filter(pk=pk).values_list(variants_field, flat=True).first() or {}
+    updated = model.objects.filter(pk=pk, **{image_field: source_name}).update(
+        **{variants_field: {'source': source_name, **variants}}
+    )
+    if not updated:
+        # Image changed or row deleted while we were working: discard our files
+        delete_variant_files(variants)
+        return
+    if previous.get('source') != source_name:
+        delete_variant_files(previous)
+    # update() sends no signals - drop cached pages that show this image
+    if model is Product:
+        invalidate_tags(PRODUCTS_TAG, STORES_TAG, *product_tags(pk))
+    else:
+        invalidate_tags(STORES_TAG, *store_tags(pk))
+
+
+def discard_stale_variants(instance):
+    """
+    Forget the variants of an image that has been replaced or cleared, and
+    delete their files once the save commits
+    """
+    image_field, variants_field = IMAGE_FIELDS[type(instance)]
+    variants = getattr(instance, variants_field) or {}
+    if not variants or variants.get('source') == getattr(instance, image_field).name:
+        return
+    type(instance).objects.filter(pk=instance.pk).update(**{variants_field: {}})
+    setattr(instance, variants_field, {})
+    transaction.on_commit(lambda: delete_variant_files(variants))
+
+
+def delete_variant_files(variants):
+    for key, name in (variants or {}).items():
+        if key != 'source' and default_storage.exists(name):
+            default_storage.delete(name)
+
+
+def variant_urls(variants, request=None):
+    """{variant: url} for a stored variants dict, absolute when a request is given"""
+    urls = {}
+    for key, name in (variants or {}).items():
+        if key == 'source':
+            continue
+        url = default_storage.url(name)
+        urls[key] = request.build_absolute_uri(url) if request else url
+    return urls
+
@@ -0,0 +1,234 @@
+# Per-endpoint performance instrumentation
+#
+# PerformanceMiddleware records, for every request, the number of SQL queries,
+# time spent in the database, time spent serializing (DRF) and total latency,
+# grouped by resolved URL name. Recent samples are kept in memory per process
+# and summarised as percentiles by the admin-only /api/metrics/ endpoint.
+# QUERY_BUDGETS in settings caps the number of queries each URL name may run.
+# Streaming responses are measured until their last chunk has been sent, so the
+# queries run while iterating the body count against the budget too.
+
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('marketplace.performance')
+
+# Metrics of the request currently being handled (None outside a request)
+_current = ContextVar('marketplace_request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in strict mode when a view runs more queries than its budget allows"""
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Installed with connection.execute_wrapper(): times every query
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+@contextmanager
+def collect_metrics(metrics=None):
+    """
+    Count queries and DB time on every database connection inside the block,
+    adding to `metrics` when given (e.g. to resume a streaming request)
+    """
+    if metrics is None:
+        metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield metrics
+    finally:
+        _current.reset(token)
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation() to the current request's
+    serializer_time. Only the outermost call is timed, so nested serializers
+    aren't counted twice.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None:
+            return super().to_representation(instance)
+
+        outermost = metrics.serializer_depth == 0
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_depth -= 1
+            if outermost:
+                metrics.serializer_time += time.perf_counter() - started
+
+
+@contextmanager
+def timed_serialization():
+    """Adds the block's time to serializer_time, for code that serializes without DRF"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+
+    metrics.serializer_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        metrics.serializer_time += time.perf_counter() - started
+
+
+# ==================== SAMPLE STORE ====================
+
+class MetricsRegistry:
+    """Rolling window of the most recent samples for each URL name"""
+
+    FIELDS = ('latency', 'queries', 'db_time', 'serializer_time')
+
+    def __init__(self, window=500):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._over_budget = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, url_name, latency, queries, db_time, serializer_time, over_budget):
+        with self._lock:
+            self._samples[url_name].append((latency, queries, db_time, serializer_time))
+            if over_budget:
+                self._over_budget[url_name] += 1
+
+    def summary(self):
+        with self._lock:
+            snapshot = {name: list(samples) for name, samples in self._samples.items()}
+            over_budget = dict(self._over_budget)
+
+        result = {}
+        for url_name, samples in sorted(snapshot.items()):
+            endpoint = {
+                'samples': len(samples),
+                'query_budget': get_query_budget(url_name),
+                'over_budget': over_budget.get(url_name, 0),
+            }
+            for index, field in enumerate(self.FIELDS):
+                values = sorted(sample[index] for sample in samples)
+                # Times are reported in milliseconds
+                scale = 1 if field == 'queries' else 1000
+                endpoint[field] = {
+                    f'p{p}': round(percentile(values, p) * scale, 2) for p in (50, 95, 99)
+                }
+            result[url_name] = endpoint
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._over_budget.clear()
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0
+    rank = max(int(round(p / 100 * len(sorted_values))) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+registry = MetricsRegistry(window=getattr(settings, 'PERFORMANCE_SAMPLE_WINDOW', 500))
+
+
+def get_query_budget(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+# ==================== MIDDLEWARE ====================
+
+class PerformanceMiddleware:
+    """Place near the top of MIDDLEWARE so session/auth queries are counted too"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        url_name = match.view_name
+
+        # Async bodies are iterated outside this thread's connections and aren't measured
+        if response.streaming and not response.is_async:
+            response.streaming_content = self.measure_stream(
+                request, url_name, response.streaming_content, metrics, started)
+            return response
+
+        latency = time.perf_counter() - started
+        self.finish(request, url_name, metrics, latency)
+
+        if settings.DEBUG:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time * 1000:.1f}, '
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}, '
+                f'total;dur={latency * 1000:.1f}'
+            )
+            response['X-Query-Count'] = str(metrics.queries)
+
+        return response
+
+    def measure_stream(self, request, url_name, content, metrics, started):
+        """
+        Yield the chunks of a streaming body, counting the queries each one
+        runs, and record the request once the last chunk has been produced.
+        The headers are already sent by then, so there is no Server-Timing.
+        """
+        chunks, end = iter(content), object()
+        while True:
+            with collect_metrics(metrics):
+                chunk = next(chunks, end)
+            if chunk is end:
+                break
+            yield chunk
+        self.finish(request, url_name, metrics, time.perf_counter() - started)
+
+    def finish(self, request, url_name, metrics, latency):
+        """Record the request's metrics and enforce its query budget"""
+        # Budgets describe reads; writes legitimately run more queries
+        budget = get_query_budget(url_name) if request.method in ('GET', 'HEAD') else None
+        over_budget = budget is not None and metrics.queries > budget
+        registry.record(url_name, latency, metrics.queries, metrics.db_time,
+                        metrics.serializer_time, over_budget)
+
+        if over_budget:
+            message = (f'{request.method} {request.path} ({url_name}) ran {metrics.queries} '
+                       f'queries, budget is {budget}')
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
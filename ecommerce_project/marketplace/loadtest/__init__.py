@@ -0,0 +1,9 @@
+# Load testing harness
+#
+# data.py generates a synthetic catalog, client.py is a small asyncio HTTP
+# client, scenarios.py holds the buyer/vendor flows from diagrams/ and
+# runner.py drives virtual users and reports per-endpoint latency.
+# Entry point: python manage.py loadtest
+#
+# seed.py (with worker.py as its process pool entry point) generates a much
+# larger marketplace for benchmarks: python manage.py seed_marketplace
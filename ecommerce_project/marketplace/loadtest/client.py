@@ -0,0 +1,119 @@
+# Minimal keep-alive HTTP/1.1 client on asyncio streams (no third-party deps)
+
+import asyncio
+import json
+import time
+from collections import namedtuple
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+Response = namedtuple('Response', ['status', 'headers', 'body'])
+
+
+class HttpClient:
+    """
+    One virtual user's connection: reuses a single socket, keeps cookies
+    (session, csrftoken, cart) and sends the CSRF header Django expects on
+    unsafe requests.
+    """
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def request(self, method, path, params=None, data=None, json_body=None):
+        """Send one request; returns (Response, seconds)"""
+        if params:
+            path = f'{path}?{urlencode(params)}'
+        headers = {'Host': f'{self.host}:{self.port}', 'Connection': 'keep-alive'}
+        body = b''
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urlencode(data).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if method not in ('GET', 'HEAD') and 'csrftoken' in self.cookies:
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        headers['Content-Length'] = str(len(body))
+
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        started = time.perf_counter()
+        response = await asyncio.wait_for(self._send(head.encode() + b'\r\n' + body), self.timeout)
+        elapsed = time.perf_counter() - started
+        self._store_cookies(response.headers)
+        return response, elapsed
+
+    async def _send(self, payload, retry=True):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            self._writer.write(payload)
+            await self._writer.drain()
+            return await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            # The server closed an idle keep-alive connection: reconnect once
+            await self.close()
+            if not retry:
+                raise
+            return await self._send(payload, retry=False)
+
+    async def _read_response(self):
+        status_line = await self._reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        headers = []
+        while True:
+            line = await self._reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip().lower(), value.strip()))
+        header_map = dict(headers)
+
+        if 'content-length' in header_map:
+            body = await self._reader.readexactly(int(header_map['content-length']))
+        elif header_map.get('transfer-encoding') == 'chunked':
+            body = await self._read_chunked()
+        else:
+            body = await self._reader.read()
+            header_map['connection'] = 'close'
+
+        if header_map.get('connection', '').lower() == 'close':
+            await self.close()
+        return Response(status, headers, body)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            if size == 0:
+                await self._reader.readuntil(b'\r\n')
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readexactly(2)
+
+    def _store_cookies(self, headers):
+        for name, value in headers:
+            if name != 'set-cookie':
+                continue
+            for morsel in SimpleCookie(value).values():
+                if morsel['max-age'] == '0' or not morsel.value:
+                    self.cookies.pop(morsel.key, None)
+                else:
+                    self.cookies[morsel.key] = morsel.value
@@ -0,0 +1,129 @@
+# Synthetic catalog for load tests: vendors, stores, products, buyers and reviews
+#
+# Everything is inserted with bulk_create, so no post_save signals fire (no
+# tweets are queued). The same random seed always produces the same data.
+
+import random
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User, Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from ..models import Store, Product, Review, RATING_STATS_FIELDS
+from ..roles import VENDORS, BUYERS
+
+
+USER_PREFIX = 'lt_'
+PASSWORD = 'loadtest-password'
+
+ADJECTIVES = [
+    'wireless', 'leather', 'organic', 'vintage', 'cotton', 'ceramic', 'bamboo', 'steel',
+    'handmade', 'portable', 'classic', 'premium', 'compact', 'rechargeable', 'waterproof',
+]
+NOUNS = [
+    'lamp', 'chair', 'mug', 'headphones', 'backpack', 'jacket', 'speaker', 'blanket',
+    'notebook', 'bottle', 'watch', 'sneakers', 'kettle', 'candle', 'wallet', 'charger',
+]
+COMMENTS = ['Great value', 'Does the job', 'Arrived late', 'Love it', 'Not as described', 'Would buy again']
+
+
+def vendor_username(index):
+    return f'{USER_PREFIX}vendor_{index}'
+
+
+def buyer_username(index):
+    return f'{USER_PREFIX}buyer_{index}'
+
+
+def product_name(rng):
+    return f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)}'
+
+
+def ensure_groups():
+    """The Vendors and Buyers groups, created with the permissions setup_groups.py gives them"""
+    vendors, created = Group.objects.get_or_create(name=VENDORS)
+    if created:
+        content_types = ContentType.objects.get_for_models(Store, Product).values()
+        vendors.permissions.set(Permission.objects.filter(content_type__in=content_types))
+    buyers, _ = Group.objects.get_or_create(name=BUYERS)
+    return {VENDORS: vendors, BUYERS: buyers}
+
+
+def create_users(usernames, group_name, batch_size=1000, password=None):
+    """
+    Bulk create users sharing one password hash (pass a precomputed make_password()
+    result to skip hashing) and put them in group_name
+    """
+    password = password or make_password(PASSWORD)
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    User.objects.bulk_create(
+        [User(username=name, email=f'{name}@example.com', password=password)
+         for name in usernames if name not in existing],
+        batch_size=batch_size,
+    )
+    users = list(User.objects.filter(username__in=usernames).order_by('id'))
+    group = ensure_groups()[group_name]
+    Membership = User.groups.through
+    Membership.objects.bulk_create(
+        [Membership(user_id=user.id, group_id=group.id) for user in users],
+        ignore_conflicts=True, batch_size=batch_size,
+    )
+    return users
+
+
+def seed_catalog(vendors=10, stores_per_vendor=2, products_per_store=50, buyers=50,
+                 reviews_per_product=3, seed=1, batch_size=1000, log=print):
+    """
+    Create (or top up) the load test catalog. Users are named lt_vendor_<n> and
+    lt_buyer_<n> with the password PASSWORD, so scenarios can log in as them.
+    """
+    rng = random.Random(seed)
+
+    vendor_users = create_users([vendor_username(i) for i in range(vendors)], VENDORS, batch_size)
+    buyer_users = create_users([buyer_username(i) for i in range(buyers)], BUYERS, batch_size)
+    log(f'{len(vendor_users)} vendors, {len(buyer_users)} buyers')
+
+    with transaction.atomic():
+        stores = Store.objects.bulk_create([
+            Store(vendor=vendor, name=f'{vendor.username} store {i}', description='Load test store')
+            for vendor in vendor_users
+            for i in range(stores_per_vendor)
+        ], batch_size=batch_size)
+    log(f'{len(stores)} stores')
+
+    products = []
+    for store in stores:
+        batch = [
+            Product(
+                store=store,
+                vendor_id=store.vendor_id,
+                name=product_name(rng),
+                description=f'{product_name(rng)} for load testing',
+                price=Decimal(rng.randint(100, 50000)) / 100,
+                stock=rng.randint(50, 5000),
+            )
+            for _ in range(products_per_store)
+        ]
+        with transaction.atomic():
+            products += Product.objects.bulk_create(batch, batch_size=batch_size)
+    log(f'{len(products)} products')
+
+    reviews = []
+    for product in products:
+        for buyer in rng.sample(buyer_users, min(reviews_per_product, len(buyer_users))):
+            reviews.append(Review(product=product, buyer=buyer, rating=rng.randint(1, 5),
+                                  comment=rng.choice(COMMENTS)))
+    with transaction.atomic():
+        Review.objects.bulk_create(reviews, batch_size=batch_size, ignore_conflicts=True)
+
+        # bulk_create skips refresh_rating_stats(), so write the aggregates directly
+        by_product = defaultdict(Counter)
+        for review in reviews:
+            by_product[review.product_id][review.rating] += 1
+        for product in products:
+            product.apply_rating_counts(by_product[product.id])
+        Product.objects.bulk_update(products, RATING_STATS_FIELDS, batch_size=batch_size)
+    log(f'{len(reviews)} reviews')
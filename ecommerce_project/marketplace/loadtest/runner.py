@@ -0,0 +1,124 @@
+# Drives concurrent virtual users through the scenarios and aggregates latencies
+
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict, namedtuple
+
+from django.contrib.auth.models import User
+
+from ..instrumentation import percentile
+from ..models import Store, Product
+from ..roles import VENDORS, BUYERS
+from .client import HttpClient
+from .data import USER_PREFIX
+from .scenarios import SCENARIOS, DEFAULT_MIX
+
+
+Catalog = namedtuple('Catalog', ['vendor_ids', 'store_ids', 'product_ids', 'vendor_usernames', 'buyer_usernames'])
+
+
+def load_catalog(sample_size=5000):
+    """Ids the scenarios pick from, sampled from the database the server uses"""
+    def usernames(group):
+        return list(User.objects.filter(username__startswith=USER_PREFIX, groups__name=group)
+                    .values_list('username', flat=True)[:sample_size])
+
+    vendor_names = usernames(VENDORS)
+    catalog = Catalog(
+        vendor_ids=list(User.objects.filter(username__in=vendor_names).values_list('id', flat=True)),
+        store_ids=list(Store.objects.values_list('id', flat=True).order_by('-id')[:sample_size]),
+        product_ids=list(Product.objects.values_list('id', flat=True).order_by('-id')[:sample_size]),
+        vendor_usernames=vendor_names,
+        buyer_usernames=usernames(BUYERS),
+    )
+    return catalog
+
+
+class Stats:
+    """Latency samples and status counts per request label"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.failures = defaultdict(int)
+
+    def record(self, label, status, seconds):
+        self.latencies[label].append(seconds * 1000)
+        self.statuses[label][status] += 1
+
+    def fail(self, label):
+        self.failures[label] += 1
+
+    def summary(self, duration):
+        rows = {}
+        for label in sorted(set(self.latencies) | set(self.failures)):
+            samples = sorted(self.latencies[label])
+            statuses = self.statuses[label]
+            rows[label] = {
+                'requests': len(samples),
+                'rps': len(samples) / duration if duration else 0,
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+                'client_errors': sum(n for status, n in statuses.items() if 400 <= status < 500),
+                'errors': sum(n for status, n in statuses.items() if status >= 500) + self.failures[label],
+            }
+        return rows
+
+
+class VirtualUser:
+
+    def __init__(self, base_url, stats, rng):
+        self.base_url = base_url
+        self.stats = stats
+        self.rng = rng
+        self.client = HttpClient(base_url)
+
+    async def call(self, label, method, path, **kwargs):
+        """Timed request; returns the Response, or None when the connection failed"""
+        try:
+            response, seconds = await self.client.request(method, path, **kwargs)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            self.stats.fail(label)
+            await self.client.close()
+            return None
+        self.stats.record(label, response.status, seconds)
+        return response
+
+    @staticmethod
+    def json(response):
+        return json.loads(response.body)
+
+    async def new_visit(self):
+        """Forget cookies and the connection, like a new visitor"""
+        await self.client.close()
+        self.client = HttpClient(self.base_url)
+
+
+async def _user_loop(user, catalog, mix, deadline, think_time):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    while time.monotonic() < deadline:
+        scenario = SCENARIOS[user.rng.choices(names, weights)[0]]
+        await scenario(user, catalog)
+        await user.new_visit()
+        if think_time:
+            await asyncio.sleep(user.rng.uniform(0, think_time))
+    await user.client.close()
+
+
+async def _run(base_url, catalog, users, duration, mix, seed, think_time):
+    stats = Stats()
+    deadline = time.monotonic() + duration
+    virtual_users = [VirtualUser(base_url, stats, random.Random(seed + i)) for i in range(users)]
+    started = time.monotonic()
+    await asyncio.gather(*[_user_loop(user, catalog, mix, deadline, think_time) for user in virtual_users])
+    return stats, time.monotonic() - started
+
+
+def run_load(base_url, catalog, users=10, duration=30, mix=None, seed=1, think_time=0):
+    """Run the traffic mix for `duration` seconds; returns ({label: row}, elapsed seconds)"""
+    stats, elapsed = asyncio.run(_run(base_url, catalog, users, duration, mix or DEFAULT_MIX, seed, think_time))
+    return stats.summary(elapsed), elapsed
@@ -0,0 +1,114 @@
+# User flows replayed by the load test, following the sequence diagrams in diagrams/
+#
+# Each scenario is an async function (user, catalog). user.call() times one
+# request under a label; catalog holds ids sampled from the seeded data.
+
+import re
+
+from .data import PASSWORD, ADJECTIVES, NOUNS, COMMENTS, product_name
+
+
+CSRF_INPUT = re.compile(rb'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+async def login(user, username):
+    """Web login form (diagrams: "Vendor Authentication"), keeps the session cookie"""
+    response = await user.call('login form', 'GET', '/login/')
+    match = CSRF_INPUT.search(response.body) if response else None
+    if match is None:
+        return False
+    response = await user.call('login', 'POST', '/login/', data={
+        'csrfmiddlewaretoken': match.group(1).decode(),
+        'username': username,
+        'password': PASSWORD,
+    })
+    return response is not None and response.status == 302
+
+
+async def browse(user, catalog):
+    """buyer_sequence_diagram: vendors -> vendor stores -> store products -> product -> reviews"""
+    rng = user.rng
+    await user.call('home', 'GET', '/')
+    await user.call('vendor-list', 'GET', '/api/vendors/')
+    await user.call('vendor-stores', 'GET', f'/api/vendors/{rng.choice(catalog.vendor_ids)}/stores/')
+    store_id = rng.choice(catalog.store_ids)
+    await user.call('store-detail', 'GET', f'/api/stores/{store_id}/')
+    await user.call('store-products', 'GET', f'/api/stores/{store_id}/products/')
+    product_id = rng.choice(catalog.product_ids)
+    await user.call('product-detail', 'GET', f'/api/products/{product_id}/')
+    await user.call('product-reviews', 'GET', f'/api/products/{product_id}/reviews/')
+    await user.call('product page', 'GET', f'/product/{product_id}/')
+
+
+async def search(user, catalog):
+    """filters_and_search_sequence_diagram: search, filter, order and page through products"""
+    rng = user.rng
+    term = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}'
+    await user.call('product-search', 'GET', '/api/products/search/', params={'q': term})
+    await user.call('product-list ?search', 'GET', '/api/products/', params={'search': rng.choice(NOUNS)})
+    await user.call('product-list ?ordering', 'GET', '/api/products/',
+                    params={'ordering': rng.choice(['price', '-price', 'name', '-created_at'])})
+    await user.call('product-list ?store', 'GET', '/api/products/', params={'store': rng.choice(catalog.store_ids)})
+    await user.call('product-list keyset', 'GET', '/api/products/', params={'paginate': 'keyset'})
+    await user.call('store-list', 'GET', '/api/stores/', params={'page': rng.randint(1, 3)})
+
+
+async def cart_checkout(user, catalog):
+    """Buyer logs in, fills the cart through the API, views it and checks out"""
+    rng = user.rng
+    if not await login(user, rng.choice(catalog.buyer_usernames)):
+        return
+    for product_id in rng.sample(catalog.product_ids, min(3, len(catalog.product_ids))):
+        await user.call('cart add', 'POST', '/api/cart/', json_body={'product': product_id, 'quantity': rng.randint(1, 2)})
+    await user.call('cart page', 'GET', '/cart/')
+    await user.call('checkout', 'POST', '/checkout/')
+
+
+async def review(user, catalog):
+    """buyer_review_sequence_diagram: buyer reads a product and posts a review"""
+    rng = user.rng
+    if not await login(user, rng.choice(catalog.buyer_usernames)):
+        return
+    product_id = rng.choice(catalog.product_ids)
+    await user.call('product-detail', 'GET', f'/api/products/{product_id}/')
+    # 400 when this buyer already reviewed the product - counted, not an error
+    await user.call('review create', 'POST', '/api/reviews/', json_body={
+        'product': product_id, 'rating': rng.randint(1, 5), 'comment': rng.choice(COMMENTS),
+    })
+    await user.call('review-list ?product', 'GET', '/api/reviews/', params={'product': product_id})
+
+
+async def vendor(user, catalog):
+    """vendor_sequence_diagram / vendor_updates_sequence_diagram: create store, add and update products"""
+    rng = user.rng
+    if not await login(user, rng.choice(catalog.vendor_usernames)):
+        return
+    response = await user.call('store create', 'POST', '/api/stores/',
+                               json_body={'name': f'Load test pop-up {rng.randint(0, 10 ** 6)}', 'description': 'Pop-up'})
+    if response is None or response.status != 201:
+        return
+    store_id = user.json(response)['id']
+    product_ids = []
+    for _ in range(2):
+        response = await user.call('product create', 'POST', '/api/products/', json_body={
+            'store': store_id, 'name': product_name(rng), 'description': 'Added by the load test',
+            'price': f'{rng.randint(100, 9999) / 100:.2f}', 'stock': rng.randint(1, 100),
+        })
+        if response is not None and response.status == 201:
+            product_ids.append(user.json(response)['id'])
+    for product_id in product_ids:
+        await user.call('product update', 'PATCH', f'/api/products/{product_id}/',
+                        json_body={'price': f'{rng.randint(100, 9999) / 100:.2f}', 'stock': rng.randint(0, 100)})
+    await user.call('store-products', 'GET', f'/api/stores/{store_id}/products/')
+
+
+SCENARIOS = {
+    'browse': browse,
+    'search': search,
+    'cart_checkout': cart_checkout,
+    'review': review,
+    'vendor': vendor,
+}
+
+# Relative weights: mostly anonymous reads, some buying, a little vendor work
+DEFAULT_MIX = {'browse': 50, 'search': 25, 'cart_checkout': 12, 'review': 8, 'vendor': 5}
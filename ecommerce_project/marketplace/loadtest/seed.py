@@ -0,0 +1,391 @@
+# Large synthetic marketplace for benchmarks: millions of rows bulk inserted by
+# a pool of worker processes
+#
+# Work is cut into fixed-size chunks (a range of users, vendors, orders or
+# products) and each chunk draws from its own random.Random(seed, phase, chunk),
+# so a seed always produces the same rows whatever the number of workers; only
+# auto-increment ids depend on which chunk commits first. Stores and orders get
+# their ids up front instead, since their rows are needed again right after the
+# insert and not every database returns ids from bulk inserts (MySQL doesn't).
+#
+# Popularity is Zipf-like: the product at rank r is picked with weight about
+# 1 / (r + 1) ** skew (skew 0 = uniform). It drives both the products that end
+# up in orders and how many reviews each product gets.
+#
+# Nothing goes through Model.save(), so no post_save signals fire: no tweets,
+# no per-row cache invalidation and no search index updates.
+
+import math
+import multiprocessing
+import os
+import random
+import time
+from array import array
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ..models import Store, Product, Order, OrderItem, Review, RATING_STATS_FIELDS
+from ..purchase_service import backfill_purchases, sync_review_verification
+from ..analytics_service import rebuild_rollups
+from ..roles import VENDORS, BUYERS
+from . import worker
+from .data import (
+    USER_PREFIX, PASSWORD, ADJECTIVES, NOUNS, COMMENTS,
+    vendor_username, buyer_username, product_name, create_users, ensure_groups,
+)
+
+
+# Seeded products carry a SKU with this prefix, ordered by vendor/store/product
+SKU_PREFIX = 'SEED-'
+
+# Fixed chunk sizes keep the output independent of --workers and --batch-size
+USERS_PER_CHUNK = 5000
+VENDORS_PER_CHUNK = 20
+ORDERS_PER_CHUNK = 2000
+BUYERS_PER_CHUNK = 2000
+PRODUCTS_PER_CHUNK = 1000
+
+STORE_SUFFIXES = ['Shop', 'Co.', 'Outlet', 'Market', 'Studio', 'Supply', 'Goods']
+RATINGS = [1, 2, 3, 4, 5]
+RATING_WEIGHTS = [6, 6, 12, 30, 46]  # Skewed positive, like most review sites
+QUANTITIES = [1, 2, 3]
+QUANTITY_WEIGHTS = [80, 15, 5]
+
+Plan = namedtuple('Plan', [
+    'seed', 'now', 'days', 'batch_size',
+    'vendors', 'stores_per_vendor', 'products_per_store', 'buyers',
+    'orders', 'order_size', 'max_order_size', 'reviews_per_product', 'skew',
+])
+
+# Ids and prices handed to the workers when a phase starts (see worker.py)
+_shared = {}
+
+
+# ==================== DISTRIBUTIONS ====================
+
+def _rng(plan, phase, index):
+    return random.Random(f'{plan.seed}:{phase}:{index}')
+
+
+def _cdf(x, n, skew):
+    """Share of the popularity mass below x on the continuous curve x ** -skew over [1, n + 1)"""
+    if skew == 0:
+        return (x - 1) / n
+    if skew == 1:
+        return math.log(x) / math.log(n + 1)
+    a = 1 - skew
+    return (x ** a - 1) / ((n + 1) ** a - 1)
+
+
+def pick_rank(rng, n, skew):
+    """Product rank in [0, n), rank 0 being the most popular"""
+    u = rng.random()
+    if skew == 0:
+        x = 1 + u * n
+    elif skew == 1:
+        x = (n + 1) ** u
+    else:
+        a = 1 - skew
+        x = (((n + 1) ** a - 1) * u + 1) ** (1 / a)
+    return min(int(x) - 1, n - 1)
+
+
+def rank_share(rank, n, skew):
+    """Probability that pick_rank() returns rank"""
+    return _cdf(rank + 2, n, skew) - _cdf(rank + 1, n, skew)
+
+
+def around(rng, mean):
+    """Whole number spread evenly over [mean / 2, 3 * mean / 2]"""
+    return rng.randint(max(1, mean // 2), max(1, mean + mean // 2))
+
+
+def order_size(rng, plan):
+    """Geometric number of lines with mean plan.order_size, capped at plan.max_order_size"""
+    size = 1
+    while size < plan.max_order_size and rng.random() > 1 / plan.order_size:
+        size += 1
+    return size
+
+
+def _past(rng, plan, since=None):
+    """Random moment between `since` (default: plan.days ago) and plan.now"""
+    since = since or plan.now - timedelta(days=plan.days)
+    return since + (plan.now - since) * rng.random()
+
+
+def _cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+@contextmanager
+def backdated(*models):
+    """Let bulk_create keep the created_at values we set instead of auto_now_add"""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+# ==================== CHUNK WORKERS ====================
+# Each runs in a worker process, takes (plan, chunk) and returns the rows it wrote
+
+def create_user_chunk(plan, chunk):
+    group_name, start, end = chunk
+    username = vendor_username if group_name == VENDORS else buyer_username
+    users = create_users([username(i) for i in range(start, end)], group_name,
+                         plan.batch_size, password=_shared['password'])
+    return len(users)
+
+
+def create_catalog_chunk(plan, chunk):
+    """Stores and products of vendors [start, end)"""
+    index, start, end = chunk
+    rng = _rng(plan, 'catalog', index)
+    vendor_ids = _shared['vendor_ids']
+    first_id = _shared['first_store_id'] + start * plan.stores_per_vendor
+
+    stores = []
+    for vendor in range(start, end):
+        for _ in range(plan.stores_per_vendor):
+            stores.append(Store(
+                id=first_id + len(stores),
+                vendor_id=vendor_ids[vendor],
+                name=f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {rng.choice(STORE_SUFFIXES)}',
+                description=' '.join(rng.choices(ADJECTIVES + NOUNS, k=8)),
+                created_at=_past(rng, plan),
+            ))
+
+    with transaction.atomic(), backdated(Store, Product):
+        Store.objects.bulk_create(stores, batch_size=plan.batch_size)
+        products = []
+        for i, store in enumerate(stores):
+            vendor, store_number = start + i // plan.stores_per_vendor, i % plan.stores_per_vendor
+            for number in range(around(rng, plan.products_per_store)):
+                products.append(Product(
+                    store_id=store.id,
+                    vendor_id=store.vendor_id,
+                    sku=f'{SKU_PREFIX}{vendor:07d}-{store_number:03d}-{number:06d}',
+                    name=product_name(rng),
+                    description=' '.join(rng.choices(ADJECTIVES + NOUNS, k=16)),
+                    price=_cents(int(min(rng.lognormvariate(7.5, 1.0), 500000))),
+                    stock=rng.randint(0, 500),
+                    created_at=_past(rng, plan, since=store.created_at),
+                ))
+        Product.objects.bulk_create(products, batch_size=plan.batch_size)
+    return len(stores) + len(products)
+
+
+def create_order_chunk(plan, chunk):
+    """Orders [start, end) with lines picked by product popularity"""
+    index, start, end = chunk
+    rng = _rng(plan, 'orders', index)
+    product_ids, prices, buyer_ids = _shared['product_ids'], _shared['prices'], _shared['buyer_ids']
+    n = len(product_ids)
+
+    orders, lines = [], []
+    for number in range(start, end):
+        size = min(order_size(rng, plan), n)
+        ranks = set()
+        for _attempt in range(size * 20):
+            ranks.add(pick_rank(rng, n, plan.skew))
+            if len(ranks) == size:
+                break
+        items = [
+            OrderItem(product_id=product_ids[rank], price=_cents(prices[rank]),
+                      quantity=rng.choices(QUANTITIES, QUANTITY_WEIGHTS)[0])
+            for rank in sorted(ranks)
+        ]
+        orders.append(Order(
+            id=_shared['first_order_id'] + number,
+            buyer_id=buyer_ids[rng.randrange(len(buyer_ids))],
+            total_price=sum(item.price * item.quantity for item in items),
+            created_at=_past(rng, plan),
+        ))
+        lines.append(items)
+
+    with transaction.atomic(), backdated(Order):
+        Order.objects.bulk_create(orders, batch_size=plan.batch_size)
+        for order, items in zip(orders, lines):
+            for item in items:
+                item.order_id = order.id
+        items = [item for items in lines for item in items]
+        OrderItem.objects.bulk_create(items, batch_size=plan.batch_size)
+    return len(orders) + len(items)
+
+
+def record_purchase_chunk(plan, chunk):
+    """Purchase ledger rows for buyers [start, end)"""
+    _index, start, end = chunk
+    with transaction.atomic():
+        return backfill_purchases(batch_size=plan.batch_size, buyer_ids=list(_shared['buyer_ids'][start:end]))
+
+
+def create_review_chunk(plan, chunk):
+    """Reviews of the products ranked [start, end), plus their rating aggregates"""
+    index, start, end = chunk
+    rng = _rng(plan, 'reviews', index)
+    product_ids, buyer_ids = _shared['product_ids'], _shared['buyer_ids']
+    n = len(product_ids)
+
+    written = 0
+    reviews, stats = [], []
+    with transaction.atomic(), backdated(Review):
+        for rank in range(start, end):
+            expected = plan.reviews_per_product * n * rank_share(rank, n, plan.skew)
+            count = int(expected) + (rng.random() < expected % 1)
+            ratings = []
+            for buyer in rng.sample(range(len(buyer_ids)), min(count, len(buyer_ids))):
+                rating = rng.choices(RATINGS, RATING_WEIGHTS)[0]
+                ratings.append(rating)
+                reviews.append(Review(product_id=product_ids[rank], buyer_id=buyer_ids[buyer], rating=rating,
+                                      comment=rng.choice(COMMENTS), created_at=_past(rng, plan)))
+            product = Product(id=product_ids[rank])
+            product.apply_rating_counts(Counter(ratings))
+            stats.append(product)
+            # The most popular products can have a review from nearly every buyer
+            if len(reviews) >= plan.batch_size * 10:
+                Review.objects.bulk_create(reviews, batch_size=plan.batch_size)
+                written, reviews = written + len(reviews), []
+        Review.objects.bulk_create(reviews, batch_size=plan.batch_size)
+        written += len(reviews)
+
+        # bulk_create skips refresh_rating_stats(), so write the aggregates directly
+        Product.objects.bulk_update(stats, RATING_STATS_FIELDS, batch_size=plan.batch_size)
+        sync_review_verification(Review.objects.filter(product_id__in=product_ids[start:end]))
+    return written
+
+
+# ==================== DRIVER ====================
+
+def _chunks(total, size, label=None):
+    for index, start in enumerate(range(0, total, size)):
+        yield (label if label is not None else index, start, min(start + size, total))
+
+
+@contextmanager
+def _pool(workers, shared):
+    """Yields map(func, chunks), running in `workers` processes when workers > 1"""
+    if workers <= 1:
+        _shared.update(shared)
+        yield map
+        return
+
+    # Workers open their own connections; don't leave ours mid-transaction
+    connections.close_all()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=worker.init, initargs=(shared,))
+    with executor:
+        yield executor.map
+
+
+def _run_phase(label, func, plan, chunks, workers, shared, log):
+    started = time.perf_counter()
+    rows = 0
+    with _pool(workers, shared) as run:
+        for written in run(partial(func, plan), chunks):
+            rows += written
+    log(f'{label}: {rows} rows in {time.perf_counter() - started:.1f}s')
+    return rows
+
+
+def _user_ids(prefix, count):
+    """User ids of <prefix><i> for i in range(count), indexed by i"""
+    ids = array('q', bytes(8 * count))
+    for username, user_id in User.objects.filter(username__startswith=prefix).values_list('username', 'id').iterator():
+        number = username[len(prefix):]
+        if number.isdigit() and int(number) < count:
+            ids[int(number)] = user_id
+    return ids
+
+
+def _products_by_popularity(plan):
+    """(ids, prices in cents) of the seeded products, most popular first"""
+    products = list(Product.objects.filter(sku__startswith=SKU_PREFIX).order_by('sku')
+                    .values_list('id', 'price').iterator(chunk_size=10000))
+    _rng(plan, 'popularity', 0).shuffle(products)
+    return array('q', (pk for pk, _ in products)), array('q', (int(price * 100) for _, price in products))
+
+
+def _first_free_id(model):
+    return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+
+def _reset_sequences(*models):
+    """Move PostgreSQL sequences past the ids assigned up front (auto-increment columns follow on their own)"""
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+
+def is_seeded():
+    return Product.objects.filter(sku__startswith=SKU_PREFIX).exists()
+
+
+def seed_marketplace(plan, workers=1, log=print):
+    """Generate the whole marketplace described by plan; returns {phase: rows}"""
+    ensure_groups()
+    shared = {'password': make_password(PASSWORD)}
+    rows = {}
+
+    chunks = list(_chunks(plan.vendors, USERS_PER_CHUNK, VENDORS)) + list(_chunks(plan.buyers, USERS_PER_CHUNK, BUYERS))
+    rows['users'] = _run_phase('users', create_user_chunk, plan, chunks, workers, shared, log)
+    shared['vendor_ids'] = _user_ids(f'{USER_PREFIX}vendor_', plan.vendors)
+    shared['buyer_ids'] = _user_ids(f'{USER_PREFIX}buyer_', plan.buyers)
+
+    shared['first_store_id'] = _first_free_id(Store)
+    rows['catalog'] = _run_phase('stores and products', create_catalog_chunk, plan,
+                                 _chunks(plan.vendors, VENDORS_PER_CHUNK), workers, shared, log)
+    shared['product_ids'], shared['prices'] = _products_by_popularity(plan)
+    n = len(shared['product_ids'])
+
+    shared['first_order_id'] = _first_free_id(Order)
+    rows['orders'] = _run_phase('orders and items', create_order_chunk, plan,
+                                _chunks(plan.orders, ORDERS_PER_CHUNK), workers, shared, log)
+    _reset_sequences(Store, Order)
+    rows['purchases'] = _run_phase('purchase ledger', record_purchase_chunk, plan,
+                                   _chunks(plan.buyers, BUYERS_PER_CHUNK), workers, shared, log)
+    rows['reviews'] = _run_phase('reviews', create_review_chunk, plan,
+                                 _chunks(n, PRODUCTS_PER_CHUNK), workers, shared, log)
+
+    # Orders were bulk inserted, not checked out, so build the sales rollups from them
+    started = time.perf_counter()
+    rows['rollups'] = rebuild_rollups(batch_size=plan.batch_size, log=lambda message: None)
+    log(f"sales rollups: {rows['rollups']} rows in {time.perf_counter() - started:.1f}s")
+    return rows
+
+
+def default_workers():
+    """SQLite allows one writer at a time, so only parallelize real servers"""
+    if connection.vendor == 'sqlite':
+        return 1
+    return min(os.cpu_count() or 1, 8)
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def new_plan(seed=1, now=None, days=365, batch_size=2000, **sizes):
+    """
+    now is the newest created_at; dates are spread over the days before it.
+    It defaults to the start of today, so reruns on one day write the same
+    rows - pass the same now to reproduce them on another day.
+    """
+    now = now or start_of_day(timezone.localdate())
+    return Plan(seed=seed, now=now, days=days, batch_size=batch_size, **sizes)
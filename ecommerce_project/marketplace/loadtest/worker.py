@@ -0,0 +1,13 @@
+# Process pool entry point for seed.py
+#
+# Worker processes are spawned, not forked, so they start without Django set
+# up. This module imports no models, which lets the pool load it first; init()
+# then sets Django up before any seed.py task is unpickled.
+
+import django
+
+
+def init(shared):
+    django.setup()
+    from . import seed
+    seed._shared.update(shared)
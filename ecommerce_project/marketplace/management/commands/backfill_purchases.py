@@ -0,0 +1,31 @@
+"""
+Fill the (buyer, product) purchase ledger from existing orders and resync Review.verified
+Safe to re-run: pairs already in the ledger are skipped.
+Run with: python manage.py backfill_purchases
+"""
+from django.core.management.base import BaseCommand
+
+from marketplace.purchase_service import backfill_purchases, sync_review_verification
+from marketplace.cache_service import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Build the purchase ledger from order history and recompute verified review flags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of ledger rows inserted per query')
+        parser.add_argument('--skip-reviews', action='store_true',
+                            help="Don't touch Review.verified")
+
+    def handle(self, *args, **options):
+        pairs = backfill_purchases(batch_size=options['batch_size'])
+        self.stdout.write(f'Recorded {pairs} (buyer, product) purchase pairs')
+
+        if not options['skip_reviews']:
+            verified, unverified = sync_review_verification()
+            # Bulk UPDATEs send no signals, so flush cached catalog pages explicitly
+            invalidate_catalog()
+            self.stdout.write(f'Marked {verified} reviews verified and {unverified} unverified')
+
+        self.stdout.write(self.style.SUCCESS('Purchase ledger is up to date'))
@@ -0,0 +1,101 @@
+"""
+Checkout throughput benchmark
+Hammers place_order() from many threads against a single hot product
+and verifies that stock is never oversold.
+Run with: python manage.py bench_checkout --threads 16 --attempts 50
+"""
+import threading
+import time
+
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, OperationalError
+
+from marketplace.models import Store, Product, Order, OrderItem, OutboxMessage
+from marketplace.checkout_service import place_order, CheckoutError
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent checkouts against one product and assert there is no oversell'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=25,
+                            help='Checkout attempts per thread')
+        parser.add_argument('--stock', type=int, default=100,
+                            help='Initial stock of the hot product')
+        parser.add_argument('--quantity', type=int, default=1,
+                            help='Units bought per checkout')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        attempts = options['attempts']
+        quantity = options['quantity']
+        initial_stock = options['stock']
+
+        vendor = User.objects.create_user(username=f'bench_vendor_{int(time.time())}')
+        store = Store.objects.create(vendor=vendor, name='Checkout Benchmark Store')
+        product = Product.objects.create(
+            store=store, name='Hot SKU', description='Benchmark product',
+            price='9.99', stock=initial_stock
+        )
+        buyers_group, _ = Group.objects.get_or_create(name='Buyers')
+        buyers = []
+        for i in range(threads):
+            buyer = User.objects.create_user(username=f'{vendor.username}_buyer_{i}')
+            buyer.groups.add(buyers_group)
+            buyers.append(buyer)
+
+        results = {'orders': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+        cart = {str(product.id): quantity}
+
+        def worker(buyer):
+            try:
+                for _ in range(attempts):
+                    try:
+                        place_order(buyer, cart)
+                        outcome = 'orders'
+                    except CheckoutError:
+                        outcome = 'rejected'
+                    except OperationalError:
+                        # e.g. "database is locked" on SQLite under heavy contention
+                        outcome = 'errors'
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(buyer,)) for buyer in buyers]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).values_list('quantity', flat=True)
+        units_sold = sum(sold)
+        total_attempts = threads * attempts
+
+        self.stdout.write(f'Attempts:        {total_attempts} ({threads} threads)')
+        self.stdout.write(f'Orders placed:   {results["orders"]}')
+        self.stdout.write(f'Out of stock:    {results["rejected"]}')
+        self.stdout.write(f'DB errors:       {results["errors"]}')
+        self.stdout.write(f'Elapsed:         {elapsed:.2f}s')
+        self.stdout.write(f'Throughput:      {total_attempts / elapsed:.1f} checkouts/s')
+        self.stdout.write(f'Stock remaining: {product.stock} (started at {initial_stock})')
+
+        oversold = units_sold > initial_stock or product.stock != initial_stock - units_sold
+
+        # Clean up benchmark data (cascades to store, product, orders)
+        order_ids = list(Order.objects.filter(buyer__in=buyers).values_list('id', flat=True))
+        OutboxMessage.objects.filter(kind=OutboxMessage.KIND_INVOICE_EMAIL, payload__order_id__in=order_ids).delete()
+        OutboxMessage.objects.filter(kind=OutboxMessage.KIND_STORE_TWEET, payload__store_id=store.id).delete()
+        OutboxMessage.objects.filter(kind=OutboxMessage.KIND_PRODUCT_TWEET, payload__product_id=product.id).delete()
+        User.objects.filter(id__in=[vendor.id] + [b.id for b in buyers]).delete()
+
+        if oversold:
+            raise CommandError(f'Oversold: {units_sold} units sold from a stock of {initial_stock}')
+        self.stdout.write(self.style.SUCCESS('No oversell detected'))
@@ -0,0 +1,91 @@
+"""
+Deep paging benchmark: OFFSET page numbers vs keyset cursors
+Times fetching one page at increasing depths of the product table.
+Run with: python manage.py bench_pagination --rows 200000
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from marketplace.models import Store, Product
+
+
+BENCH_VENDOR = 'bench_pagination_vendor'
+BENCH_STORE = 'Pagination Benchmark Store'
+
+
+class Command(BaseCommand):
+    help = 'Compare OFFSET and keyset pagination latency at increasing page depths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000,
+                            help='Make sure at least this many products exist')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the products this command seeded')
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        store = self.seed(options['rows'])
+        total = Product.objects.count()
+        ordered = Product.objects.order_by('-created_at', '-id')
+
+        self.stdout.write(f'{total} products, page size {page_size}')
+        self.stdout.write(f"{'depth (rows)':>14} {'offset ms':>12} {'keyset ms':>12}")
+
+        depth = page_size
+        while depth < total:
+            # Keyset cursor = the last row of the previous page (looked up untimed)
+            created_at, pk = ordered.values_list('created_at', 'id')[depth - 1]
+
+            def offset_page():
+                Product.objects.count()  # PageNumberPagination counts on every page
+                list(ordered[depth:depth + page_size])
+
+            def keyset_page():
+                list(ordered.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                )[:page_size + 1])
+
+            self.stdout.write(
+                f'{depth:>14} {self.time(offset_page, options["repeat"]):>12.2f} '
+                f'{self.time(keyset_page, options["repeat"]):>12.2f}'
+            )
+            depth *= 10
+
+        if options['cleanup'] and store is not None:
+            store.vendor.delete()
+
+    def time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def seed(self, target):
+        missing = target - Product.objects.count()
+        if missing <= 0:
+            return None
+        self.stdout.write(f'Seeding {missing} products...')
+        vendor, _ = User.objects.get_or_create(username=BENCH_VENDOR)
+        if not Store.objects.filter(vendor=vendor, name=BENCH_STORE).exists():
+            # bulk_create skips post_save, so no store tweet is queued
+            Store.objects.bulk_create([Store(vendor=vendor, name=BENCH_STORE)])
+        store = Store.objects.get(vendor=vendor, name=BENCH_STORE)
+        batch_size = 5000
+        for start in range(0, missing, batch_size):
+            # bulk_create skips post_save, so no tweets are queued
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(store=store, vendor_id=store.vendor_id, name=f'Bench product {start + i}',
+                            description='Pagination benchmark', price=1, stock=1)
+                    for i in range(min(batch_size, missing - start))
+                ])
+        return store
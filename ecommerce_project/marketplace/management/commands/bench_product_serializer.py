@@ -0,0 +1,117 @@
+"""
+Product detail serialization benchmark: compact reviews link vs the full review link list
+Seeds one benchmark product with --reviews reviews, then times what an
+uncached GET /api/products/<id>/ does: load, serialize, pickle into the
+response cache and render JSON.
+Run with: python manage.py bench_product_serializer --reviews 10000
+"""
+import pickle
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from marketplace.models import Store, Product, Review
+from marketplace.serializers import ProductSerializer
+
+
+BENCH_VENDOR = 'bench_serializer_vendor'
+BENCH_STORE = 'Serializer Benchmark Store'
+BENCH_SKU = 'BENCH-SERIALIZER'
+BENCH_BUYER_PREFIX = 'bench_serializer_buyer_'
+
+
+class HyperlinkedReviewsSerializer(ProductSerializer):
+    """The previous default: a HyperlinkedRelatedField over every review"""
+    reviews = serializers.HyperlinkedRelatedField(many=True, read_only=True, view_name='review-detail')
+
+
+class Command(BaseCommand):
+    help = 'Compare product detail serialization with and without the full review link list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reviews', type=int, default=10000, help='Reviews on the benchmark product')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the benchmark product, store and buyers afterwards')
+
+    def handle(self, *args, **options):
+        product = self.seed(options['reviews'])
+        # Allows the request factory's 'testserver' host in the absolute links
+        setup_test_environment()
+        try:
+            self.run(product, options)
+        finally:
+            teardown_test_environment()
+
+        if options['cleanup']:
+            User.objects.filter(username__startswith=BENCH_BUYER_PREFIX).delete()
+            product.store.vendor.delete()
+
+    def run(self, product, options):
+        request = APIRequestFactory().get(f'/api/products/{product.pk}/')
+        products = Product.objects.select_related('store__vendor')
+
+        cases = [
+            ('HyperlinkedRelatedField (old default)', HyperlinkedReviewsSerializer, ('reviews',)),
+            ('id links (?expand=reviews)', ProductSerializer, ('reviews',)),
+            ('count + link (default)', ProductSerializer, ()),
+        ]
+        self.stdout.write(f'Product {product.pk} with {product.reviews.count()} reviews, '
+                          f'median of {options["repeat"]} runs')
+        self.stdout.write(f"{'representation':<40} {'ms':>10} {'bytes':>10}")
+        for label, serializer_class, expand in cases:
+            def render():
+                instance = products.get(pk=product.pk)
+                data = serializer_class(instance, context={'request': request, 'expand': expand}).data
+                pickle.dumps(data)
+                return JSONRenderer().render(data)
+
+            size = len(render())
+            self.stdout.write(f'{label:<40} {self.time(render, options["repeat"]):>10.2f} {size:>10}')
+
+    def seed(self, target):
+        vendor, _ = User.objects.get_or_create(username=BENCH_VENDOR)
+        # bulk_create skips post_save, so no store/product tweets are queued
+        if not Store.objects.filter(vendor=vendor, name=BENCH_STORE).exists():
+            Store.objects.bulk_create([Store(vendor=vendor, name=BENCH_STORE)])
+        store = Store.objects.get(vendor=vendor, name=BENCH_STORE)
+        if not Product.objects.filter(store=store, sku=BENCH_SKU).exists():
+            Product.objects.bulk_create([Product(
+                store=store, vendor_id=store.vendor_id, sku=BENCH_SKU, name='Serializer benchmark product',
+                description='Serializer benchmark', price=1, stock=1,
+            )])
+        product = Product.objects.get(store=store, sku=BENCH_SKU)
+        missing = target - product.reviews.count()
+        if missing <= 0:
+            return product
+
+        self.stdout.write(f'Seeding {missing} reviews...')
+        batch_size = 5000
+        for start in range(0, missing, batch_size):
+            # bulk_create skips post_save, so no tweets are queued and no stats refresh per row
+            with transaction.atomic():
+                buyers = User.objects.bulk_create([
+                    User(username=f'{BENCH_BUYER_PREFIX}{product.pk}_{target - missing + start + i}')
+                    for i in range(min(batch_size, missing - start))
+                ])
+                Review.objects.bulk_create([
+                    Review(product=product, buyer=buyer, rating=1 + index % 5, comment='Serializer benchmark')
+                    for index, buyer in enumerate(buyers)
+                ])
+        product.refresh_rating_stats()
+        return product
+
+    def time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,115 @@
+"""
+Search latency benchmark: full-text index vs the old SearchFilter LIKE scans
+Seeds a benchmark store up to --products rows, then times both paths.
+Run with: python manage.py bench_search --products 100000
+"""
+import random
+import statistics
+import time
+from functools import reduce
+from operator import and_, or_
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from marketplace.models import Store, Product
+from marketplace.search_service import get_search_backend, search_products
+
+
+WORDS = [
+    'wireless', 'leather', 'organic', 'vintage', 'cotton', 'ceramic', 'bamboo', 'steel',
+    'handmade', 'portable', 'classic', 'premium', 'compact', 'rechargeable', 'waterproof',
+    'lamp', 'chair', 'mug', 'headphones', 'backpack', 'jacket', 'speaker', 'blanket',
+    'notebook', 'bottle', 'watch', 'sneakers', 'kettle', 'candle', 'wallet', 'charger',
+]
+
+BENCH_VENDOR = 'bench_search_vendor'
+BENCH_STORE = 'Search Benchmark Store'
+
+
+class Command(BaseCommand):
+    help = 'Compare product search latency between the full-text index and LIKE filtering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=30)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the benchmark store and products afterwards')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        store = self.seed(options['products'], rng)
+        queries = [' '.join(rng.sample(WORDS, rng.choice([1, 2]))) for _ in range(options['queries'])]
+
+        # Build the in-memory index (if used) before timing, like a warm server would
+        get_search_backend().search_products('warmup', 1)
+
+        like_times = [self.time_like(query) for query in queries]
+        index_times = [self.time_index(query) for query in queries]
+
+        self.stdout.write(f'Products: {Product.objects.count()}, queries: {len(queries)}')
+        self.report('SearchFilter (LIKE)', like_times)
+        self.report(f'Full-text ({type(get_search_backend()).__name__})', index_times)
+
+        if options['cleanup']:
+            store.vendor.delete()
+            get_search_backend().reset()
+
+    def seed(self, target, rng):
+        vendor, _ = User.objects.get_or_create(username=BENCH_VENDOR)
+        if not Store.objects.filter(vendor=vendor, name=BENCH_STORE).exists():
+            # bulk_create skips post_save, so no store tweet is queued
+            Store.objects.bulk_create([Store(vendor=vendor, name=BENCH_STORE)])
+        store = Store.objects.get(vendor=vendor, name=BENCH_STORE)
+        existing = store.products.count()
+        missing = max(target - existing, 0)
+        self.stdout.write(f'Seeding {missing} products...')
+        batch_size = 5000
+        for start in range(0, missing, batch_size):
+            # bulk_create skips post_save, so no tweets are queued
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        store=store,
+                        vendor_id=store.vendor_id,
+                        name=' '.join(rng.sample(WORDS, 3)).title(),
+                        description=' '.join(rng.choices(WORDS, k=20)),
+                        price=rng.randint(100, 100000) / 100,
+                        stock=rng.randint(0, 500)
+                    )
+                    for _ in range(min(batch_size, missing - start))
+                ])
+        if missing:
+            get_search_backend().reset()
+        return store
+
+    def time_like(self, query):
+        """Same query SearchFilter builds: every term must match one of the search_fields"""
+        fields = ['name', 'description', 'store__name']
+        condition = reduce(and_, [
+            reduce(or_, [Q(**{f'{field}__icontains': term}) for field in fields])
+            for term in query.split()
+        ])
+        started = time.perf_counter()
+        queryset = Product.objects.filter(condition).select_related('store__vendor').order_by('-created_at')
+        queryset.count()
+        list(queryset[:10])
+        return time.perf_counter() - started
+
+    def time_index(self, query):
+        started = time.perf_counter()
+        ranked_ids = search_products(query)
+        page_ids = ranked_ids[:10]
+        list(Product.objects.select_related('store__vendor').in_bulk(page_ids).values())
+        return time.perf_counter() - started
+
+    def report(self, label, times):
+        times = sorted(t * 1000 for t in times)
+        p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+        self.stdout.write(
+            f'{label:<40} mean {statistics.mean(times):8.2f} ms   '
+            f'p50 {statistics.median(times):8.2f} ms   p95 {p95:8.2f} ms'
+        )
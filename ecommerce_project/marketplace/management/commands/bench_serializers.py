@@ -0,0 +1,84 @@
+"""
+List serialization benchmark: DRF serializers vs the .values() row serializers
+For each hot list serializer and page size, times fetching a page and
+rendering it to JSON both ways, checks the JSON is byte-identical and reports
+rows per second. Needs existing data (e.g. python manage.py seed_marketplace).
+Run with: python manage.py bench_serializers --page-sizes 10,100,1000
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from marketplace.models import Store, Product, Review
+from marketplace.row_serializers import PRODUCT_LIST_ROWS, STORE_LIST_ROWS, REVIEW_ROWS
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/second of the DRF list serializers and their .values() row serializers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-sizes', default='10,100,1000', help='Comma separated page sizes')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            page_sizes = [int(size) for size in options['page_sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--page-sizes must be comma separated integers')
+
+        # Allows the request factory's 'testserver' host in the absolute image links
+        setup_test_environment()
+        try:
+            self.run(page_sizes, options['repeat'])
+        finally:
+            teardown_test_environment()
+
+    def run(self, page_sizes, repeat):
+        # Same querysets as the list endpoints
+        cases = [
+            ('ProductListSerializer', PRODUCT_LIST_ROWS,
+             Product.objects.select_related('store__vendor').order_by('-created_at')),
+            ('StoreListSerializer', STORE_LIST_ROWS,
+             Store.objects.select_related('vendor').with_product_stats().order_by('-created_at')),
+            ('ReviewSerializer', REVIEW_ROWS,
+             Review.objects.select_related('product', 'buyer').order_by('-created_at')),
+        ]
+        context = {'request': APIRequestFactory().get('/api/')}
+
+        self.stdout.write(f"{'serializer':<24} {'page':>6} {'DRF rows/s':>12} {'rows rows/s':>12} {'speedup':>8}")
+        for label, rows, queryset in cases:
+            total = queryset.count()
+            for page_size in page_sizes:
+                def drf():
+                    page = list(queryset[:page_size])
+                    data = rows.serializer_class(page, many=True, context=context).data
+                    return JSONRenderer().render(data)
+
+                def fast():
+                    page = list(rows.values(queryset)[:page_size])
+                    return JSONRenderer().render(rows.serialize(page, context))
+
+                drf_json, fast_json = drf(), fast()
+                if drf_json != fast_json:
+                    raise CommandError(f'{label}: the row serializer output differs at page size {page_size}')
+                count = min(page_size, total)
+                if not count:
+                    self.stdout.write(f'{label:<24} {page_size:>6} {"no rows":>12}')
+                    continue
+
+                drf_rate = count / self.time(drf, repeat)
+                fast_rate = count / self.time(fast, repeat)
+                self.stdout.write(f'{label:<24} {page_size:>6} {drf_rate:>12.0f} {fast_rate:>12.0f} '
+                                  f'{fast_rate / drf_rate:>7.1f}x')
+
+    def time(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return statistics.median(timings)
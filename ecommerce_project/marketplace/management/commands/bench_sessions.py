@@ -0,0 +1,112 @@
+"""
+Session load test: session table queries per request for each session engine
+Replays the same browse/cart traffic for a logged-in buyer under the db,
+cached_db and signed_cookies engines (see SESSION_STORAGE in settings) and
+counts the queries that hit django_session. The bench buyer, its cart lines
+and its sessions are deleted afterwards.
+Run with: python manage.py bench_sessions --requests 200
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User, Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+)
+from django.urls import reverse
+
+from marketplace.models import Product
+from marketplace.roles import BUYERS
+
+
+BENCH_BUYER = 'bench_sessions_buyer'
+BENCH_PASSWORD = 'bench-sessions-password'
+
+
+class Command(BaseCommand):
+    help = 'Compare django_session reads/writes per request across session engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests replayed per engine')
+        parser.add_argument('--engines', default='db,cached_db,signed_cookies',
+                            help='Comma separated SESSION_STORAGE names')
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+
+        products = list(Product.objects.values_list('id', flat=True)[:20])
+        if not products:
+            raise CommandError('Create some products first')
+        buyer = self.buyer()
+
+        # The traffic mix: mostly reads, a few cart writes
+        urls = [reverse('marketplace:home'), reverse('marketplace:view_cart'), '/api/products/']
+        urls += [reverse('marketplace:product_detail', args=[product_id]) for product_id in products[:5]]
+
+        engines = options['engines'].split(',')
+        unknown = [name for name in engines if name not in settings.SESSION_ENGINES]
+        if unknown:
+            raise CommandError(f'Unknown engine {unknown[0]}; choose from {", ".join(settings.SESSION_ENGINES)}')
+
+        self.stdout.write(f"{'engine':>16} {'session reads':>14} {'session writes':>15} "
+                          f"{'queries/req':>12} {'median ms':>10}")
+        # Allows the test client's 'testserver' host and keeps outgoing email in memory
+        setup_test_environment()
+        try:
+            for name in engines:
+                with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[name]):
+                    self.run_engine(name, buyer, urls, products, options['requests'])
+        finally:
+            teardown_test_environment()
+            # Clean up benchmark data (cascades to the buyer's cart)
+            buyer.delete()
+
+    def request(self, client, method, url):
+        """Fail the run on any error response rather than counting it"""
+        response = getattr(client, method)(url)
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {url} returned {response.status_code}')
+        return response
+
+    def run_engine(self, name, buyer, urls, products, total_requests):
+        client = Client()
+        if not client.login(username=buyer.username, password=BENCH_PASSWORD):
+            raise CommandError(f'Could not log in as {buyer.username}')
+        self.request(client, 'get', urls[0])  # Warm up roles and caches
+
+        reads = writes = queries = 0
+        timings = []
+        for i in range(total_requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                if i % 10 == 9:
+                    product_id = products[i % len(products)]
+                    self.request(client, 'post', reverse('marketplace:add_to_cart', args=[product_id]))
+                else:
+                    self.request(client, 'get', urls[i % len(urls)])
+                timings.append((time.perf_counter() - started) * 1000)
+
+            queries += len(captured)
+            for query in captured:
+                sql = query['sql']
+                if 'django_session' in sql:
+                    if sql.lstrip().upper().startswith('SELECT'):
+                        reads += 1
+                    else:
+                        writes += 1
+
+        self.stdout.write(f'{name:>16} {reads:>14} {writes:>15} '
+                          f'{queries / total_requests:>12.2f} {statistics.median(timings):>10.2f}')
+        client.logout()
+
+    def buyer(self):
+        buyer, created = User.objects.get_or_create(username=BENCH_BUYER)
+        if created:
+            buyer.set_password(BENCH_PASSWORD)
+            buyer.save()
+            buyer.groups.add(Group.objects.get_or_create(name=BUYERS)[0])
+        return buyer
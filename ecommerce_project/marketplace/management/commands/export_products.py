@@ -0,0 +1,31 @@
+"""
+Export a store's catalog as CSV or JSONL
+Run with: python manage.py export_products <store id> --output catalog.csv
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.models import Store
+from marketplace.catalog_service import export_products
+
+
+class Command(BaseCommand):
+    help = "Stream a store's products to a CSV or JSONL file (or stdout)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('store_id', type=int)
+        parser.add_argument('--type', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--output', help='File to write (defaults to stdout)')
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(id=options['store_id'])
+        except Store.DoesNotExist:
+            raise CommandError(f"Store {options['store_id']} does not exist")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(export_products(store, options['type']))
+        else:
+            sys.stdout.writelines(export_products(store, options['type']))
@@ -0,0 +1,40 @@
+"""
+Bulk import products into a store from a CSV or JSONL file
+Run with: python manage.py import_products <store id> catalog.csv
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.models import Store
+from marketplace.catalog_service import import_products, detect_format, ImportFormatError
+
+
+class Command(BaseCommand):
+    help = 'Upsert products into a store from a CSV or JSONL file (sku, name, description, price, stock)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('store_id', type=int)
+        parser.add_argument('path')
+        parser.add_argument('--type', choices=['csv', 'jsonl'],
+                            help='File format (defaults to the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows validated and written per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            store = Store.objects.get(id=options['store_id'])
+        except Store.DoesNotExist:
+            raise CommandError(f"Store {options['store_id']} does not exist")
+
+        try:
+            file_format = detect_format(options['path'], options['type'])
+        except ImportFormatError as e:
+            raise CommandError(str(e))
+
+        with open(options['path'], encoding='utf-8', newline='') as catalog:
+            result = import_products(store, catalog, file_format, chunk_size=options['chunk_size'])
+
+        self.stdout.write(f'Created {result.created}, updated {result.updated}, invalid {result.invalid}')
+        for error in result.errors:
+            self.stderr.write(json.dumps(error))
@@ -0,0 +1,118 @@
+"""
+Load test: replay mixed buyer/vendor traffic against a running server
+Start the server on the same database first (e.g. python manage.py runserver --noreload),
+seed the synthetic catalog once with --setup, then compare runs with --save/--baseline.
+Run with: python manage.py loadtest --setup --url http://127.0.0.1:8000 --users 20 --duration 60
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.cache_service import invalidate_catalog
+from marketplace.loadtest.data import seed_catalog
+from marketplace.loadtest.runner import load_catalog, run_load
+from marketplace.loadtest.scenarios import SCENARIOS, DEFAULT_MIX
+
+
+class Command(BaseCommand):
+    help = 'Replay browse/search/cart/checkout/review/vendor flows and report p50/p95/p99 per endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to load')
+        parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Max random pause between scenarios, in seconds')
+        parser.add_argument('--mix', default='',
+                            help='Scenario weights, e.g. browse=50,search=25,cart_checkout=12,review=8,vendor=5')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for data and traffic')
+
+        setup = parser.add_argument_group('synthetic data')
+        setup.add_argument('--setup', action='store_true', help='Seed the synthetic catalog before running')
+        setup.add_argument('--vendors', type=int, default=10)
+        setup.add_argument('--stores-per-vendor', type=int, default=2)
+        setup.add_argument('--products-per-store', type=int, default=50)
+        setup.add_argument('--buyers', type=int, default=50)
+        setup.add_argument('--reviews-per-product', type=int, default=3)
+
+        report = parser.add_argument_group('regression checks')
+        report.add_argument('--save', help='Write the results as JSON to this file')
+        report.add_argument('--baseline', help='Compare against a JSON file written by --save')
+        report.add_argument('--max-regression', type=float, default=20,
+                            help='Fail when an endpoint p95 is this many percent slower than the baseline')
+        report.add_argument('--max-error-rate', type=float, default=1,
+                            help='Fail when more than this percent of requests error (5xx/connection)')
+
+    def handle(self, *args, **options):
+        if options['setup']:
+            seed_catalog(
+                vendors=options['vendors'],
+                stores_per_vendor=options['stores_per_vendor'],
+                products_per_store=options['products_per_store'],
+                buyers=options['buyers'],
+                reviews_per_product=options['reviews_per_product'],
+                seed=options['seed'],
+                log=self.stdout.write,
+            )
+            # Bulk inserts send no signals; restart the server if it keeps an in-process search index
+            invalidate_catalog()
+
+        catalog = load_catalog()
+        if not (catalog.product_ids and catalog.buyer_usernames and catalog.vendor_usernames):
+            raise CommandError('No load test data found - run with --setup first')
+
+        mix = self.parse_mix(options['mix'])
+        self.stdout.write(f"{options['users']} users for {options['duration']:g}s against {options['url']}")
+        rows, elapsed = run_load(options['url'], catalog, users=options['users'], duration=options['duration'],
+                                 mix=mix, seed=options['seed'], think_time=options['think_time'])
+        self.print_report(rows, elapsed)
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'elapsed': elapsed, 'endpoints': rows}, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}")
+
+        problems = self.regressions(rows, options)
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if problems:
+            raise CommandError(f'{len(problems)} regression check(s) failed')
+
+    def parse_mix(self, value):
+        if not value:
+            return DEFAULT_MIX
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            if name not in SCENARIOS:
+                raise CommandError(f'Unknown scenario {name}; choose from {", ".join(SCENARIOS)}')
+            mix[name] = float(weight or 1)
+        return mix
+
+    def print_report(self, rows, elapsed):
+        total = sum(row['requests'] for row in rows.values())
+        self.stdout.write(f"\n{'endpoint':<26} {'reqs':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'4xx':>5} {'err':>5}")
+        for label, row in rows.items():
+            self.stdout.write(
+                f"{label:<26} {row['requests']:>7} {row['rps']:>8.1f} {row['p50']:>9.1f} {row['p95']:>9.1f} "
+                f"{row['p99']:>9.1f} {row['client_errors']:>5} {row['errors']:>5}"
+            )
+        self.stdout.write(f'\n{total} requests in {elapsed:.1f}s = {total / elapsed:.1f} req/s')
+
+    def regressions(self, rows, options):
+        problems = []
+        total = sum(row['requests'] for row in rows.values())
+        errors = sum(row['errors'] for row in rows.values())
+        if total and errors * 100 / total > options['max_error_rate']:
+            problems.append(f'{errors} of {total} requests failed')
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)['endpoints']
+            limit = 1 + options['max_regression'] / 100
+            for label, row in rows.items():
+                before = baseline.get(label)
+                if before and before['p95'] and row['p95'] > before['p95'] * limit:
+                    problems.append(f"{label}: p95 {row['p95']:.1f}ms vs baseline {before['p95']:.1f}ms")
+        return problems
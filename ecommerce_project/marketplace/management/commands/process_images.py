@@ -0,0 +1,53 @@
+"""
+Backfill thumbnails/WebP variants for existing product images and store logos
+Run with: python manage.py process_images --workers 4
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from marketplace.models import Product, Store
+from marketplace.image_processing import generate_variants
+from marketplace.image_service import IMAGE_FIELDS, get_sizes, needs_processing, save_variants
+
+
+class Command(BaseCommand):
+    help = 'Generate missing image variants in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'IMAGE_PROCESSING_WORKERS', 2))
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate variants even if they already exist')
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+        sizes = get_sizes()
+        processed = failed = 0
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {}
+            for model in (Product, Store):
+                image_field, variants_field = IMAGE_FIELDS[model]
+                rows = (model.objects.exclude(**{image_field: ''}).exclude(**{f'{image_field}__isnull': True})
+                        .only('id', image_field, variants_field))
+                for instance in rows.iterator(chunk_size=500):
+                    if not options['force'] and not needs_processing(instance):
+                        continue
+                    source_name = getattr(instance, image_field).name
+                    future = pool.submit(generate_variants, media_root, source_name, sizes)
+                    futures[future] = (model, instance.pk, source_name)
+
+            for future in as_completed(futures):
+                model, pk, source_name = futures[future]
+                try:
+                    variants = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'{source_name}: {e}')
+                    continue
+                save_variants(model, pk, source_name, variants)
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images ({failed} failed)'))
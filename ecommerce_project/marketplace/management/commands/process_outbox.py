@@ -0,0 +1,35 @@
+"""
+Outbox worker - delivers queued tweets and invoice emails
+Run once:        python manage.py process_outbox
+Run as a worker: python manage.py process_outbox --loop
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace.notification_service import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending outbound notifications in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep polling for new messages instead of exiting')
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to sleep between polls when the outbox is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            results = process_outbox(batch_size=options['batch_size'])
+            handled = sum(results.values())
+            if handled:
+                self.stdout.write(
+                    f"Sent {results['sent']}, retrying {results['retried']}, failed {results['failed']}"
+                )
+            if not options['loop']:
+                break
+            # Drain full batches straight away, only sleep when there's nothing left
+            if handled < options['batch_size']:
+                time.sleep(options['interval'])
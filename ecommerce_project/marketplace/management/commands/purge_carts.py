@@ -0,0 +1,23 @@
+"""
+Delete abandoned anonymous carts
+An anonymous cart is only reachable through its cookie, which expires
+CART_COOKIE_AGE after the cart was created; carts merged at login are deleted
+then already. Schedule this daily (e.g. from cron).
+Run with: python manage.py purge_carts
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from marketplace.cart_service import purge_expired_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete anonymous carts whose cookie has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Carts deleted per transaction')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        deleted = purge_expired_carts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired anonymous carts'))
@@ -0,0 +1,54 @@
+"""
+Rebuild the denormalized review aggregates stored on Product
+Run with: python manage.py rebuild_rating_stats
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from marketplace.models import Product, Review, RATING_STATS_FIELDS
+from marketplace.cache_service import invalidate_catalog
+
+
+class Command(BaseCommand):
+    help = 'Recalculate reviews_count, rating_sum, average_rating and rating_histogram for every product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of products updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        products = Product.objects.only('id', *RATING_STATS_FIELDS).order_by('id')
+
+        batch = []
+        updated = 0
+        for product in products.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                updated += self._flush(batch)
+                batch = []
+        if batch:
+            updated += self._flush(batch)
+
+        # bulk_update sends no signals, so flush cached catalog pages explicitly
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating stats for {updated} products'))
+
+    def _flush(self, batch):
+        # One GROUP BY (product, rating) query per batch gives counts, sums and histograms
+        counts = defaultdict(dict)
+        rows = (
+            Review.objects.filter(product_id__in=[product.id for product in batch])
+            .order_by().values_list('product_id', 'rating').annotate(Count('id'))
+        )
+        for product_id, rating, number in rows:
+            counts[product_id][rating] = number
+        for product in batch:
+            product.apply_rating_counts(counts[product.id])
+
+        with transaction.atomic():
+            Product.objects.bulk_update(batch, RATING_STATS_FIELDS)
+        return len(batch)
@@ -0,0 +1,44 @@
+"""
+Rebuild the daily sales rollups (ProductDailySales / StoreDailySales / VendorDailySales) from order history
+Checkout keeps the rollups current; run this after importing or editing orders
+directly, or when backfilling. Best run while checkout is quiet.
+Run with: python manage.py rebuild_sales_rollups --since 2024-01-01
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from marketplace.analytics_service import rebuild_rollups
+
+
+def date_argument(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-product, per-store and per-vendor daily sales rollups from orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date_argument, help='First day to rebuild (default: first order)')
+        parser.add_argument('--until', type=date_argument, help='Last day to rebuild (default: last order)')
+        parser.add_argument('--days-per-batch', type=int, default=31,
+                            help='Days recomputed per transaction')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rollup rows inserted per query')
+
+    def handle(self, *args, **options):
+        if options['since'] and options['until'] and options['since'] > options['until']:
+            raise CommandError('--since must not be after --until')
+        if options['days_per_batch'] < 1:
+            raise CommandError('--days-per-batch must be at least 1')
+
+        written = rebuild_rollups(
+            since=options['since'],
+            until=options['until'],
+            days_per_batch=options['days_per_batch'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows'))
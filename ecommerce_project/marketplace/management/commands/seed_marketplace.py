@@ -0,0 +1,102 @@
+"""
+Seed a large synthetic marketplace for benchmarks
+Bulk inserts vendors, buyers, stores, products, orders, the purchase ledger and
+reviews from a pool of worker processes. Popularity follows a Zipf-like curve
+(--skew) and the same --seed and --now always produce the same data. No post_save
+signals fire, so nothing is tweeted; restart running servers afterwards so the
+SQLite search index is rebuilt.
+Users are lt_vendor_<n>/lt_buyer_<n> with the load test password, so
+python manage.py loadtest can replay traffic against the result.
+Run with: python manage.py seed_marketplace --vendors 1000 --buyers 200000 --orders 1000000
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from marketplace.cache_service import invalidate_catalog
+from marketplace.loadtest.seed import new_plan, seed_marketplace, is_seeded, default_workers, start_of_day
+
+
+def moment_argument(value):
+    """YYYY-MM-DD (start of that day) or an ISO datetime, in the current time zone unless it has an offset"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(value)
+        return start_of_day(day)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+class Command(BaseCommand):
+    help = 'Generate millions of stores, products, orders and reviews with realistic distributions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+        parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count, 1 on SQLite)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT')
+        parser.add_argument('--days', type=int, default=365, help='Spread created_at over this many days')
+        parser.add_argument('--now', type=moment_argument,
+                            help='Newest created_at, YYYY-MM-DD or ISO datetime (default: start of today)')
+
+        sizes = parser.add_argument_group('sizes')
+        sizes.add_argument('--vendors', type=int, default=1000)
+        sizes.add_argument('--stores-per-vendor', type=int, default=3)
+        sizes.add_argument('--products-per-store', type=int, default=300,
+                           help='Mean; each store gets between half and 1.5x this many')
+        sizes.add_argument('--buyers', type=int, default=200000)
+        sizes.add_argument('--orders', type=int, default=1000000)
+
+        distributions = parser.add_argument_group('distributions')
+        distributions.add_argument('--skew', type=float, default=1.0,
+                                   help='Zipf exponent of product popularity; 0 = uniform')
+        distributions.add_argument('--reviews-per-product', type=float, default=5,
+                                   help='Mean reviews per product, handed out by popularity')
+        distributions.add_argument('--order-size', type=float, default=2.5,
+                                   help='Mean lines per order (geometric distribution)')
+        distributions.add_argument('--max-order-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if options['vendors'] < 1 or options['buyers'] < 1:
+            raise CommandError('Need at least one vendor and one buyer')
+        if options['order_size'] < 1 or options['skew'] < 0:
+            raise CommandError('--order-size must be at least 1 and --skew not negative')
+        if options['max_order_size'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--max-order-size and --batch-size must be at least 1')
+        if is_seeded():
+            raise CommandError('This database already has seeded products; '
+                               'start from an empty database (python manage.py flush)')
+        workers = options['workers'] or default_workers()
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                'SQLite allows a single writer; without OPTIONS transaction_mode IMMEDIATE '
+                'workers may hit "database is locked"'
+            ))
+
+        plan = new_plan(
+            seed=options['seed'],
+            now=options['now'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            vendors=options['vendors'],
+            stores_per_vendor=options['stores_per_vendor'],
+            products_per_store=options['products_per_store'],
+            buyers=options['buyers'],
+            orders=options['orders'],
+            order_size=options['order_size'],
+            max_order_size=options['max_order_size'],
+            reviews_per_product=options['reviews_per_product'],
+            skew=options['skew'],
+        )
+        self.stdout.write(f'Seeding with {workers} worker(s)')
+        started = time.perf_counter()
+        rows = seed_marketplace(plan, workers=workers, log=self.stdout.write)
+
+        # Bulk writes send no signals, so flush cached catalog pages explicitly
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {sum(rows.values())} rows in {time.perf_counter() - started:.0f}s'
+        ))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_rating_stats(apps, schema_editor):
+    Product = apps.get_model('marketplace', 'Product')
+    products = Product.objects.annotate(stat_count=Count('reviews'), stat_sum=Sum('reviews__rating'))
+    for product in products.iterator():
+        if not product.stat_count:
+            continue
+        product.reviews_count = product.stat_count
+        product.rating_sum = product.stat_sum
+        product.average_rating = (Decimal(product.stat_sum) / product.stat_count).quantize(Decimal('0.01'))
+        product.save(update_fields=['reviews_count', 'rating_sum', 'average_rating'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0002_product_image_store_logo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='average_rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# FULLTEXT indexes used by marketplace.search_service on MariaDB/MySQL.
+# Other databases use the in-process search index, so nothing is created there.
+
+from django.db import migrations
+
+
+FULLTEXT_INDEXES = [
+    ('marketplace_product', 'marketplace_product_name_desc_ft', 'name, description'),
+    ('marketplace_store', 'marketplace_store_name_desc_ft', 'name, description'),
+]
+
+
+def create_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, index_name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'CREATE FULLTEXT INDEX {index_name} ON {table} ({columns})')
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    for table, index_name, columns in FULLTEXT_INDEXES:
+        schema_editor.execute(f'DROP INDEX {index_name} ON {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0004_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_indexes, drop_fulltext_indexes),
+    ]
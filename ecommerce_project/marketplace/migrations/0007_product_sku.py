@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0006_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('store_tweet', 'New store tweet'), ('product_tweet', 'New product tweet'), ('invoice_email', 'Order invoice email'), ('catalog_import_tweet', 'Catalog import tweet')], max_length=32),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('store', 'sku'), name='unique_store_sku'),
+        ),
+    ]
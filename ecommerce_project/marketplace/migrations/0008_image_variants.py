@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_product_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='store',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
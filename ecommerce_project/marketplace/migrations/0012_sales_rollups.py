@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0011_cart'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoreDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('orders', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='productdailysales',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='marketplace.product'),
+        ),
+        migrations.AddField(
+            model_name='productdailysales',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='product_daily_sales', to='marketplace.store'),
+        ),
+        migrations.AddField(
+            model_name='storedailysales',
+            name='store',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='marketplace.store'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailysales',
+            index=models.Index(fields=['store', 'date'], name='productsales_store_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productdailysales',
+            index=models.Index(fields=['date'], name='productsales_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='productdailysales',
+            constraint=models.UniqueConstraint(fields=('product', 'date'), name='unique_product_daily_sales'),
+        ),
+        migrations.AddIndex(
+            model_name='storedailysales',
+            index=models.Index(fields=['date'], name='storesales_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='storedailysales',
+            constraint=models.UniqueConstraint(fields=('store', 'date'), name='unique_store_daily_sales'),
+        ),
+    ]
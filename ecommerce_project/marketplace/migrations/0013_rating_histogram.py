@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:26
+
+from itertools import groupby
+
+import marketplace.models
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_rating_histograms(apps, schema_editor):
+    Product = apps.get_model('marketplace', 'Product')
+    Review = apps.get_model('marketplace', 'Review')
+    rows = Review.objects.order_by('product_id').values_list('product_id', 'rating').annotate(number=Count('id'))
+    batch = []
+    for product_id, group in groupby(rows.iterator(), key=lambda row: row[0]):
+        counts = {rating: number for _, rating, number in group}
+        batch.append(Product(id=product_id, rating_histogram={str(stars): counts.get(stars, 0) for stars in range(1, 6)}))
+        if len(batch) >= 1000:
+            Product.objects.bulk_update(batch, ['rating_histogram'])
+            batch = []
+    Product.objects.bulk_update(batch, ['rating_histogram'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0012_sales_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=marketplace.models.empty_rating_histogram),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'verified', 'rating', '-created_at'], name='review_product_filter_idx'),
+        ),
+        migrations.RunPython(populate_rating_histograms, migrations.RunPython.noop),
+    ]
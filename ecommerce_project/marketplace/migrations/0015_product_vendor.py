@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_store_vendors(apps, schema_editor):
+    Product = apps.get_model('marketplace', 'Product')
+    Store = apps.get_model('marketplace', 'Store')
+    Product.objects.update(vendor=Subquery(Store.objects.filter(pk=OuterRef('store_id')).values('vendor_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0014_vendor_sales_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='vendor',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(copy_store_vendors, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='vendor',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['vendor', '-created_at'], name='product_vendor_created_idx'),
+        ),
+    ]
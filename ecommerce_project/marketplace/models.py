@@ -1,44 +1,177 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.utils import timezone
 
 
+def calculate_average_rating(rating_sum, reviews_count):
+    """Average rating rounded to 2 decimals, or None when there are no reviews"""
+    if not reviews_count:
+        return None
+    return (Decimal(rating_sum) / reviews_count).quantize(Decimal('0.01'))
+
+
+RATINGS = range(1, 6)
+
+# Product columns written by refresh_rating_stats() / apply_rating_counts()
+RATING_STATS_FIELDS = ['reviews_count', 'rating_sum', 'average_rating', 'rating_histogram']
+
+
+def empty_rating_histogram():
+    return {str(stars): 0 for stars in RATINGS}
+
+
+class StoreQuerySet(models.QuerySet):
+    def with_product_stats(self):
+        """
+        Annotate product count, price range and total stock in the same query.
+        Correlated subqueries over the product store index rather than a join
+        + GROUP BY, so the stores can still be read and sorted by an index.
+        """
+        products = Product.objects.filter(store=OuterRef('pk')).order_by().values('store')
+
+        def aggregate(expression):
+            return Subquery(products.annotate(value=expression).values('value'))
+
+        return self.annotate(
+            products_count=Coalesce(aggregate(Count('id')), Value(0), output_field=IntegerField()),
+            min_price=aggregate(Min('price')),
+            max_price=aggregate(Max('price')),
+            total_stock=Coalesce(aggregate(Sum('stock')), Value(0), output_field=IntegerField()),
+        )
+
+
+PRODUCT_STATS_FIELDS = ('products_count', 'min_price', 'max_price', 'total_stock')
+
+
 class Store(models.Model):
     """Stores created by vendors"""
     vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stores')
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     logo = models.ImageField(upload_to='store_logos/', blank=True, null=True)
+    logo_variants = models.JSONField(default=dict, blank=True)  # Resized copies, see image_service
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = StoreQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.name} (by {self.vendor.username})"
 
+    def product_stats(self):
+        """
+        Product count, price range and total stock as a dict, taken from the
+        with_product_stats() annotations when present, otherwise one aggregate
+        """
+        if not hasattr(self, 'products_count'):
+            stats = self.products.aggregate(
+                products_count=Count('id'),
+                min_price=Min('price'),
+                max_price=Max('price'),
+                total_stock=Coalesce(Sum('stock'), Value(0)),
+            )
+            for field in PRODUCT_STATS_FIELDS:
+                setattr(self, field, stats[field])
+        return {field: getattr(self, field) for field in PRODUCT_STATS_FIELDS}
+
     class Meta:
         permissions = [
             ("manage_store", "Can manage stores"),
         ]
+        indexes = [
+            # Keyset pagination order, see marketplace.pagination
+            models.Index(fields=['-created_at', '-id'], name='store_created_id_idx'),
+            # Hot API filter/order paths, see the explain_endpoints command
+            models.Index(fields=['vendor', '-created_at'], name='store_vendor_created_idx'),
+            models.Index(fields=['name'], name='store_name_idx'),
+        ]
 
 
 class Product(models.Model):
     """Products in stores"""
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='products')
+    # Copy of store.vendor (set by save(); bulk writers set it themselves), so a
+    # vendor's products are listed from one index, see sync_product_vendor in signals.py
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', editable=False)
     name = models.CharField(max_length=200)
+    sku = models.CharField(max_length=64, blank=True, null=True)  # Vendor's own code, used by bulk imports
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)  # Resized copies, see image_service
+    # Denormalized review aggregates, kept in sync by refresh_rating_stats() (see signals.py)
+    reviews_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
+    rating_histogram = models.JSONField(default=empty_rating_histogram, blank=True)  # {"1": reviews, ..., "5": reviews}
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.name} - ${self.price}"
 
+    def save(self, *args, **kwargs):
+        self.vendor_id = self.store.vendor_id
+        super().save(*args, **kwargs)
+
+    def apply_rating_counts(self, counts):
+        """Set the review aggregates from {rating: number of reviews} (not saved)"""
+        self.rating_histogram = {str(stars): counts.get(stars, 0) for stars in RATINGS}
+        self.reviews_count = sum(counts.values())
+        self.rating_sum = sum(stars * number for stars, number in counts.items())
+        self.average_rating = calculate_average_rating(self.rating_sum, self.reviews_count)
+
+    def refresh_rating_stats(self):
+        """
+        Recalculate the stored review aggregates with a single query. The
+        product row is locked first, so concurrent refreshes take turns and
+        the last one counts every committed review. Returns False if the
+        product no longer exists.
+        """
+        with transaction.atomic():
+            if not Product.objects.select_for_update().filter(pk=self.pk).exists():
+                return False
+            self.apply_rating_counts(dict(self.reviews.order_by().values_list('rating').annotate(Count('id'))))
+            # update() instead of save() so updated_at and post_save signals are untouched
+            Product.objects.filter(pk=self.pk).update(**{field: getattr(self, field) for field in RATING_STATS_FIELDS})
+        return True
+
+    def count_reviews(self, verified=None, rating=None):
+        """Number of reviews matching the filters from the stored aggregates, or None if they can't tell"""
+        if verified is not None:
+            return None
+        if rating is not None:
+            return self.rating_histogram.get(str(rating), 0)
+        return self.reviews_count
+
+    def rating_breakdown(self):
+        """(stars, reviews, percent) from 5 stars down to 1, for histogram bars"""
+        return [
+            (stars, self.rating_histogram.get(str(stars), 0),
+             round(100 * self.rating_histogram.get(str(stars), 0) / self.reviews_count) if self.reviews_count else 0)
+            for stars in reversed(RATINGS)
+        ]
+
     class Meta:
         permissions = [
             ("manage_products", "Can manage products"),
         ]
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            models.Index(fields=['store', '-created_at'], name='product_store_created_idx'),
+            models.Index(fields=['vendor', '-created_at'], name='product_vendor_created_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+            models.Index(fields=['stock'], name='product_stock_idx'),
+            models.Index(fields=['name'], name='product_name_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'sku'], name='unique_store_sku'),
+        ]
 
 
 class Order(models.Model):
@@ -50,6 +183,13 @@ class Order(models.Model):
     def __str__(self):
         return f"Order #{self.id} by {self.buyer.username}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', '-created_at'], name='order_buyer_created_idx'),
+            # Date range scans when sales rollups are rebuilt
+            models.Index(fields=['created_at'], name='order_created_idx'),
+        ]
+
 
 class OrderItem(models.Model):
     """Items in an order"""
@@ -61,6 +201,137 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.quantity}x {self.product.name}"
 
+    class Meta:
+        indexes = [
+            # Vendor sales find the orders of the vendor's products from the product side.
+            # The (buyer, product) purchase check is Purchase's unique constraint instead.
+            models.Index(fields=['product', 'order'], name='orderitem_product_order_idx'),
+        ]
+
+
+class Purchase(models.Model):
+    """
+    Ledger of every (buyer, product) pair that has been bought, written at
+    checkout so purchase checks are one unique-index lookup instead of an
+    orders/items join. Rebuild from orders with backfill_purchases.
+    """
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='purchases')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='purchases')
+    first_purchased_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.buyer.username} bought {self.product.name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['buyer', 'product'], name='unique_buyer_product_purchase'),
+        ]
+
+
+class ProductDailySales(models.Model):
+    """
+    Units, revenue and orders of one product on one day, incremented at
+    checkout (see analytics_service) so sales reports never scan order
+    history. Rebuild from orders with rebuild_sales_rollups.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='product_daily_sales')  # Product's store, for vendor-wide reads
+    date = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_product_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['store', 'date'], name='productsales_store_date_idx'),
+            models.Index(fields=['date'], name='productsales_date_idx'),
+        ]
+
+
+class StoreDailySales(models.Model):
+    """Units, revenue and orders of one store on one day; maintained like ProductDailySales"""
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['store', 'date'], name='unique_store_daily_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='storesales_date_idx'),
+        ]
+
+
+class VendorDailySales(models.Model):
+    """
+    Units, revenue and orders of all of a vendor's stores on one day; maintained
+    like ProductDailySales. An order that bought from two of the vendor's
+    stores counts once here, and once in each StoreDailySales row.
+    """
+    vendor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendor', 'date'], name='unique_vendor_daily_sales'),
+        ]
+
+
+class Cart(models.Model):
+    """
+    Shopping cart of a logged-in user, or of an anonymous visitor identified
+    by the cart cookie token. Anonymous carts are merged on login.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='cart')
+    token = models.CharField(max_length=64, unique=True, null=True, blank=True)  # Anonymous carts only
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        owner = self.user.username if self.user_id else 'anonymous'
+        return f"Cart #{self.id} ({owner})"
+
+
+class CartItem(models.Model):
+    """One product line in a cart, upserted in place on every cart change"""
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product.name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+
+class ReviewQuerySet(models.QuerySet):
+    def filter_page(self, verified=None, rating=None):
+        """
+        Narrow a product's reviews by verified flag and/or star rating in the
+        shape review_product_filter_idx (product, verified, rating, -created_at) serves
+        """
+        if verified is None and rating is None:
+            return self
+        if verified is None:
+            # Both verified values, so rating still matches an index prefix
+            return self.filter(verified__in=[False, True], rating=rating)
+        if rating is None:
+            return self.filter(verified=verified)
+        return self.filter(verified=verified, rating=rating)
+
 
 class Review(models.Model):
     """Product reviews by buyers"""
@@ -71,12 +342,23 @@ class Review(models.Model):
     verified = models.BooleanField(default=False)  # True if buyer purchased this product
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ReviewQuerySet.as_manager()
+
     def __str__(self):
         verified_text = "Verified" if self.verified else "Unverified"
         return f"{verified_text} Review by {self.buyer.username} - {self.rating} stars"
 
     class Meta:
         unique_together = ('product', 'buyer')  # One review per buyer per product
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='review_created_id_idx'),
+            models.Index(fields=['product', '-created_at'], name='review_product_created_idx'),
+            models.Index(fields=['buyer', '-created_at'], name='review_buyer_created_idx'),
+            models.Index(fields=['rating', '-created_at'], name='review_rating_created_idx'),
+            models.Index(fields=['verified', '-created_at'], name='review_verified_created_idx'),
+            # Verified-only / by-rating review pages of one product
+            models.Index(fields=['product', 'verified', 'rating', '-created_at'], name='review_product_filter_idx'),
+        ]
 
 
 class ResetToken(models.Model):
@@ -92,3 +374,43 @@ class ResetToken(models.Model):
     def __str__(self):
         return f"ResetToken for {self.user.username}"
 
+
+
+class OutboxMessage(models.Model):
+    """Outbound notifications (tweets, emails) waiting to be delivered by the outbox worker"""
+    KIND_STORE_TWEET = 'store_tweet'
+    KIND_PRODUCT_TWEET = 'product_tweet'
+    KIND_INVOICE_EMAIL = 'invoice_email'
+    KIND_CATALOG_IMPORT_TWEET = 'catalog_import_tweet'
+    KIND_CHOICES = [
+        (KIND_STORE_TWEET, 'New store tweet'),
+        (KIND_PRODUCT_TWEET, 'New product tweet'),
+        (KIND_INVOICE_EMAIL, 'Order invoice email'),
+        (KIND_CATALOG_IMPORT_TWEET, 'Catalog import tweet'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=32, choices=KIND_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
@@ -0,0 +1,207 @@
+# Outbox for outbound notifications (tweets and invoice emails)
+#
+# Request handlers only insert an OutboxMessage row, inside the same transaction
+# as the store/product/order it describes. The process_outbox worker delivers
+# committed messages in batches, retrying failures with exponential backoff.
+# A batch is claimed by leasing its rows (pushing next_attempt_at past the
+# delivery time), so no transaction or row lock is held while the network
+# calls run; rows of a worker that dies mid-batch become due again when the
+# lease runs out.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Store, Product, Order, OutboxMessage
+
+
+class DeliveryError(Exception):
+    """Raised by a transport when a message should be retried later"""
+
+
+# ==================== QUEUEING ====================
+
+def queue_store_tweet(store):
+    return OutboxMessage.objects.create(
+        kind=OutboxMessage.KIND_STORE_TWEET,
+        payload={'store_id': store.id}
+    )
+
+
+def queue_product_tweet(product):
+    return OutboxMessage.objects.create(
+        kind=OutboxMessage.KIND_PRODUCT_TWEET,
+        payload={'product_id': product.id}
+    )
+
+
+def queue_invoice_email(order):
+    return OutboxMessage.objects.create(
+        kind=OutboxMessage.KIND_INVOICE_EMAIL,
+        payload={'order_id': order.id}
+    )
+
+
+def queue_catalog_import_tweet(store, product_count):
+    """One tweet for a whole bulk import instead of one per product"""
+    return OutboxMessage.objects.create(
+        kind=OutboxMessage.KIND_CATALOG_IMPORT_TWEET,
+        payload={'store_id': store.id, 'product_count': product_count}
+    )
+
+
+def build_invoice_email(order):
+    """Build the invoice email for an order"""
+    items_text = "\n".join([
+        f"{item.quantity}x {item.product.name} - ${item.price} = ${item.quantity * item.price}"
+        for item in order.items.select_related('product')
+    ])
+    
+    body = f"""
+    Order Invoice #{ order.id}
+    
+    Items:
+    {items_text}
+    
+    Total: ${order.total_price}
+    
+    Thank you for your purchase!
+    """
+    
+    return EmailMessage(
+        subject=f'Order Invoice #{order.id}',
+        body=body,
+        from_email='noreply@marketplace.com',
+        to=[order.buyer.email]
+    )
+
+
+# ==================== TRANSPORTS ====================
+
+class LiveTransport:
+    """Sends tweets through TwitterService and emails through the configured EMAIL_BACKEND"""
+
+    def deliver(self, message):
+        handler = getattr(self, f'deliver_{message.kind}')
+        handler(message.payload)
+
+    def deliver_store_tweet(self, payload):
+        from .twitter_service import twitter_service
+        store = Store.objects.filter(id=payload['store_id']).first()
+        # Deleted stores and unconfigured credentials are not worth retrying
+        if store is None or twitter_service.oauth is None:
+            return
+        if not twitter_service.tweet_new_store(store):
+            raise DeliveryError(f'Tweet for store {store.id} failed')
+
+    def deliver_product_tweet(self, payload):
+        from .twitter_service import twitter_service
+        product = Product.objects.select_related('store').filter(id=payload['product_id']).first()
+        if product is None or twitter_service.oauth is None:
+            return
+        if not twitter_service.tweet_new_product(product):
+            raise DeliveryError(f'Tweet for product {product.id} failed')
+
+    def deliver_catalog_import_tweet(self, payload):
+        from .twitter_service import twitter_service
+        store = Store.objects.filter(id=payload['store_id']).first()
+        if store is None or twitter_service.oauth is None:
+            return
+        if not twitter_service.tweet_catalog_import(store, payload['product_count']):
+            raise DeliveryError(f'Catalog import tweet for store {store.id} failed')
+
+    def deliver_invoice_email(self, payload):
+        order = Order.objects.select_related('buyer').filter(id=payload['order_id']).first()
+        if order is None:
+            return
+        build_invoice_email(order).send()
+
+
+class StubTransport:
+    """Records messages instead of sending them - use in tests and local development"""
+
+    def __init__(self):
+        self.sent = []
+
+    def deliver(self, message):
+        self.sent.append((message.kind, message.payload))
+
+
+def get_transport():
+    transport_path = getattr(settings, 'NOTIFICATION_TRANSPORT',
+                             'marketplace.notification_service.LiveTransport')
+    return import_string(transport_path)()
+
+
+# ==================== WORKER ====================
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base... capped at one hour"""
+    base = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 30)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 3600))
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to batch_size due messages to this worker in one short transaction.
+    Returns the messages and the lease expiry, which identifies this claim.
+    """
+    lease = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', 300))
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(
+            status=OutboxMessage.STATUS_PENDING,
+            next_attempt_at__lte=timezone.now()
+        ).order_by('next_attempt_at', 'id')
+        # Let several workers run side by side without picking up the same rows
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        batch = list(due[:batch_size])
+
+        leased_until = timezone.now() + lease
+        for message in batch:
+            # Counted up front, so a message that keeps killing the worker still gives up
+            message.attempts += 1
+            message.next_attempt_at = leased_until
+        OutboxMessage.objects.bulk_update(batch, ['attempts', 'next_attempt_at'])
+
+    return batch, leased_until
+
+
+def record_result(message, leased_until, **fields):
+    """Store one delivery result, unless the lease ran out and another worker claimed the message"""
+    return OutboxMessage.objects.filter(
+        pk=message.pk, next_attempt_at=leased_until
+    ).update(**fields)
+
+
+def process_outbox(batch_size=100, transport=None):
+    """
+    Deliver one batch of due messages.
+    Returns a dict with the number of messages sent, rescheduled and failed.
+    """
+    transport = transport or get_transport()
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    results = {'sent': 0, 'retried': 0, 'failed': 0}
+
+    batch, leased_until = claim_batch(batch_size)
+    for message in batch:
+        try:
+            transport.deliver(message)
+        except Exception as e:
+            if message.attempts >= max_attempts:
+                record_result(message, leased_until, status=OutboxMessage.STATUS_FAILED, last_error=str(e))
+                results['failed'] += 1
+            else:
+                record_result(message, leased_until, last_error=str(e),
+                              next_attempt_at=timezone.now() + retry_delay(message.attempts))
+                results['retried'] += 1
+        else:
+            record_result(message, leased_until, status=OutboxMessage.STATUS_SENT,
+                          sent_at=timezone.now(), last_error='')
+            results['sent'] += 1
+
+    return results
@@ -0,0 +1,99 @@
+# Order history for buyers and sales for vendors
+#
+# The API pages load orders with their items and each item's product in two
+# prefetch queries, whatever the number of lines. Exports walk the orders in id
+# order one chunk at a time (keyset, not OFFSET) and fetch the chunk's items
+# with a second query, so memory stays flat for buyers and vendors with tens of
+# thousands of orders - even on MySQL, whose driver buffers whole result sets.
+
+import csv
+import json
+from decimal import Decimal
+from itertools import groupby
+
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem
+from .catalog_service import Echo
+
+
+EXPORT_FIELDS = ['order_id', 'created_at', 'buyer', 'product_id', 'product_name', 'quantity', 'price']
+
+
+def buyer_orders(buyer):
+    return Order.objects.filter(buyer=buyer)
+
+
+def vendor_sales(vendor):
+    """Orders with at least one of the vendor's products (a semi-join, no DISTINCT)"""
+    return Order.objects.filter(
+        id__in=OrderItem.objects.filter(product__store__vendor=vendor).values('order_id')
+    )
+
+
+def order_items(vendor=None):
+    """Order lines with their product; only the vendor's own lines when a vendor is given"""
+    items = OrderItem.objects.select_related('product').order_by('id')
+    if vendor is not None:
+        items = items.filter(product__store__vendor=vendor)
+    return items
+
+
+def with_items(orders, vendor=None):
+    return orders.select_related('buyer').prefetch_related(Prefetch('items', queryset=order_items(vendor)))
+
+
+def _order_chunks(orders, chunk_size):
+    """Lists of (id, created_at, buyer username), walking the ids upwards"""
+    last_id = 0
+    while True:
+        chunk = list(
+            orders.filter(id__gt=last_id).order_by('id')
+            .values_list('id', 'created_at', 'buyer__username')[:chunk_size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1][0]
+
+
+def export_rows(orders, vendor=None, chunk_size=1000):
+    """Yield (order id, created_at, buyer, [(product id, product name, quantity, price), ...])"""
+    for chunk in _order_chunks(orders, chunk_size):
+        lines = (
+            order_items(vendor).filter(order_id__in=[order[0] for order in chunk])
+            .order_by('order_id', 'id')
+            .values_list('order_id', 'product_id', 'product__name', 'quantity', 'price')
+        )
+        lines_by_order = {
+            order_id: [line[1:] for line in group]
+            for order_id, group in groupby(lines, key=lambda line: line[0])
+        }
+        for order_id, created_at, buyer in chunk:
+            yield order_id, created_at, buyer, lines_by_order.get(order_id, [])
+
+
+def export_orders(orders, file_format, vendor=None, chunk_size=1000):
+    """
+    Yield orders as CSV (one row per line) or JSONL (one order per line, with
+    its items). Vendors only see their own lines and totals.
+    """
+    rows = export_rows(orders, vendor, chunk_size)
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for order_id, created_at, buyer, lines in rows:
+            for line in lines:
+                yield writer.writerow((order_id, created_at.isoformat(), buyer) + line)
+    else:
+        for order_id, created_at, buyer, lines in rows:
+            yield json.dumps({
+                'id': order_id,
+                'created_at': created_at.isoformat(),
+                'buyer': buyer,
+                'total': str(sum((price * quantity for _, _, quantity, price in lines), Decimal('0.00'))),
+                'items': [
+                    {'product_id': product_id, 'product_name': name, 'quantity': quantity, 'price': str(price)}
+                    for product_id, name, quantity, price in lines
+                ],
+            }) + '\n'
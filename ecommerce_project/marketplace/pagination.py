@@ -0,0 +1,164 @@
+# API pagination
+#
+# CatalogPagination keeps the existing page-number behaviour by default and
+# switches to keyset (cursor) pagination when a client asks for it with
+# ?paginate=keyset or follows a keyset ?cursor= link.
+
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination ordered on (-created_at, -id).
+    Each page is one indexed range query - no COUNT(*) and no OFFSET scan - so
+    page 10,000 costs the same as page 1. The cursor is an opaque token holding
+    the (created_at, id) of the row the page starts after.
+    The order is fixed, so a request that also asks for ?ordering= is a 400.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering_message = 'Keyset pages are ordered newest first; use page numbers for ?ordering='
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if api_settings.ORDERING_PARAM in request.query_params:
+            raise ValidationError({api_settings.ORDERING_PARAM: [self.ordering_message]})
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+
+        # "created_at <= c AND (created_at < c OR id < pk)": the first term gives
+        # the optimizer a plain range scan on the (created_at, id) index
+        if cursor is None:
+            reverse = False
+            rows = queryset.order_by('-created_at', '-id')
+        else:
+            created_at, pk, reverse = cursor
+            if reverse:
+                # Walking backwards: rows after the cursor in ascending order
+                rows = queryset.filter(created_at__gte=created_at).filter(
+                    Q(created_at__gt=created_at) | Q(id__gt=pk)
+                ).order_by('created_at', 'id')
+            else:
+                rows = queryset.filter(created_at__lte=created_at).filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk)
+                ).order_by('-created_at', '-id')
+
+        results = list(rows[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        if reverse:
+            self.has_next = cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        return self.build_link(last, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Past the end: step back to the newest rows instead
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        first = self.page[0]
+        return self.build_link(first, reverse=True)
+
+    def build_link(self, row, reverse):
+        if isinstance(row, dict):
+            created_at, pk = row['created_at'], row['id']  # .values() rows
+        else:
+            created_at, pk = row.created_at, row.pk
+        token = json.dumps([created_at.isoformat(), pk, reverse]).encode()
+        cursor = base64.urlsafe_b64encode(token).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            created_at, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            created_at = parse_datetime(created_at)
+            if created_at is None:
+                raise ValueError(encoded)
+            return created_at, int(pk), bool(reverse)
+        except (TypeError, ValueError):
+            raise ValidationError({self.cursor_query_param: [self.invalid_cursor_message]})
+
+
+class CatalogPagination(BasePagination):
+    """
+    Page-number pagination by default; keyset pagination on request.
+    - /api/products/?page=3            -> page numbers (with count)
+    - /api/products/?paginate=keyset   -> first keyset page, then follow ?cursor= links
+    """
+    mode_query_param = 'paginate'
+    keyset_mode = 'keyset'
+
+    def __init__(self):
+        self.delegate = None
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == self.keyset_mode or
+                KeysetPagination.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_keyset(request):
+            self.delegate = KeysetPagination()
+        else:
+            self.delegate = PageNumberPagination()
+        return self.delegate.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        return PageNumberPagination().get_paginated_response_schema(schema)
+
+    def to_html(self):
+        return self.delegate.to_html() if self.delegate else ''
+
+    def get_results(self, data):
+        return data['results']
+
+    @property
+    def display_page_controls(self):
+        return isinstance(self.delegate, PageNumberPagination) and self.delegate.display_page_controls
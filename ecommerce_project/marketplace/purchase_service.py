@@ -0,0 +1,70 @@
+# Purchase ledger: who bought what, for verified-purchase checks and review badges
+
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef
+
+from .models import Purchase, Review, OrderItem
+
+
+def record_purchases(buyer, product_ids, purchased_at=None):
+    """Add (buyer, product) rows to the ledger, ignoring pairs already recorded"""
+    extra = {'first_purchased_at': purchased_at} if purchased_at else {}
+    Purchase.objects.bulk_create(
+        [Purchase(buyer=buyer, product_id=product_id, **extra) for product_id in product_ids],
+        ignore_conflicts=True,
+    )
+    # Reviews written before the purchase become verified now
+    Review.objects.filter(buyer=buyer, product_id__in=product_ids, verified=False).update(verified=True)
+
+
+def has_purchased(buyer, product):
+    """True if the buyer has ever bought the product (unique index lookup)"""
+    if not buyer.is_authenticated:
+        return False
+    product_id = getattr(product, 'pk', product)
+    return Purchase.objects.filter(buyer=buyer, product_id=product_id).exists()
+
+
+def sync_review_verification(reviews=None):
+    """
+    Set Review.verified from the ledger for every review in the queryset (all
+    reviews by default) with two UPDATE statements. Returns (verified, unverified)
+    counts of rows that changed.
+    """
+    if reviews is None:
+        reviews = Review.objects.all()
+    purchased = Purchase.objects.filter(buyer_id=OuterRef('buyer_id'), product_id=OuterRef('product_id'))
+    # UPDATE can't use joins/ordering from the caller's queryset, so go through ids
+    reviews = Review.objects.filter(id__in=reviews.order_by().values('id'))
+    with transaction.atomic():
+        verified = reviews.filter(verified=False).filter(Exists(purchased)).update(verified=True)
+        unverified = reviews.filter(verified=True).exclude(Exists(purchased)).update(verified=False)
+    return verified, unverified
+
+
+def backfill_purchases(batch_size=5000, buyer_ids=None):
+    """Rebuild the ledger from existing orders (of buyer_ids only, if given); returns the number of pairs seen"""
+    items = OrderItem.objects.all()
+    if buyer_ids is not None:
+        items = items.filter(order__buyer_id__in=buyer_ids)
+    pairs = (
+        items.values('order__buyer_id', 'product_id')
+        .annotate(first_purchased_at=Min('order__created_at'))
+        .order_by('order__buyer_id', 'product_id')
+    )
+    seen = 0
+    batch = []
+    for pair in pairs.iterator(chunk_size=batch_size):
+        batch.append(Purchase(
+            buyer_id=pair['order__buyer_id'],
+            product_id=pair['product_id'],
+            first_purchased_at=pair['first_purchased_at'],
+        ))
+        if len(batch) >= batch_size:
+            Purchase.objects.bulk_create(batch, ignore_conflicts=True)
+            seen += len(batch)
+            batch = []
+    if batch:
+        Purchase.objects.bulk_create(batch, ignore_conflicts=True)
+        seen += len(batch)
+    return seen
@@ -0,0 +1,62 @@
+# Query plan inspection used by the explain_endpoints command and QueryPlanTestMixin
+
+import json
+import re
+from collections import namedtuple
+
+from django.db import connections
+
+
+QueryPlan = namedtuple('QueryPlan', ['text', 'full_scans', 'sorted_without_index'])
+
+SQLITE_SCAN = re.compile(r'\bSCAN (\S+)(.*)$')
+POSTGRES_SEQ_SCAN = re.compile(r'Seq Scan on (\S+)')
+POSTGRES_SORT = re.compile(r'^\s*(->\s*)?Sort\b', re.MULTILINE)
+
+
+def explain(queryset):
+    """
+    EXPLAIN the queryset on its own database and report the tables read
+    with a full scan and whether rows are sorted without an index
+    (filesort / temp b-tree / Sort node).
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'mysql':
+        text = queryset.explain(format='json')
+        tables = _mysql_tables(json.loads(text))
+        full_scans = [table['table_name'] for table in tables if table.get('access_type') == 'ALL']
+        sorted_without_index = '"using_filesort": true' in text
+    elif vendor == 'postgresql':
+        text = queryset.explain()
+        full_scans = POSTGRES_SEQ_SCAN.findall(text)
+        sorted_without_index = bool(POSTGRES_SORT.search(text))
+    else:
+        text = queryset.explain()
+        full_scans = []
+        for line in text.splitlines():
+            match = SQLITE_SCAN.search(line)
+            # "SCAN t USING INDEX i" walks an index in order, only a bare "SCAN t" reads every row
+            if match and 'USING' not in match.group(2) and match.group(1) != 'CONSTANT':
+                full_scans.append(match.group(1))
+        sorted_without_index = 'TEMP B-TREE FOR ORDER BY' in text
+    return QueryPlan(text, full_scans, sorted_without_index)
+
+
+def _mysql_tables(node):
+    """Every {"table": {...}} block of a MySQL FORMAT=JSON plan"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'table' and isinstance(value, dict):
+                yield value
+            yield from _mysql_tables(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _mysql_tables(item)
+
+
+def plan_problems(plan):
+    """Human readable reasons the plan doesn't use an index, empty when it does"""
+    problems = [f'full scan of {table}' for table in plan.full_scans]
+    if plan.sorted_without_index:
+        problems.append('sorts rows without an index')
+    return problems
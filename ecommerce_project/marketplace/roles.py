@@ -0,0 +1,109 @@
+# Role (Vendors/Buyers group) resolution
+#
+# A user's group names are resolved once per request and kept in the session,
+# so permission checks and templates don't query auth_user_groups again and
+# again. A per-user version in the cache is bumped whenever the user's groups
+# change (see signals.py), which makes the session copy stale.
+
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponseForbidden
+from django.utils.functional import SimpleLazyObject
+from rest_framework.permissions import SAFE_METHODS
+
+
+VENDORS = 'Vendors'
+BUYERS = 'Buyers'
+
+SESSION_KEY = '_marketplace_roles'
+
+
+def _version_key(user_id):
+    return f'roles:version:{user_id}'
+
+
+def roles_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_roles(*user_ids):
+    """Force the roles of these users to be reloaded on their next request"""
+    cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, None)
+
+
+def get_roles(request):
+    """Group names of the current user, resolved at most once per request"""
+    user = request.user
+    if not user.is_authenticated:
+        return frozenset()
+
+    roles = getattr(user, '_marketplace_roles', None)
+    if roles is not None:
+        return roles
+
+    version = roles_version(user.pk)
+    session = getattr(request, 'session', None)
+    # Only session-authenticated users keep roles in the session; Basic auth
+    # API clients would otherwise create a session row per request
+    use_session = session is not None and session.get('_auth_user_id') == str(user.pk)
+    stored = session.get(SESSION_KEY) if use_session else None
+
+    if stored and stored.get('user') == user.pk and stored.get('version') == version:
+        roles = frozenset(stored['roles'])
+    else:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        if use_session:
+            session[SESSION_KEY] = {'user': user.pk, 'version': version, 'roles': sorted(roles)}
+
+    user._marketplace_roles = roles
+    return roles
+
+
+def has_role(request, role):
+    return role in get_roles(request)
+
+
+def role_required(role, message):
+    """Function view decorator: 403 with `message` unless the user has `role`"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not has_role(request, role):
+                return HttpResponseForbidden(message)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class RolePermissionMixin:
+    """
+    For DRF permission classes: safe methods are open to everyone, writes
+    need `required_role`. Uses the same cached roles as the web views.
+    """
+    required_role = None
+
+    def has_permission(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+
+        return (request.user and
+                request.user.is_authenticated and
+                has_role(request, self.required_role))
+
+
+class RoleMiddleware:
+    """Attach request.roles (resolved lazily) - must come after AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request))
+        return self.get_response(request)
@@ -0,0 +1,192 @@
+# Fast read path for hot list endpoints
+#
+# A DRF list response loads a model instance per row and walks every field of
+# the serializer for each of them (get_attribute, source_attrs, None checks).
+# RowSerializer compiles a read serializer's fields once into per-field
+# accessors, then renders a page straight from queryset.values() rows. The
+# output is the same data - and so byte-identical JSON - as the serializer it
+# was compiled from; compare them with python manage.py bench_serializers.
+#
+# Supported fields: plain model/annotation fields, dotted sources, nested
+# serializers of plain fields, file fields and SerializerMethodFields whose
+# get_<name>() only reads the attribute <name> (or method_sources[name]).
+
+from operator import itemgetter
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .instrumentation import timed_serialization
+from .serializers import ProductListSerializer, StoreListSerializer, ReviewSerializer
+
+
+# Fields whose to_representation() is just a type coercion
+COERCIONS = (
+    (serializers.BooleanField, bool),
+    (serializers.IntegerField, int),
+    (serializers.CharField, str),
+)
+
+
+class RowObject:
+    """Attribute access to a values() row, for SerializerMethodFields"""
+    __slots__ = ('row',)
+
+    def __init__(self, row):
+        self.row = row
+
+    def __getattr__(self, name):
+        try:
+            return self.row[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _lookup(prefix, field):
+    return prefix + '__'.join(field.source_attrs)
+
+
+def _coercion(field):
+    if isinstance(field, serializers.PrimaryKeyRelatedField) and field.pk_field is None:
+        return None  # values() already returns the pk
+    for field_class, coerce in COERCIONS:
+        if isinstance(field, field_class):
+            return coerce
+    return field.to_representation
+
+
+def _value_getter(key, convert):
+    if convert is None:
+        return itemgetter(key)
+
+    def get(row):
+        value = row[key]
+        return None if value is None else convert(value)
+    return get
+
+
+def _file_getter(key, storage, request, use_url):
+    # FileField.to_representation() with the stored name instead of a FieldFile
+    def get(row):
+        name = row[key]
+        if not name:
+            return None
+        if not use_url:
+            return name
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request is not None else url
+    return get
+
+
+def _datetime_getter(key, field, tz):
+    # DateTimeField.to_representation() with the field timezone looked up once per page
+    def get(row):
+        value = row[key]
+        if not value or tz is None or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return get
+
+
+def _nested_getter(key, getters):
+    def get(row):
+        if row[key] is None:
+            return None
+        return {name: getter(row) for name, getter in getters}
+    return get
+
+
+class RowSerializer:
+    """
+    Renders values() rows like serializer_class renders instances.
+    rows.serialize(rows.values(queryset)[:n], context) == serializer_class(queryset[:n], many=True, context=context).data
+    """
+
+    def __init__(self, serializer_class, method_sources=None):
+        self.serializer_class = serializer_class
+        self.method_sources = method_sources or {}
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        """([(name, kind, spec)], lookups) - built on first use, then shared by every request"""
+        if self._compiled is None:
+            lookups = []
+            fields = self._compile(self.serializer_class(), '', lookups)
+            self._compiled = fields, list(dict.fromkeys(lookups))
+        return self._compiled
+
+    def _compile(self, serializer, prefix, lookups):
+        model = serializer.Meta.model
+        fields = []
+        for field in serializer._readable_fields:
+            if isinstance(field, serializers.SerializerMethodField):
+                if prefix:
+                    raise ImproperlyConfigured(
+                        f'{field.field_name}: method fields of nested serializers are not supported'
+                    )
+                sources = self.method_sources.get(field.field_name, [field.field_name])
+                lookups.extend(sources)
+                fields.append((field.field_name, 'method', field.method_name))
+            elif isinstance(field, serializers.Serializer):
+                key = _lookup(prefix, field)
+                lookups.append(key)
+                fields.append((field.field_name, 'nested', (key, self._compile(field, key + '__', lookups))))
+            elif isinstance(field, (serializers.ListSerializer, serializers.ManyRelatedField)):
+                raise ImproperlyConfigured(f'{field.field_name}: to-many fields are not supported')
+            elif (isinstance(field, serializers.DateTimeField) and
+                  getattr(field, 'format', api_settings.DATETIME_FORMAT) == ISO_8601):
+                key = _lookup(prefix, field)
+                lookups.append(key)
+                fields.append((field.field_name, 'datetime', (key, field)))
+            elif isinstance(field, serializers.FileField):
+                key = _lookup(prefix, field)
+                lookups.append(key)
+                storage = model._meta.get_field(field.source_attrs[-1]).storage
+                use_url = getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+                fields.append((field.field_name, 'file', (key, storage, use_url)))
+            else:
+                key = _lookup(prefix, field)
+                lookups.append(key)
+                fields.append((field.field_name, 'value', (key, _coercion(field))))
+        return fields
+
+    def values(self, queryset):
+        """The queryset as dict rows holding exactly what serialize() reads"""
+        return queryset.values(*self.compiled[1])
+
+    def _getters(self, fields, serializer, request):
+        getters = []
+        for name, kind, spec in fields:
+            if kind == 'value':
+                getters.append((name, _value_getter(*spec)))
+            elif kind == 'datetime':
+                key, field = spec
+                tz = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+                getters.append((name, _datetime_getter(key, field, tz)))
+            elif kind == 'file':
+                key, storage, use_url = spec
+                getters.append((name, _file_getter(key, storage, request, use_url)))
+            elif kind == 'nested':
+                key, nested = spec
+                getters.append((name, _nested_getter(key, self._getters(nested, serializer, request))))
+            else:
+                method = getattr(serializer, spec)
+                getters.append((name, lambda row, method=method: method(RowObject(row))))
+        return getters
+
+    def serialize(self, rows, context=None):
+        """Serialized dicts for the values() rows, in order"""
+        context = context or {}
+        # Only bound for the method fields; its fields are never built
+        serializer = self.serializer_class(context=context)
+        getters = self._getters(self.compiled[0], serializer, context.get('request'))
+        with timed_serialization():
+            return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+PRODUCT_LIST_ROWS = RowSerializer(ProductListSerializer)
+STORE_LIST_ROWS = RowSerializer(StoreListSerializer)
+REVIEW_ROWS = RowSerializer(ReviewSerializer)
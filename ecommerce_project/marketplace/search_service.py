@@ -0,0 +1,319 @@
+# Full-text search for products and stores
+#
+# On MariaDB/MySQL searches use the FULLTEXT indexes created in migration 0005.
+# Other databases (SQLite in development and tests) fall back to an in-process
+# inverted index, built on first use and kept current by signals.py. That index
+# belongs to one process and only sees that process's writes, so other workers
+# serve stale results until it is rebuilt (every SEARCH_INDEX_MAX_AGE seconds):
+# it is meant for single-process development servers.
+#
+# Ranked searches (search_products/search_stores) return at most
+# SEARCH_MAX_RESULTS ids. Filtering a list (?search=, filter_products/
+# filter_stores) is not capped: on MySQL every term must start a word (MATCH
+# ... IN BOOLEAN MODE); elsewhere it is SearchFilter's substring LIKE.
+
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Store, Product
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens, ignoring single characters"""
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if len(token) > 1]
+
+
+# ==================== MARIADB / MYSQL ====================
+
+class FullTextSearchBackend:
+    """Relevance-ranked MATCH ... AGAINST queries over the FULLTEXT indexes"""
+
+    PRODUCT_MATCH = (
+        'MATCH (marketplace_product.name, marketplace_product.description) '
+        'AGAINST (%s IN NATURAL LANGUAGE MODE)'
+    )
+    STORE_MATCH = (
+        'MATCH (marketplace_store.name, marketplace_store.description) '
+        'AGAINST (%s IN NATURAL LANGUAGE MODE)'
+    )
+
+    # Word-prefix filters; the store one runs as a subquery, where the table is aliased
+    PRODUCT_FILTER = (
+        'MATCH (marketplace_product.name, marketplace_product.description) AGAINST (%s IN BOOLEAN MODE)'
+    )
+    STORE_FILTER = 'MATCH (marketplace_store.name, marketplace_store.description) AGAINST (%s IN BOOLEAN MODE)'
+    SUBQUERY_STORE_FILTER = 'MATCH (name, description) AGAINST (%s IN BOOLEAN MODE)'
+
+    STORE_WEIGHT = 0.5  # A store match counts for half as much as a match on the product itself
+
+    def _matches(self, queryset, match, query, limit):
+        """(id, relevance, ...) rows; the bare MATCH in WHERE lets MySQL use the FULLTEXT index"""
+        return (
+            queryset.filter(RawSQL(match, [query], output_field=BooleanField()))
+            .annotate(relevance=RawSQL(match, [query], output_field=FloatField()))
+            .order_by('-relevance', '-id')[:limit]
+        )
+
+    def search_products(self, query, limit):
+        # Two index lookups instead of one MATCH over a product/store join
+        stores = dict(self._matches(Store.objects, self.STORE_MATCH, query, limit).values_list('id', 'relevance'))
+        scores = {
+            product_id: relevance + self.STORE_WEIGHT * stores.get(store_id, 0)
+            for product_id, relevance, store_id in
+            self._matches(Product.objects, self.PRODUCT_MATCH, query, limit).values_list('id', 'relevance', 'store_id')
+        }
+        if stores:
+            # Products of matching stores, best store first
+            store_rank = Case(*[When(store_id=store_id, then=Value(rank)) for rank, store_id in
+                                enumerate(sorted(stores, key=lambda store_id: (-stores[store_id], -store_id)))],
+                              output_field=IntegerField())
+            store_products = (
+                Product.objects.filter(store_id__in=list(stores)).exclude(id__in=list(scores))
+                .order_by(store_rank, '-id').values_list('id', 'store_id')[:limit]
+            )
+            for product_id, store_id in store_products:
+                scores[product_id] = self.STORE_WEIGHT * stores[store_id]
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [product_id for product_id, _ in ranked]
+
+    def search_stores(self, query, limit):
+        ids = list(self._matches(Store.objects, self.STORE_MATCH, query, limit).values_list('id', flat=True))
+        # Vendor usernames live on another table, so match them exactly (indexed) instead
+        seen = set(ids)
+        by_vendor = Store.objects.filter(vendor__username__in=query.split()).values_list('id', flat=True)
+        ids.extend(store_id for store_id in by_vendor[:limit] if store_id not in seen)
+        return ids[:limit]
+
+    def _term_filter(self, match, token):
+        return RawSQL(match, [f'+{token}*'], output_field=BooleanField())
+
+    def filter_products(self, queryset, tokens):
+        """Products where every token starts a word of the product or of its store"""
+        for token in tokens:
+            stores = Store.objects.filter(self._term_filter(self.SUBQUERY_STORE_FILTER, token)).values('id')
+            queryset = queryset.filter(
+                Q(self._term_filter(self.PRODUCT_FILTER, token)) | Q(store_id__in=stores)
+            )
+        return queryset
+
+    def filter_stores(self, queryset, tokens):
+        """Stores where every token starts a word of the store or its vendor's username"""
+        for token in tokens:
+            queryset = queryset.filter(
+                Q(self._term_filter(self.STORE_FILTER, token)) | Q(vendor__username__istartswith=token)
+            )
+        return queryset
+
+    # FULLTEXT indexes are maintained by the database itself
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def index_store(self, store):
+        pass
+
+    def remove_store(self, store_id):
+        pass
+
+    def reset(self):
+        pass
+
+
+# ==================== PURE-PYTHON FALLBACK ====================
+
+class InvertedIndex:
+    """token -> {document id: weighted term frequency}, scored with TF-IDF"""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}  # document id -> tokens it was indexed under
+
+    def add(self, doc_id, weighted_fields):
+        self.remove(doc_id)
+        weights = defaultdict(float)
+        for text, weight in weighted_fields:
+            for token in tokenize(text):
+                weights[token] += weight
+        for token, weight in weights.items():
+            self.postings[token][doc_id] = weight
+        self.documents[doc_id] = list(weights)
+
+    def remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[token]
+
+    def search(self, query, limit):
+        total = len(self.documents) or 1
+        scores = defaultdict(float)
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for doc_id, weight in postings.items():
+                scores[doc_id] += weight * idf
+        ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], -item[0]))
+        return [doc_id for doc_id, _ in ranked]
+
+
+class InMemorySearchBackend:
+    """Inverted indexes held in this process; field weights mirror the FULLTEXT ranking"""
+
+    NAME_WEIGHT = 3.0
+    DESCRIPTION_WEIGHT = 1.0
+    STORE_WEIGHT = 1.5
+
+    def __init__(self, max_age=None):
+        self._lock = threading.Lock()
+        self._products = None
+        self._stores = None
+        self._built_at = None
+        self.max_age = max_age if max_age is not None else getattr(settings, 'SEARCH_INDEX_MAX_AGE', 300)
+
+    def _product_fields(self, name, description, store_name):
+        return [
+            (name, self.NAME_WEIGHT),
+            (description, self.DESCRIPTION_WEIGHT),
+            (store_name, self.STORE_WEIGHT),
+        ]
+
+    def _store_fields(self, name, description, vendor_username):
+        return [
+            (name, self.NAME_WEIGHT),
+            (description, self.DESCRIPTION_WEIGHT),
+            (vendor_username, self.NAME_WEIGHT),
+        ]
+
+    def _ensure_built(self):
+        # Rebuilt now and then to pick up writes made by other processes
+        if self._products is not None and time.monotonic() - self._built_at < self.max_age:
+            return
+        products = InvertedIndex()
+        rows = Product.objects.values_list('id', 'name', 'description', 'store__name')
+        for product_id, name, description, store_name in rows.iterator(chunk_size=2000):
+            products.add(product_id, self._product_fields(name, description, store_name))
+        stores = InvertedIndex()
+        rows = Store.objects.values_list('id', 'name', 'description', 'vendor__username')
+        for store_id, name, description, vendor_username in rows.iterator(chunk_size=2000):
+            stores.add(store_id, self._store_fields(name, description, vendor_username))
+        self._products, self._stores = products, stores
+        self._built_at = time.monotonic()
+
+    def search_products(self, query, limit):
+        with self._lock:
+            self._ensure_built()
+            return self._products.search(query, limit)
+
+    def search_stores(self, query, limit):
+        with self._lock:
+            self._ensure_built()
+            return self._stores.search(query, limit)
+
+    # This index can't narrow a queryset without an id list, so lists are
+    # filtered with LIKE instead (see filter_products)
+
+    def filter_products(self, queryset, tokens):
+        return None
+
+    def filter_stores(self, queryset, tokens):
+        return None
+
+    # Index maintenance - called from signals. Updates are skipped until the
+    # index has been built, since building it reads the current rows anyway.
+
+    def index_product(self, product):
+        with self._lock:
+            if self._products is not None:
+                self._products.add(product.id, self._product_fields(
+                    product.name, product.description, product.store.name))
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._products is not None:
+                self._products.remove(product_id)
+
+    def index_store(self, store):
+        with self._lock:
+            if self._stores is None:
+                return
+            self._stores.add(store.id, self._store_fields(
+                store.name, store.description, store.vendor.username))
+            # Products are indexed under their store's name
+            rows = store.products.values_list('id', 'name', 'description')
+            for product_id, name, description in rows:
+                self._products.add(product_id, self._product_fields(name, description, store.name))
+
+    def remove_store(self, store_id):
+        with self._lock:
+            if self._stores is not None:
+                self._stores.remove(store_id)
+
+    def reset(self):
+        with self._lock:
+            self._products = self._stores = None
+
+
+# ==================== BACKEND SELECTION ====================
+
+_backend = None
+
+
+def get_search_backend():
+    """SEARCH_BACKEND setting if given, otherwise FULLTEXT on MySQL and in-memory elsewhere"""
+    global _backend
+    if _backend is None:
+        backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+        if backend_path:
+            _backend = import_string(backend_path)()
+        elif connection.vendor == 'mysql':
+            _backend = FullTextSearchBackend()
+        else:
+            _backend = InMemorySearchBackend()
+    return _backend
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+
+
+def search_products(query):
+    """Product ids matching the query, best match first"""
+    return get_search_backend().search_products(query, max_results())
+
+
+def search_stores(query):
+    """Store ids matching the query, best match first"""
+    return get_search_backend().search_stores(query, max_results())
+
+
+def filter_products(queryset, query):
+    """
+    The queryset narrowed to products matching every word of the query,
+    uncapped, or None when the backend can't filter in the database
+    """
+    return get_search_backend().filter_products(queryset, tokenize(query))
+
+
+def filter_stores(queryset, query):
+    """Like filter_products() for stores"""
+    return get_search_backend().filter_stores(queryset, tokenize(query))
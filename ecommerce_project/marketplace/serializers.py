@@ -1,18 +1,25 @@
 # API Serializers
 
+from decimal import Decimal
+
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
 from django.contrib.auth.models import User
-from .models import Store, Product, Review, Order, OrderItem
+from django.db.models import Prefetch
+from .models import Store, Product, Review, Order, OrderItem, RATINGS
+from .instrumentation import TimedSerializerMixin
+from .image_service import variant_urls
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
         read_only_fields = ['id']
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     buyer = UserSerializer(read_only=True)
     buyer_username = serializers.CharField(source='buyer.username', read_only=True)
     product_name = serializers.CharField(source='product.name', read_only=True)
@@ -42,22 +49,22 @@ class ReviewSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for Products
     - Includes store information
-    - Shows average rating and review count
-    - Links to related reviews
+    - Shows average rating and review count (stored on the product)
+    - Links to the paginated reviews endpoint; the full review link list
+      only when requested in context['expand'] (see EXPANSIONS)
     """
+    EXPANSIONS = ('reviews',)
+    
     store_name = serializers.CharField(source='store.name', read_only=True)
     vendor_name = serializers.CharField(source='store.vendor.username', read_only=True)
-    reviews_count = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
-    reviews = serializers.HyperlinkedRelatedField(
-        many=True,
-        read_only=True,
-        view_name='review-detail'
-    )
+    image_variants = serializers.SerializerMethodField()
+    reviews_url = serializers.SerializerMethodField()
+    reviews = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
@@ -67,29 +74,57 @@ class ProductSerializer(serializers.ModelSerializer):
             'store_name',
             'vendor_name',
             'name',
+            'sku',
             'description',
             'price',
             'stock',
             'image',
+            'image_variants',
             'reviews_count',
             'average_rating',
+            'rating_histogram',
+            'reviews_url',
             'reviews',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'reviews_count', 'rating_histogram', 'created_at', 'updated_at']
     
-    def get_reviews_count(self, obj):
-        """Get total number of reviews"""
-        return obj.reviews.count()
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'reviews' not in self.context.get('expand', ()):
+            fields.pop('reviews', None)
+        return fields
     
     def get_average_rating(self, obj):
-        """Calculate average rating from all reviews"""
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            avg = sum(r.rating for r in reviews) / len(reviews)
-            return round(avg, 2)
-        return None
+        """Stored average rating, maintained on every review write"""
+        if obj.average_rating is None:
+            return None
+        return float(obj.average_rating)
+    
+    def get_image_variants(self, obj):
+        """URLs of the resized/WebP copies of the image (empty until processed)"""
+        return variant_urls(obj.image_variants, self.context.get('request'))
+    
+    def get_reviews_url(self, obj):
+        """The paginated, filterable reviews of the product (reviews_count has the total)"""
+        return reverse('product-reviews', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+    
+    def get_reviews(self, obj):
+        """
+        Links to every review (expand=reviews), from the ids alone. Plain
+        strings, unlike HyperlinkedRelatedField's Hyperlinks, which load each
+        review and its buyer for str() when the response is pickled into the cache.
+        """
+        request = self.context.get('request')
+        return [
+            reverse('review-detail', kwargs={'pk': review_id}, request=request)
+            for review_id in obj.reviews.order_by('id').values_list('id', flat=True)
+        ]
+    
+    def validate_sku(self, value):
+        """A blank sku means "no sku" (NULL), so it never clashes with the store's other products"""
+        return value or None
     
     def validate_price(self, value):
         """Ensure price is positive"""
@@ -104,17 +139,58 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
 
-class StoreSerializer(serializers.ModelSerializer):
+class ProductImportSerializer(ProductSerializer):
+    """
+    Validates one row of a bulk catalog import
+    - Same price/stock rules as ProductSerializer
+    - Store comes from the import itself, so no per-row lookups
+    """
+    store_name = None
+    vendor_name = None
+    average_rating = None
+    image_variants = None
+    reviews_url = None
+    reviews = None
+    
+    class Meta:
+        model = Product
+        fields = ['sku', 'name', 'description', 'price', 'stock']
+        # Uniqueness of (store, sku) is handled by the upsert
+        validators = []
+
+
+class ProductStatsMixin(serializers.Serializer):
+    """
+    Product count, price range and total stock of a store
+    - Read from Store.objects.with_product_stats() annotations
+    - Falls back to one aggregate query for stores loaded without them
+    """
+    products_count = serializers.IntegerField(read_only=True)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_stock = serializers.IntegerField(read_only=True)
+    
+    def to_representation(self, instance):
+        instance.product_stats()
+        return super().to_representation(instance)
+
+
+class StoreSerializer(TimedSerializerMixin, ProductStatsMixin, serializers.ModelSerializer):
     """
     Serializer for Stores
     - Includes vendor information
-    - Shows product count
-    - Nested products list (optional)
+    - Shows product count, price range and total stock
+    - Embeds the first page of products (list shape) with a link to the rest
+    - Heavier nested data only when requested in context['expand'] (see EXPANSIONS)
     """
+    EXPANSIONS = ('products.reviews', 'vendor.stores')
+    REVIEWS_PER_PRODUCT = 3
+    
     vendor = UserSerializer(read_only=True)
     vendor_username = serializers.CharField(source='vendor.username', read_only=True)
-    products_count = serializers.SerializerMethodField()
-    products = ProductSerializer(many=True, read_only=True)
+    logo_variants = serializers.SerializerMethodField()
+    products = serializers.SerializerMethodField()
+    vendor_stores = serializers.SerializerMethodField()
     
     class Meta:
         model = Store
@@ -125,16 +201,62 @@ class StoreSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'logo',
+            'logo_variants',
             'products_count',
+            'min_price',
+            'max_price',
+            'total_stock',
             'products',
+            'vendor_stores',
             'created_at',
             'updated_at'
         ]
         read_only_fields = ['id', 'vendor', 'created_at', 'updated_at']
     
-    def get_products_count(self, obj):
-        """Get total number of products in store"""
-        return obj.products.count()
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'vendor.stores' not in self.context.get('expand', ()):
+            fields.pop('vendor_stores')
+        return fields
+    
+    def get_logo_variants(self, obj):
+        """URLs of the resized/WebP copies of the logo (empty until processed)"""
+        return variant_urls(obj.logo_variants, self.context.get('request'))
+    
+    def get_products(self, obj):
+        """
+        First page of the store's products, newest first, in the lightweight
+        list shape. `next` points at the paginated store products endpoint.
+        """
+        request = self.context.get('request')
+        expand = self.context.get('expand', ())
+        page_size = api_settings.PAGE_SIZE
+        
+        products = obj.products.order_by('-created_at', '-id')
+        serializer_class = ProductListSerializer
+        if 'products.reviews' in expand:
+            # Sliced prefetch: one query for the latest reviews of every product on the page
+            reviews = Review.objects.select_related('buyer').order_by('-created_at', '-id')
+            products = products.prefetch_related(
+                Prefetch('reviews', queryset=reviews[:self.REVIEWS_PER_PRODUCT], to_attr='latest_reviews')
+            )
+            serializer_class = ProductWithReviewsSerializer
+        
+        count = obj.product_stats()['products_count']
+        next_url = None
+        if count > page_size:
+            next_url = reverse('store-products', kwargs={'pk': obj.pk}, request=request) + '?page=2'
+        return {
+            'count': count,
+            'next': next_url,
+            'results': serializer_class(products[:page_size], many=True, context=self.context).data,
+        }
+    
+    def get_vendor_stores(self, obj):
+        """The vendor's other stores with their product stats (expand=vendor.stores)"""
+        stores = Store.objects.filter(vendor_id=obj.vendor_id).exclude(pk=obj.pk) \
+            .select_related('vendor').with_product_stats().order_by('-created_at')
+        return StoreListSerializer(stores, many=True, context=self.context).data
     
     def create(self, validated_data):
         """Auto-set vendor from request user"""
@@ -142,14 +264,15 @@ class StoreSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class StoreListSerializer(serializers.ModelSerializer):
+class StoreListSerializer(TimedSerializerMixin, ProductStatsMixin, serializers.ModelSerializer):
     """
     Lightweight serializer for listing stores
     - Excludes nested products for better performance
+    - Product stats come from SQL annotations, not from loading products
     - Used in list views
     """
     vendor_username = serializers.CharField(source='vendor.username', read_only=True)
-    products_count = serializers.SerializerMethodField()
+    logo_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Store
@@ -159,18 +282,22 @@ class StoreListSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'logo',
+            'logo_variants',
             'products_count',
+            'min_price',
+            'max_price',
+            'total_stock',
             'created_at',
             'updated_at'
         ]
         read_only_fields = ['id', 'created_at', 'updated_at']
     
-    def get_products_count(self, obj):
-        """Get total number of products in store"""
-        return obj.products.count()
+    def get_logo_variants(self, obj):
+        """URLs of the resized/WebP copies of the logo (empty until processed)"""
+        return variant_urls(obj.logo_variants, self.context.get('request'))
 
 
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Lightweight serializer for listing products
     - Excludes nested reviews for better performance
@@ -178,8 +305,8 @@ class ProductListSerializer(serializers.ModelSerializer):
     """
     store_name = serializers.CharField(source='store.name', read_only=True)
     vendor_name = serializers.CharField(source='store.vendor.username', read_only=True)
-    reviews_count = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
     
     class Meta:
         model = Product
@@ -192,27 +319,37 @@ class ProductListSerializer(serializers.ModelSerializer):
             'price',
             'stock',
             'image',
+            'image_variants',
             'reviews_count',
             'average_rating',
             'created_at',
             'updated_at'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at']
-    
-    def get_reviews_count(self, obj):
-        """Get total number of reviews"""
-        return obj.reviews.count()
+        read_only_fields = ['id', 'reviews_count', 'created_at', 'updated_at']
     
     def get_average_rating(self, obj):
-        """Calculate average rating from all reviews"""
-        reviews = obj.reviews.all()
-        if reviews.exists():
-            avg = sum(r.rating for r in reviews) / len(reviews)
-            return round(avg, 2)
-        return None
+        """Stored average rating, maintained on every review write"""
+        if obj.average_rating is None:
+            return None
+        return float(obj.average_rating)
+    
+    def get_image_variants(self, obj):
+        """URLs of the resized/WebP copies of the image (empty until processed)"""
+        return variant_urls(obj.image_variants, self.context.get('request'))
+
 
+class ProductWithReviewsSerializer(ProductListSerializer):
+    """
+    List shape plus the latest reviews of each product
+    - Expects a `latest_reviews` prefetch (see StoreSerializer.get_products)
+    """
+    latest_reviews = ReviewSerializer(many=True, read_only=True)
+    
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ['latest_reviews']
 
-class OrderItemSerializer(serializers.ModelSerializer):
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for items within an order"""
     product_name = serializers.CharField(source='product.name', read_only=True)
     
@@ -222,7 +359,7 @@ class OrderItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'price']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Orders"""
     buyer = UserSerializer(read_only=True)
     items = OrderItemSerializer(many=True, read_only=True)
@@ -231,3 +368,83 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'buyer', 'items', 'total_price', 'created_at']
         read_only_fields = ['id', 'buyer', 'total_price', 'created_at']
+
+
+class SaleSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """An order as one vendor sees it: only their own lines (prefetched) and their total"""
+    buyer_username = serializers.CharField(source='buyer.username', read_only=True)
+    items = OrderItemSerializer(many=True, read_only=True)
+    sales_total = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Order
+        fields = ['id', 'buyer_username', 'items', 'sales_total', 'created_at']
+    
+    def get_sales_total(self, obj):
+        total = sum((item.price * item.quantity for item in obj.items.all()), Decimal('0.00'))
+        return str(total)
+
+
+class SalesFiguresSerializer(serializers.Serializer):
+    """Units, revenue and orders summed from the daily sales rollups"""
+    units = serializers.IntegerField(source='total_units')
+    revenue = serializers.DecimalField(source='total_revenue', max_digits=14, decimal_places=2)
+    orders = serializers.IntegerField(source='total_orders')
+
+
+class DailySalesSerializer(SalesFiguresSerializer):
+    date = serializers.DateField()
+
+
+class StoreSalesSerializer(SalesFiguresSerializer):
+    store = serializers.IntegerField(source='store_id')
+    store_name = serializers.CharField()
+
+
+class ProductSalesSerializer(SalesFiguresSerializer):
+    product = serializers.IntegerField(source='product_id')
+    product_name = serializers.CharField()
+
+
+class SalesReportSerializer(serializers.Serializer):
+    """analytics_service.vendor_sales_report() output"""
+    start = serializers.DateField()
+    end = serializers.DateField()
+    totals = SalesFiguresSerializer()
+    days = DailySalesSerializer(many=True)
+    stores = StoreSalesSerializer(many=True)
+    top_products = ProductSalesSerializer(many=True)
+
+
+class ReviewFilterSerializer(serializers.Serializer):
+    """
+    ?verified=true|false and ?rating=1-5 filters of a product's review list.
+    Validate a plain dict (query_params.dict()): with a QueryDict a missing
+    boolean reads as False.
+    """
+    verified = serializers.BooleanField(required=False, allow_null=True, default=None)
+    rating = serializers.ChoiceField(choices=list(RATINGS), required=False, allow_null=True, default=None)
+
+
+class CartLineSerializer(serializers.Serializer):
+    """Input for adding to / updating a cart line"""
+    product = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all())
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+
+class CartItemSerializer(TimedSerializerMixin, serializers.Serializer):
+    """A priced cart line, as returned by cart_service.price_cart()"""
+    product = serializers.IntegerField(source='product.id')
+    product_name = serializers.CharField(source='product.name')
+    store_name = serializers.CharField(source='product.store_name')
+    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2)
+    quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartSerializer(serializers.Serializer):
+    """The priced cart: lines, total and item count"""
+    items = CartItemSerializer(many=True)
+    total = serializers.DecimalField(max_digits=12, decimal_places=2)
+    count = serializers.IntegerField()
+
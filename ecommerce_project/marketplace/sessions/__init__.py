@@ -0,0 +1,31 @@
+# Session engines that skip the write when a request didn't change the session
+#
+# Django saves a session whenever it was marked modified, even if the data
+# ends up identical (e.g. a value re-assigned with the same content). These
+# engines remember what was loaded and turn such saves into no-ops. With
+# SESSION_SAVE_EVERY_REQUEST every save still writes, to push the expiry back.
+# Select one with SESSION_STORAGE in settings.
+
+import hashlib
+
+from django.conf import settings
+
+
+class SkipUnchangedSaveMixin:
+
+    def _fingerprint(self, data):
+        return hashlib.sha1(self.serializer().dumps(data)).hexdigest()
+
+    def load(self):
+        data = super().load()
+        self._loaded_fingerprint = self._fingerprint(data)
+        return data
+
+    def save(self, must_create=False):
+        loaded = getattr(self, '_loaded_fingerprint', None)
+        if (not must_create and not settings.SESSION_SAVE_EVERY_REQUEST and
+                loaded is not None and self.session_key and
+                self._fingerprint(self._get_session(no_load=True)) == loaded):
+            return
+        super().save(must_create=must_create)
+        self._loaded_fingerprint = self._fingerprint(self._get_session(no_load=True))
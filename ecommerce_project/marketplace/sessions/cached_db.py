@@ -0,0 +1,10 @@
+# Write-through cached sessions: reads hit the cache and only fall back to the
+# database on a miss; writes go to both, and are skipped when nothing changed
+
+from django.contrib.sessions.backends import cached_db
+
+from . import SkipUnchangedSaveMixin
+
+
+class SessionStore(SkipUnchangedSaveMixin, cached_db.SessionStore):
+    pass
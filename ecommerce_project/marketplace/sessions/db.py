@@ -0,0 +1,9 @@
+# Database sessions (Django's default) without redundant writes
+
+from django.contrib.sessions.backends import db
+
+from . import SkipUnchangedSaveMixin
+
+
+class SessionStore(SkipUnchangedSaveMixin, db.SessionStore):
+    pass
@@ -1,20 +1,199 @@
 # Auto-tweet when stores and products are created
+# Tweets are queued in the outbox and sent by the process_outbox worker,
+# so the Twitter API is never called on the request path.
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.contrib.auth.models import User, Group
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, m2m_changed, pre_delete, pre_save
 from django.dispatch import receiver
-from .models import Store, Product
-from .twitter_service import twitter_service
+from .models import Store, Product, Review
+from .notification_service import queue_store_tweet, queue_product_tweet
+from .cart_service import product_snapshots, merge_carts, cart_cookie_name
+from .search_service import get_search_backend
+from .roles import invalidate_roles
+from .image_service import needs_processing, schedule_variants, discard_stale_variants, delete_variant_files
+from .cache_service import (
+    invalidate_tags, product_tags, store_tags, store_product_tags, PRODUCTS_TAG, STORES_TAG
+)
 
 
 @receiver(post_save, sender=Store)
 def tweet_new_store(sender, instance, created, **kwargs):
     if created:
-        print(f"New store created: {instance.name}. Sending tweet...")
-        twitter_service.tweet_new_store(instance)
+        print(f"New store created: {instance.name}. Queueing tweet...")
+        queue_store_tweet(instance)
 
 
 @receiver(post_save, sender=Product)
 def tweet_new_product(sender, instance, created, **kwargs):
     if created:
-        print(f"New product created: {instance.name}. Sending tweet...")
-        twitter_service.tweet_new_product(instance)
+        print(f"New product created: {instance.name}. Queueing tweet...")
+        queue_product_tweet(instance)
+
+
+# Keep the denormalized review aggregates of products in sync with their reviews,
+# however the review changes (API, pages, admin, cascades)
+
+def refresh_rating_stats_on_commit(product_id):
+    transaction.on_commit(lambda: Product(pk=product_id).refresh_rating_stats())
+
+
+@receiver(pre_save, sender=Review)
+def remember_reviewed_product(sender, instance, **kwargs):
+    if instance.pk is not None and not instance._state.adding:
+        instance._previous_product_id = (
+            Review.objects.filter(pk=instance.pk).values_list('product_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def refresh_product_rating(sender, instance, **kwargs):
+    refresh_rating_stats_on_commit(instance.product_id)
+    # A review moved to another product changes both products' aggregates
+    previous_product_id = getattr(instance, '_previous_product_id', None)
+    if previous_product_id not in (None, instance.product_id):
+        refresh_rating_stats_on_commit(previous_product_id)
+
+
+@receiver(post_delete, sender=Review)
+def refresh_product_rating_after_delete(sender, instance, origin=None, **kwargs):
+    # Nothing to refresh when the delete started at the product or its store (instance or queryset)
+    if getattr(origin, 'model', type(origin)) in (Product, Store):
+        return
+    refresh_rating_stats_on_commit(instance.product_id)
+
+
+# Products carry a copy of their store's vendor; follow stores that change hands
+
+@receiver(post_save, sender=Store)
+def sync_product_vendor(sender, instance, created, **kwargs):
+    if not created:
+        instance.products.exclude(vendor=instance.vendor_id).update(vendor=instance.vendor_id)
+
+
+# Keep the cart's product snapshot cache in sync with the catalog, once the
+# write has committed (before that, a cart could cache the old row again)
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_snapshot(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: product_snapshots.invalidate([product_id]))
+
+
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_store_snapshots(sender, instance, **kwargs):
+    # Snapshots carry the store name, and deleting a store deletes its products
+    transaction.on_commit(product_snapshots.clear)
+
+
+# Keep the search index in sync (a no-op for database FULLTEXT indexes)
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().index_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: get_search_backend().remove_product(product_id))
+
+
+@receiver(post_save, sender=Store)
+def index_store(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().index_store(instance))
+
+
+@receiver(post_delete, sender=Store)
+def unindex_store(sender, instance, **kwargs):
+    store_id = instance.id
+    transaction.on_commit(lambda: get_search_backend().remove_store(store_id))
+
+
+# Invalidate cached catalog responses once the write has committed
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    # Product lists, store lists (counts) and the store detail all show the product
+    tags = [PRODUCTS_TAG, STORES_TAG] + product_tags(instance.id) + store_tags(instance.store_id)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver([post_save, post_delete], sender=Store)
+def invalidate_store_cache(sender, instance, **kwargs):
+    # Product pages show the store name; they all share one store-level tag
+    tags = [PRODUCTS_TAG, STORES_TAG] + store_tags(instance.id) + store_product_tags(instance.id)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver([post_save, post_delete], sender=Review)
+def invalidate_review_cache(sender, instance, **kwargs):
+    store_id = Product.objects.filter(id=instance.product_id).values_list('store_id', flat=True).first()
+    tags = [PRODUCTS_TAG] + product_tags(instance.product_id)
+    if store_id is not None:
+        tags += store_tags(store_id)
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+# Drop cached roles when group membership changes
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear() - remember who is about to lose the group
+        instance._cleared_user_ids = list(instance.user_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_user_ids', [])
+    else:
+        user_ids = list(pk_set)
+    transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_group_roles(sender, instance, **kwargs):
+    user_ids = list(instance.user_set.values_list('id', flat=True))
+    transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+@receiver(post_save, sender=Group)
+def invalidate_renamed_group_roles(sender, instance, created, **kwargs):
+    if not created:
+        user_ids = list(instance.user_set.values_list('id', flat=True))
+        transaction.on_commit(lambda: invalidate_roles(*user_ids))
+
+
+# Generate thumbnails/WebP copies of new product images and store logos,
+# and delete the copies of replaced images and deleted products/stores
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Store)
+def process_uploaded_image(sender, instance, **kwargs):
+    discard_stale_variants(instance)
+    if needs_processing(instance):
+        transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Store)
+def delete_image_variants(sender, instance, **kwargs):
+    variants = instance.image_variants if sender is Product else instance.logo_variants
+    transaction.on_commit(lambda: delete_variant_files(variants))
+
+
+# Carry the anonymous cart over when its owner logs in
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is None:
+        return
+    token = request.COOKIES.get(cart_cookie_name())
+    if token:
+        merge_carts(user, token)
+        # CartMiddleware drops the cookie; the next get_cart() finds the user's cart
+        request._cart_cookie_delete = True
+        request.__dict__.pop('_cart', None)
@@ -0,0 +1,14 @@
+# Template helpers for resized image variants
+# Usage: {% load marketplace_images %} ... {{ product.image_variants|variant_url:'thumb_webp' }}
+
+from django import template
+from django.core.files.storage import default_storage
+
+register = template.Library()
+
+
+@register.filter
+def variant_url(variants, key):
+    """URL of one stored variant, or '' if it hasn't been generated yet"""
+    name = (variants or {}).get(key)
+    return default_storage.url(name) if name else ''
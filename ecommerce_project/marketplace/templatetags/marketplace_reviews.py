@@ -0,0 +1,14 @@
+# Template helpers for review ratings
+# Usage: {% load marketplace_reviews %} ... {{ review.rating|stars }}
+
+from django import template
+
+register = template.Library()
+
+STARS = {rating: '★' * rating + '☆' * (5 - rating) for rating in range(6)}
+
+
+@register.filter
+def stars(rating):
+    """'★★★★☆' for 4 - one lookup instead of a template loop per review"""
+    return STARS.get(rating, '')
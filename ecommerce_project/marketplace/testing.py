@@ -0,0 +1,52 @@
+# Test helpers
+
+from django.test.utils import override_settings
+
+from .instrumentation import collect_metrics, get_query_budget
+from .query_plans import explain, plan_problems
+
+
+class QueryBudgetTestMixin:
+    """
+    Mix into a django.test.TestCase to enforce QUERY_BUDGETS.
+    Every request made with self.client raises QueryBudgetExceeded (failing
+    the test) when its view runs more queries than its budget, and
+    assertWithinQueryBudget() checks code that doesn't go through a view.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._strict_budgets = override_settings(QUERY_BUDGET_STRICT=True)
+        cls._strict_budgets.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._strict_budgets.disable()
+        super().tearDownClass()
+
+    def assertWithinQueryBudget(self, url_name, func, *args, **kwargs):
+        """Call func(*args, **kwargs) and fail if it runs more queries than url_name's budget"""
+        budget = get_query_budget(url_name)
+        if budget is None:
+            self.fail(f'No query budget declared for {url_name} in QUERY_BUDGETS')
+        with collect_metrics() as metrics:
+            result = func(*args, **kwargs)
+        if metrics.queries > budget:
+            self.fail(f'{url_name} ran {metrics.queries} queries, budget is {budget}')
+        return result
+
+
+class QueryPlanTestMixin:
+    """
+    assertUsesIndex() EXPLAINs a queryset and fails when the database would
+    read a whole table or sort without an index. Plans depend on table sizes,
+    so seed a realistic amount of data first.
+    """
+
+    def assertUsesIndex(self, queryset):
+        plan = explain(queryset)
+        problems = plan_problems(plan)
+        if problems:
+            self.fail(f"{', '.join(problems)}:\n{plan.text}")
+        return plan
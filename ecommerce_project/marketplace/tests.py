@@ -1,3 +1,1042 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import random
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.response import Response
+
+from .analytics_service import rebuild_rollups, vendor_sales_report
+from .api_views import RowListMixin
+from .cache_service import get_cache
+from .cart_service import cart_cookie_name, product_snapshots, purge_expired_carts
+from .catalog_service import import_products
+from .checkout_service import place_order
+from .instrumentation import QueryBudgetExceeded, percentile
+from .management.commands.explain_endpoints import hot_paths
+from .loadtest.data import USER_PREFIX, ensure_groups
+from .loadtest.runner import Stats
+from .models import (
+    Store, Product, Review, Order, OrderItem, Purchase, OutboxMessage, Cart, CartItem,
+    ProductDailySales, StoreDailySales,
+)
+from .notification_service import DeliveryError, StubTransport, claim_batch, process_outbox
+from .order_service import buyer_orders, export_orders
+from .roles import VENDORS, BUYERS
+from .search_service import FullTextSearchBackend, InMemorySearchBackend, get_search_backend
+from .sessions.db import SessionStore
+from .testing import QueryBudgetTestMixin, QueryPlanTestMixin
+
+
+PAGE_OF_ORDERS = 12
+
+
+class MarketplaceFixtures:
+    """A vendor with two stores of products, buyers with reviews, and orders"""
+
+    PRODUCTS_PER_STORE = 15
+    BUYERS = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = ensure_groups()
+        cls.vendor = User.objects.create_user('fixture_vendor', password='fixture-password')
+        cls.vendor.groups.add(groups[VENDORS])
+        cls.buyers = []
+        for index in range(cls.BUYERS):
+            buyer = User.objects.create_user(f'fixture_buyer_{index}', password='fixture-password')
+            buyer.groups.add(groups[BUYERS])
+            cls.buyers.append(buyer)
+        cls.buyer = cls.buyers[0]
+
+        cls.stores = [Store.objects.create(vendor=cls.vendor, name=f'Fixture store {index}') for index in range(2)]
+        cls.products = [
+            Product.objects.create(store=store, name=f'Fixture product {store.pk}-{index}', sku=f'FX-{store.pk}-{index}',
+                                   description='Fixture product', price=Decimal('10.00') + index, stock=100)
+            for store in cls.stores
+            for index in range(cls.PRODUCTS_PER_STORE)
+        ]
+        cls.product = cls.products[0]
+
+        for index, buyer in enumerate(cls.buyers):
+            Review.objects.create(product=cls.product, buyer=buyer, rating=1 + index % 5,
+                                  comment='Fixture review', verified=index % 2 == 0)
+        cls.product.refresh_rating_stats()
+
+        for product in cls.products[:PAGE_OF_ORDERS]:
+            order = Order.objects.create(buyer=cls.buyer, total_price=product.price)
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+            Purchase.objects.create(buyer=cls.buyer, product=product)
+
+    def setUp(self):
+        # Every request starts uncached, the worst case for its budget
+        get_cache().clear()
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, MarketplaceFixtures, TestCase):
+    """Each request fails with QueryBudgetExceeded when it runs more queries than QUERY_BUDGETS allows"""
+
+    def login(self, user):
+        """Log in; the first request after a login stores the user's roles in the session"""
+        self.client.force_login(user)
+        with override_settings(QUERY_BUDGETS={}):
+            self.client.get(reverse('marketplace:home'))
+
+    def assertServed(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_budgets_are_enforced(self):
+        with override_settings(QUERY_BUDGETS={'product-list': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('product-list'))
+
+    def test_home(self):
+        self.assertServed(reverse('marketplace:home'))
+        self.login(self.buyer)
+        self.assertServed(reverse('marketplace:home'))
+
+    def test_streamed_home(self):
+        url = reverse('marketplace:home') + '?stream=1'
+        self.assertContains(self.assertServed(url), self.products[-1].name)
+        # The queries run while streaming the body count too
+        with override_settings(QUERY_BUDGETS={'marketplace:home': 1}):
+            response = self.assertServed(url)
+            with self.assertRaises(QueryBudgetExceeded):
+                b''.join(response.streaming_content)
+
+    def test_product_detail(self):
+        url = reverse('marketplace:product_detail', args=[self.product.pk])
+        self.assertServed(url)
+        self.assertServed(url + '?rating=5&page=1')
+        self.login(self.buyer)
+        self.assertServed(url)
+        self.assertServed(url + '?verified=1')
+
+    def test_view_cart(self):
+        self.login(self.buyer)
+        self.client.post(reverse('marketplace:add_to_cart', args=[self.product.pk]))
+        self.assertServed(reverse('marketplace:view_cart'))
+
+    def test_product_list(self):
+        self.assertServed(reverse('product-list'))
+        self.assertServed(reverse('product-list') + '?paginate=keyset')
+        self.assertServed(reverse('product-list') + f'?store={self.stores[0].pk}&ordering=price')
+
+    def test_product_search(self):
+        self.assertServed(reverse('product-search') + '?q=Fixture')
+
+    def test_product_detail_api(self):
+        self.assertServed(reverse('product-detail', args=[self.product.pk]))
+        self.assertServed(reverse('product-detail', args=[self.product.pk]) + '?expand=reviews')
+
+    def test_product_reviews(self):
+        self.assertServed(reverse('product-reviews', args=[self.product.pk]))
+        self.assertServed(reverse('product-reviews', args=[self.product.pk]) + '?verified=true&rating=1')
+
+    def test_review_list(self):
+        self.assertServed(reverse('review-list'))
+        self.assertServed(reverse('review-list') + f'?product={self.product.pk}')
+
+    def test_store_list(self):
+        self.assertServed(reverse('store-list'))
+        self.assertServed(reverse('store-list') + f'?vendor__username={self.vendor.username}')
+
+    def test_store_detail(self):
+        self.assertServed(reverse('store-detail', args=[self.stores[0].pk]))
+        self.assertServed(reverse('store-detail', args=[self.stores[0].pk]) + '?expand=products.reviews,vendor.stores')
+
+    def test_store_products(self):
+        self.assertServed(reverse('store-products', args=[self.stores[0].pk]))
+
+    def test_vendor_stores(self):
+        self.assertServed(reverse('vendor-stores', args=[self.vendor.pk]))
+
+    def test_order_list(self):
+        self.login(self.buyer)
+        response = self.assertServed(reverse('order-list'))
+        self.assertEqual(response.json()['count'], PAGE_OF_ORDERS)
+        self.assertServed(reverse('order-detail', args=[Order.objects.filter(buyer=self.buyer).first().pk]))
+
+    def test_vendor_sales(self):
+        self.login(self.vendor)
+        self.assertServed(reverse('vendor-sales', args=[self.vendor.pk]))
+        self.assertServed(reverse('vendor-analytics', args=[self.vendor.pk]))
+
+    def test_cart_list(self):
+        self.login(self.buyer)
+        self.assertServed(reverse('cart-list'))
+
+
+class QueryPlanTests(QueryPlanTestMixin, MarketplaceFixtures, TestCase):
+    """The hot endpoint queries (see explain_endpoints) are served from indexes"""
+
+    def test_hot_paths_use_indexes(self):
+        for label, queryset in hot_paths():
+            with self.subTest(label):
+                self.assertIsNotNone(queryset, 'no sample row')
+                self.assertUsesIndex(queryset)
+
+
+class KeysetPaginationTests(MarketplaceFixtures, TestCase):
+    """?paginate=keyset pages walk (-created_at, -id) both ways through opaque cursors"""
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        pages = [self.get(reverse('product-list') + '?paginate=keyset')]
+        while pages[-1]['next']:
+            pages.append(self.get(pages[-1]['next']))
+        self.assertEqual([[row['id'] for row in page['results']] for page in pages],
+                         [expected[start:start + 10] for start in range(0, len(expected), 10)])
+        self.assertIsNone(pages[0]['previous'])
+
+        # Walking back from the last page gives the same pages in reverse
+        back = [pages[-1]]
+        while back[-1]['previous']:
+            back.append(self.get(back[-1]['previous']))
+        self.assertEqual([page['results'] for page in back], [page['results'] for page in reversed(pages)])
+        self.assertIsNotNone(back[-1]['next'])
+
+    def test_invalid_cursors(self):
+        url = reverse('product-list') + '?cursor='
+        for cursor in ('garbage', 'WzEsIDJd', 'WyJub3QgYSBkYXRlIiwgMSwgZmFsc2Vd'):
+            with self.subTest(cursor):
+                response = self.client.get(url + cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'cursor': ['Invalid cursor']})
+
+    def test_ordering_is_rejected(self):
+        response = self.client.get(reverse('product-list') + '?paginate=keyset&ordering=price')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.json())
+        self.assertEqual(self.client.get(reverse('product-list') + '?ordering=price').status_code, 200)
+
+
+class RoleTests(MarketplaceFixtures, TestCase):
+    """Vendor/buyer pages are guarded by role_required"""
+
+    def test_vendor_pages(self):
+        url = reverse('marketplace:my_stores')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.vendor)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['is_vendor'])
+
+    def test_buyer_pages(self):
+        url = reverse('marketplace:checkout')
+        self.client.force_login(self.vendor)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.buyer)
+        self.assertRedirects(self.client.get(url), reverse('marketplace:view_cart'))
+
+
+class RatingStatsTests(MarketplaceFixtures, TestCase):
+    """A product's stored review aggregates follow its reviews, however they change"""
+
+    def stats(self, product):
+        product.refresh_from_db()
+        return product.reviews_count, product.rating_sum, product.rating_histogram
+
+    def test_reviews_posted_through_the_page_and_the_api(self):
+        product = self.products[1]
+        self.client.force_login(self.buyers[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('marketplace:add_review', args=[product.pk]), {'rating': 4, 'comment': 'Good'})
+        self.client.force_login(self.buyers[2])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('review-list'), {'product': product.pk, 'rating': 2, 'comment': 'Meh'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.stats(product), (2, 6, {'1': 0, '2': 1, '3': 0, '4': 1, '5': 0}))
+        self.assertEqual(product.average_rating, 3)
+
+    def test_admin_edits_and_deletes(self):
+        product, other = self.products[1], self.products[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(product=product, buyer=self.buyer, rating=5, comment='')
+            Review.objects.create(product=product, buyer=self.buyers[1], rating=3, comment='')
+        with self.captureOnCommitCallbacks(execute=True):
+            review.product = other
+            review.save()
+        self.assertEqual(self.stats(product)[:2], (1, 3))
+        self.assertEqual(self.stats(other)[:2], (1, 5))
+        with self.captureOnCommitCallbacks(execute=True):
+            review.delete()
+        self.assertEqual(self.stats(other), (0, 0, {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}))
+
+    def test_reviews_deleted_with_their_buyer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buyers[4].delete()
+        self.assertEqual(self.stats(self.product)[:2], (11, 28))
+
+    def test_deleting_a_store_skips_the_refresh(self):
+        with mock.patch.object(Product, 'refresh_rating_stats') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.stores[0].delete()
+        refresh.assert_not_called()
+
+
+class ProductReviewsTests(MarketplaceFixtures, TestCase):
+    """
+    The product page and the API's reviews action show the stored star histogram
+    and filter reviews by rating and verified purchase. The fixture product has
+    three 1 and 2-star reviews and two of each other rating; every other one is verified.
+    """
+
+    def page(self, query=''):
+        response = self.client.get(reverse('marketplace:product_detail', args=[self.product.pk]) + query)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def api(self, query=''):
+        return self.client.get(reverse('product-reviews', args=[self.product.pk]) + query)
+
+    def test_histogram(self):
+        response = self.page()
+        self.assertEqual(response.context['product'].rating_breakdown(),
+                         [(5, 2, 17), (4, 2, 17), (3, 2, 17), (2, 3, 25), (1, 3, 25)])
+        self.assertContains(response, '<progress max="100" value="25"></progress>', count=2, html=True)
+        self.assertContains(response, 'href="?rating=5"')
+        self.assertEqual(self.api().data['rating_histogram'], {'1': 3, '2': 3, '3': 2, '4': 2, '5': 2})
+
+    def test_page_filters(self):
+        for query, count, rating, verified in [
+            ('', 12, None, None),
+            ('?rating=2', 3, 2, None),
+            ('?verified=1', 6, None, True),
+            ('?verified=1&rating=1', 2, 1, True),
+            ('?rating=9', 12, None, None),  # Invalid filters are ignored
+        ]:
+            with self.subTest(query):
+                response = self.page(query)
+                reviews = list(response.context['reviews'])
+                self.assertEqual(response.context['page_obj'].paginator.count, count)
+                self.assertEqual(len(reviews), min(count, 10))
+                self.assertEqual((response.context['rating_filter'], response.context['verified_filter']),
+                                 (rating, verified))
+                if rating:
+                    self.assertEqual({review.rating for review in reviews}, {rating})
+                if verified:
+                    self.assertTrue(all(review.verified for review in reviews))
+        self.assertEqual(len(self.page('?page=2').context['reviews']), 2)
+        # Of the two 3-star reviews only buyer 2's is a verified purchase
+        response = self.page('?verified=1&rating=3')
+        self.assertContains(response, 'fixture_buyer_2')
+        self.assertNotContains(response, 'fixture_buyer_7')
+
+    def test_api_filters(self):
+        response = self.api('?verified=true&rating=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([(review['rating'], review['verified']) for review in response.data['results']],
+                         [(1, True), (1, True)])
+        self.assertEqual(self.api('?verified=false').data['count'], 6)
+        # The histogram covers every review, whatever the filters
+        self.assertEqual(response.data['rating_histogram'], self.product.rating_histogram)
+        self.assertEqual(self.api('?rating=9').status_code, 400)
+
+
+class ProductExpandTests(MarketplaceFixtures, TestCase):
+    """A product links to its paginated reviews; ?expand=reviews adds the link to every review"""
+
+    def detail(self, query=''):
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]) + query)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_reviews_link(self):
+        data = self.detail()
+        self.assertNotIn('reviews', data)
+        self.assertEqual(data['reviews_count'], 12)
+        self.assertEqual(data['reviews_url'], 'http://testserver' + reverse('product-reviews', args=[self.product.pk]))
+        store = self.client.get(reverse('store-detail', args=[self.stores[0].pk])).data
+        self.assertTrue(all('reviews' not in product for product in store['products']['results']))
+
+    def test_expand_reviews(self):
+        data = self.detail('?expand=reviews')
+        self.assertEqual(data['reviews'], [
+            'http://testserver' + reverse('review-detail', args=[review_id])
+            for review_id in Review.objects.filter(product=self.product).order_by('id').values_list('id', flat=True)
+        ])
+        self.assertEqual(data['reviews_url'], self.detail()['reviews_url'])
+        # Only the detail action expands
+        products = self.client.get(reverse('product-list') + '?expand=reviews').data['results']
+        self.assertTrue(all('reviews' not in product for product in products))
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]) + '?expand=buyers')
+        self.assertEqual(response.status_code, 400)
+
+
+def serializer_response(view, queryset, row_serializer=None):
+    """RowListMixin.row_response() through the DRF serializer the rows were compiled from"""
+    serializer_class = (row_serializer or view.row_serializer).serializer_class
+    context = view.get_serializer_context()
+    page = view.paginate_queryset(queryset)
+    if page is not None:
+        return view.get_paginated_response(serializer_class(page, many=True, context=context).data)
+    return Response(serializer_class(queryset, many=True, context=context).data)
+
+
+class RowSerializerTests(MarketplaceFixtures, TestCase):
+    """The list endpoints render values() rows into the same bytes as their DRF serializers"""
+
+    URLS = [
+        ('product-list', [], ''),
+        ('product-list', [], '?paginate=keyset'),
+        ('product-list', [], '?ordering=price&page=2'),
+        ('store-list', [], ''),
+        ('store-products', ['store'], ''),
+        ('product-reviews', ['product'], '?verified=true'),
+        ('review-list', [], '?ordering=rating'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # File fields, empty and set, and a timestamp without microseconds
+        Product.objects.filter(pk=cls.products[1].pk).update(image='products/lamp.jpg')
+        Store.objects.filter(pk=cls.stores[0].pk).update(logo='stores/logo.png')
+        Review.objects.filter(buyer=cls.buyers[0]).update(created_at=timezone.make_aware(datetime(2024, 1, 2, 3, 4, 5)))
+
+    def get(self, name, args, query):
+        get_cache().clear()
+        args = [getattr(self, arg).pk for arg in args]
+        response = self.client.get(reverse(name, args=args) + query)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def assertSameBytes(self):
+        for name, args, query in self.URLS:
+            with self.subTest(name, query=query):
+                rows = self.get(name, args, query)
+                # The serializers load an instance per row, over the rows' query budgets
+                with mock.patch.object(RowListMixin, 'row_response', serializer_response), \
+                        override_settings(QUERY_BUDGETS={}):
+                    self.assertEqual(rows, self.get(name, args, query))
+
+    def test_same_bytes(self):
+        self.store = self.stores[0]
+        self.assertSameBytes()
+
+    @override_settings(TIME_ZONE='Asia/Tokyo')
+    def test_same_bytes_in_local_time(self):
+        self.store = self.stores[0]
+        self.assertSameBytes()
+
+
+class SessionTests(TestCase):
+    """The session engines only write sessions whose data changed"""
+
+    def loaded_session(self):
+        session = SessionStore()
+        session['cart'] = {'1': 2}
+        session.save()
+        session = SessionStore(session.session_key)
+        session['cart'] = {'1': 2}  # Marks the session modified with the same data
+        return session
+
+    def writes(self, session):
+        """Statements other than savepoints that session.save() runs"""
+        with CaptureQueriesContext(connection) as queries:
+            session.save()
+        return [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+
+    def test_unchanged_session_is_not_written(self):
+        session = self.loaded_session()
+        self.assertEqual(self.writes(session), [])
+        session['cart'] = {'1': 3}
+        self.assertEqual(len(self.writes(session)), 1)
+        self.assertEqual(SessionStore(session.session_key)['cart'], {'1': 3})
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=True)
+    def test_every_save_writes_when_configured(self):
+        session = self.loaded_session()
+        self.assertEqual(len(self.writes(session)), 1)
+
+
+class CartTests(TestCase):
+    """Cart lines through the pages and /api/cart/, for visitors and logged-in buyers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = ensure_groups()
+        vendor = User.objects.create_user('cart_vendor')
+        vendor.groups.add(groups[VENDORS])
+        cls.buyer = User.objects.create_user('cart_buyer', password='cart-password')
+        cls.buyer.groups.add(groups[BUYERS])
+        store = Store.objects.create(vendor=vendor, name='Cart store')
+        cls.shirt = Product.objects.create(store=store, name='Shirt', description='', price=Decimal('12.50'), stock=10)
+        cls.mug = Product.objects.create(store=store, name='Mug', description='', price=Decimal('4.00'), stock=10)
+
+    def lines(self, user=None):
+        items = CartItem.objects.filter(cart__user=user) if user else CartItem.objects.filter(cart__user=None)
+        return dict(items.values_list('product_id', 'quantity'))
+
+    def add(self, product, quantity):
+        return self.client.post(reverse('marketplace:add_to_cart', args=[product.pk]), {'quantity': quantity})
+
+    def test_add_and_remove_through_the_pages(self):
+        self.assertRedirects(self.add(self.shirt, 2), reverse('marketplace:view_cart'))
+        self.add(self.shirt, 1)
+        self.add(self.mug, 1)
+        self.assertEqual(self.lines(), {self.shirt.pk: 3, self.mug.pk: 1})
+
+        response = self.client.get(reverse('marketplace:view_cart'))
+        self.assertContains(response, 'Shirt')
+        self.assertEqual(response.context['total'], Decimal('41.50'))
+
+        self.client.get(reverse('marketplace:remove_from_cart', args=[self.shirt.pk]))
+        self.assertEqual(self.lines(), {self.mug.pk: 1})
+
+    def test_add_rejects_quantities_below_one(self):
+        self.assertEqual(self.add(self.shirt, 0).status_code, 400)
+        self.assertEqual(self.lines(), {})
+        self.add(self.shirt, 2)
+        for quantity in (-5, 'two'):
+            self.assertEqual(self.add(self.shirt, quantity).status_code, 400)
+        self.assertEqual(self.lines(), {self.shirt.pk: 2})
+
+    def test_api_add_set_and_remove(self):
+        url = reverse('cart-list')
+        response = self.client.post(url, {'product': self.shirt.pk, 'quantity': 2}, content_type='application/json')
+        self.assertEqual((response.json()['count'], response.json()['total']), (2, '25.00'))
+        self.client.post(url, {'product': self.shirt.pk, 'quantity': 1}, content_type='application/json')
+        self.assertEqual(self.lines(), {self.shirt.pk: 3})
+
+        line_url = reverse('cart-detail', args=[self.shirt.pk])
+        response = self.client.put(line_url, {'quantity': 5}, content_type='application/json')
+        self.assertEqual(response.json()['items'][0]['quantity'], 5)
+        self.assertEqual(self.client.put(line_url, {'quantity': -1}, content_type='application/json').status_code, 400)
+        self.client.put(line_url, {'quantity': 0}, content_type='application/json')
+        self.assertEqual(self.lines(), {})
+
+        self.client.post(url, {'product': self.mug.pk, 'quantity': 1}, content_type='application/json')
+        response = self.client.delete(reverse('cart-detail', args=[self.mug.pk]))
+        self.assertEqual(response.json()['items'], [])
+        self.assertEqual(self.client.get(url).json()['count'], 0)
+
+    def test_anonymous_cart_is_merged_on_login(self):
+        users_cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=users_cart, product=self.shirt, quantity=1)
+        CartItem.objects.create(cart=users_cart, product=self.mug, quantity=1)
+
+        self.add(self.shirt, 2)
+        self.add(self.mug, 1)
+        response = self.client.post(reverse('marketplace:login'), {'username': 'cart_buyer', 'password': 'cart-password'})
+        self.assertEqual(response.cookies[cart_cookie_name()].value, '')
+        self.assertEqual(self.lines(self.buyer), {self.shirt.pk: 3, self.mug.pk: 2})
+        self.assertFalse(Cart.objects.filter(user=None).exists())
+        self.assertEqual(self.client.get(reverse('cart-list')).json()['count'], 5)
+
+    def test_snapshots_are_dropped_when_the_write_commits(self):
+        product_snapshots.clear()
+
+        def price():
+            return product_snapshots.get_many([self.shirt.pk])[self.shirt.pk].price
+
+        self.assertEqual(price(), Decimal('12.50'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.price = Decimal('15.00')
+            self.shirt.save()
+            # Other requests can't see the new price yet, so the snapshot stays until the commit
+            self.assertEqual(price(), Decimal('12.50'))
+        self.assertEqual(price(), Decimal('15.00'))
+
+    def test_expired_anonymous_carts_are_purged(self):
+        expired = Cart.objects.create(token='expired')
+        recent = Cart.objects.create(token='recent')
+        users = Cart.objects.create(user=self.buyer)
+        Cart.objects.filter(pk__in=[expired.pk, users.pk]).update(created_at=timezone.now() - timedelta(days=31))
+
+        self.assertEqual(purge_expired_carts(), 1)
+        self.assertEqual(set(Cart.objects.values_list('pk', flat=True)), {recent.pk, users.pk})
+
+
+class OrderExportTests(TestCase):
+    """Order history and vendor sales, on the page and exported as CSV and JSONL"""
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = ensure_groups()
+        cls.vendors = []
+        for name in ('lamps', 'mugs'):
+            vendor = User.objects.create_user(f'{name}_vendor')
+            vendor.groups.add(groups[VENDORS])
+            cls.vendors.append(vendor)
+        cls.buyer = User.objects.create_user('export_buyer')
+        other_buyer = User.objects.create_user('other_buyer')
+        cls.lamp = Product.objects.create(store=Store.objects.create(vendor=cls.vendors[0], name='Lamps'),
+                                          name='Lamp, "desk"', description='A lamp', price=Decimal('10.00'))
+        cls.mug = Product.objects.create(store=Store.objects.create(vendor=cls.vendors[1], name='Mugs'),
+                                         name='Mug', description='A mug', price=Decimal('4.50'))
+
+        cls.mixed = cls.order(cls.buyer, (cls.lamp, 2), (cls.mug, 1))
+        cls.mugs_only = cls.order(cls.buyer, (cls.mug, 3))
+        cls.other = cls.order(other_buyer, (cls.lamp, 1))
+
+    @staticmethod
+    def order(buyer, *lines):
+        order = Order.objects.create(buyer=buyer, total_price=sum(product.price * quantity for product, quantity in lines))
+        for product, quantity in lines:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        return order
+
+    def export(self, url, file_format):
+        response = self.client.get(f'{url}?type={file_format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'.{file_format}"', response['Content-Disposition'])
+        return b''.join(response.streaming_content).decode()
+
+    def csv_row(self, order, product, quantity):
+        return [str(order.pk), order.created_at.isoformat(), order.buyer.username, str(product.pk), product.name,
+                str(quantity), str(product.price)]
+
+    def test_buyer_export(self):
+        self.client.force_login(self.buyer)
+        rows = list(csv.reader(io.StringIO(self.export(reverse('order-export'), 'csv'))))
+        self.assertEqual(rows, [
+            ['order_id', 'created_at', 'buyer', 'product_id', 'product_name', 'quantity', 'price'],
+            self.csv_row(self.mixed, self.lamp, 2),
+            self.csv_row(self.mixed, self.mug, 1),
+            self.csv_row(self.mugs_only, self.mug, 3),
+        ])
+
+        orders = [json.loads(line) for line in self.export(reverse('order-export'), 'jsonl').splitlines()]
+        self.assertEqual([(order['id'], order['total']) for order in orders],
+                         [(self.mixed.pk, '24.50'), (self.mugs_only.pk, '13.50')])
+        self.assertEqual(orders[0]['items'], [
+            {'product_id': self.lamp.pk, 'product_name': self.lamp.name, 'quantity': 2, 'price': '10.00'},
+            {'product_id': self.mug.pk, 'product_name': 'Mug', 'quantity': 1, 'price': '4.50'},
+        ])
+        # Chunks are walked by id, so their size doesn't change the output
+        self.assertEqual(list(export_orders(buyer_orders(self.buyer), 'jsonl', chunk_size=1)),
+                         list(export_orders(buyer_orders(self.buyer), 'jsonl')))
+
+    def test_vendor_sales_show_only_their_lines(self):
+        lamps = self.vendors[0]
+        self.client.force_login(lamps)
+        sales = self.client.get(reverse('vendor-sales', args=[lamps.pk])).json()['results']
+        self.assertEqual([(sale['id'], sale['buyer_username'], sale['sales_total']) for sale in sales],
+                         [(self.other.pk, 'other_buyer', '10.00'), (self.mixed.pk, 'export_buyer', '20.00')])
+        self.assertEqual({item['product'] for sale in sales for item in sale['items']}, {self.lamp.pk})
+
+        url = reverse('vendor-export-sales', args=[lamps.pk])
+        rows = list(csv.reader(io.StringIO(self.export(url, 'csv'))))[1:]
+        self.assertEqual(rows, [self.csv_row(self.mixed, self.lamp, 2), self.csv_row(self.other, self.lamp, 1)])
+        orders = [json.loads(line) for line in self.export(url, 'jsonl').splitlines()]
+        self.assertEqual([(order['id'], order['total'], len(order['items'])) for order in orders],
+                         [(self.mixed.pk, '20.00', 1), (self.other.pk, '10.00', 1)])
+
+        self.client.force_login(self.vendors[1])
+        self.assertEqual(self.client.get(reverse('vendor-sales', args=[lamps.pk])).status_code, 403)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class CatalogCacheTests(MarketplaceFixtures, TestCase):
+    """Cached anonymous product pages follow renames of their store"""
+
+    def rename_store(self):
+        store = self.stores[0]
+        store.name = 'Renamed store'
+        with self.captureOnCommitCallbacks(execute=True):
+            store.save()
+
+    def test_product_page_follows_store_rename(self):
+        url = reverse('marketplace:product_detail', args=[self.product.pk])
+        self.assertNotContains(self.client.get(url), 'Renamed store')
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        self.rename_store()
+        self.assertContains(self.client.get(url), 'Renamed store')
+
+    def test_product_api_follows_store_rename(self):
+        url = reverse('product-detail', args=[self.product.pk])
+        self.assertEqual(self.client.get(url).json()['store_name'], self.stores[0].name)
+        self.rename_store()
+        self.assertEqual(self.client.get(url).json()['store_name'], 'Renamed store')
+
+    def test_vendor_filter_follows_store_handover(self):
+        url = reverse('product-list') + '?store__vendor__username=fixture_buyer_1'
+        self.assertEqual(self.client.get(url).json()['results'], [])
+        store = self.stores[1]
+        store.vendor = self.buyers[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            store.save()
+        names = {product['name'] for product in self.client.get(url).json()['results']}
+        self.assertEqual({name.rsplit('-', 1)[0] for name in names}, {f'Fixture product {store.pk}'})
+        self.assertEqual(Product.objects.filter(vendor=self.buyers[1]).count(), self.PRODUCTS_PER_STORE)
+
+
+class SalesReportTests(MarketplaceFixtures, TestCase):
+    """Sales reports, and the daily rollups they read being rebuilt window by window"""
+
+    def assertReport(self, today):
+        report = vendor_sales_report(self.vendor, today, today)
+        self.assertEqual(report['totals']['total_orders'], 1)
+        self.assertEqual(report['totals']['total_units'], 3)
+        self.assertEqual([day['total_orders'] for day in report['days']], [1])
+        self.assertEqual([store['total_orders'] for store in report['stores']], [1, 1])
+        store_report = vendor_sales_report(self.vendor, today, today, store_id=self.stores[1].pk)
+        self.assertEqual(store_report['totals']['total_units'], 2)
+
+    def test_order_spanning_stores(self):
+        Order.objects.all().delete()  # The fixture orders were not rolled up
+        other_store_product = self.products[self.PRODUCTS_PER_STORE]
+        order = place_order(self.buyer, {self.product.pk: 1, other_store_product.pk: 2})
+        today = timezone.localdate(order.created_at)
+        self.assertReport(today)
+        rebuild_rollups(log=lambda message: None)
+        self.assertReport(today)
+
+    def order_at(self, moment, quantity):
+        """An order placed at moment (local time) that checkout didn't roll up"""
+        order = Order.objects.create(buyer=self.buyer, total_price=self.product.price * quantity)
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=self.product.price)
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(moment))
+
+    @timezone.override('Asia/Tokyo')
+    def test_rebuild_windows(self):
+        Order.objects.all().delete()
+        first = date(2026, 3, 1)
+        # Both on March 1st in UTC, but not in the current time zone
+        self.order_at(datetime(2026, 3, 1, 23, 59), quantity=1)
+        self.order_at(datetime(2026, 3, 2, 0, 0), quantity=2)
+        self.order_at(datetime(2026, 4, 10, 12, 0), quantity=4)
+
+        windows = []
+        self.assertEqual(rebuild_rollups(days_per_batch=2, log=windows.append), 9)
+        days = {first: 1, first + timedelta(days=1): 2, first + timedelta(days=40): 4}
+        self.assertEqual(dict(ProductDailySales.objects.values_list('date', 'units')), days)
+        self.assertEqual(dict(StoreDailySales.objects.values_list('date', 'units')), days)
+        self.assertEqual(len(windows), 21)
+        self.assertTrue(windows[0].startswith('2026-03-01 - 2026-03-02: 2 product rows'))
+        self.assertTrue(windows[-1].startswith('2026-04-10 - 2026-04-10: 1 product rows'))
+
+        # Rebuilding a window leaves the days outside it alone
+        ProductDailySales.objects.update(units=99)
+        rebuild_rollups(since=date(2026, 3, 2), until=date(2026, 3, 2), log=windows.append)
+        self.assertEqual(dict(ProductDailySales.objects.values_list('date', 'units')),
+                         {**{day: 99 for day in days}, first + timedelta(days=1): 2})
+
+
+class SearchTests(TestCase):
+    """Ranked search, the ?search= list filter and keeping the in-process index current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create_user('search_vendor')
+        cls.store = Store.objects.create(vendor=vendor, name='Lighting House')
+        cls.lamp = Product.objects.create(store=cls.store, name='Desk lamp', description='Warm light', price=20, stock=1)
+        cls.bulb = Product.objects.create(store=cls.store, name='Bulb', description='Fits any lamp', price=2, stock=1)
+        cls.chair = Product.objects.create(store=Store.objects.create(vendor=vendor, name='Seating'),
+                                           name='Chair', description='Oak', price=50, stock=1)
+
+    def setUp(self):
+        get_search_backend().reset()  # Earlier tests' rows were rolled back
+
+    def test_name_matches_rank_first(self):
+        backend = InMemorySearchBackend()
+        self.assertEqual(backend.search_products('lamp', 10), [self.lamp.pk, self.bulb.pk])
+        # Both products of the matching store, none of the other
+        self.assertEqual(set(backend.search_products('lighting', 10)), {self.lamp.pk, self.bulb.pk})
+        self.assertEqual(backend.search_products('lamp', 1), [self.lamp.pk])
+
+    def test_ranked_search_endpoint(self):
+        response = self.client.get(reverse('product-search'), {'q': 'lamp'})
+        self.assertEqual([product['id'] for product in response.json()['results']], [self.lamp.pk, self.bulb.pk])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_search_filter_is_not_capped(self):
+        response = self.client.get(reverse('product-list'), {'search': 'lamp'})
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual({product['id'] for product in response.json()['results']}, {self.lamp.pk, self.bulb.pk})
+        response = self.client.get(reverse('store-list'), {'search': 'search_vendor'})
+        self.assertEqual(response.json()['count'], 2)
+
+    def test_fulltext_filter_uses_match(self):
+        sql = str(FullTextSearchBackend().filter_products(Product.objects.all(), ['lamp']).query)
+        self.assertIn('AGAINST (+lamp* IN BOOLEAN MODE)', sql)
+        self.assertNotIn('LIMIT', sql)
+
+    def test_index_follows_writes(self):
+        backend = get_search_backend()
+        self.assertEqual(backend.search_products('sofa', 10), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            sofa = Product.objects.create(store=self.store, name='Sofa', description='', price=300, stock=1)
+        self.assertEqual(backend.search_products('sofa', 10), [sofa.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            sofa.name = 'Couch'
+            sofa.save()
+        self.assertEqual(backend.search_products('sofa', 10), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            sofa.delete()
+        self.assertEqual(backend.search_products('couch', 10), [])
+
+    def test_index_follows_imports(self):
+        backend = get_search_backend()
+        self.assertEqual(backend.search_products('hammock', 10), [])
+        rows = io.StringIO('sku,name,description,price,stock\nH-1,Hammock,Garden,80.00,2\n')
+        with self.captureOnCommitCallbacks(execute=True):
+            import_products(self.store, rows, 'csv')
+        self.assertEqual(backend.search_products('hammock', 10), [Product.objects.get(sku='H-1').pk])
+
+    def test_index_is_rebuilt_when_old(self):
+        backend = InMemorySearchBackend(max_age=0)
+        backend.search_products('lamp', 10)
+        # bulk_create sends no signals, like a write made by another process
+        Product.objects.bulk_create([Product(store=self.store, vendor_id=self.store.vendor_id, name='Floor lamp',
+                                             description='', price=90, stock=1)])
+        self.assertEqual(len(backend.search_products('lamp', 10)), 3)
+
+
+@override_settings(IMAGE_PROCESSING_ASYNC=False, IMAGE_VARIANT_SIZES={'thumb': (30, 30)})
+class ImageVariantTests(TestCase):
+    """Resized copies follow the product image through upload, replacement and deletion"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        storage_settings = override_settings(MEDIA_ROOT=media_root.name)
+        storage_settings.enable()
+        self.addCleanup(storage_settings.disable)
+        self.store = Store.objects.create(vendor=User.objects.create_user('image_vendor'), name='Image store')
+
+    def image(self, name, mode='RGB'):
+        content = io.BytesIO()
+        Image.new(mode, (120, 60)).save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def variant_files(self, product):
+        product.refresh_from_db()
+        return {key: name for key, name in product.image_variants.items() if key != 'source'}
+
+    def test_variants_are_generated_replaced_and_deleted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(store=self.store, name='Lamp', description='A lamp', price=1,
+                                             image=self.image('lamp.png'))
+        first = self.variant_files(product)
+        self.assertEqual(set(first), {'thumb', 'thumb_webp'})
+        self.assertEqual(first['thumb_webp'], 'product_images/lamp__thumb.webp')
+        with default_storage.open(first['thumb']) as thumb, Image.open(thumb) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (30, 15)))
+        self.assertEqual(product.image_variants['source'], product.image.name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = self.image('shade.png', mode='RGBA')
+            product.save()
+        second = self.variant_files(product)
+        self.assertEqual(second['thumb'], 'product_images/shade__thumb.png')
+        self.assertFalse(any(default_storage.exists(name) for name in first.values()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.image = None
+            product.save()
+        self.assertEqual(self.variant_files(product), {})
+        self.assertFalse(any(default_storage.exists(name) for name in second.values()))
+
+    def test_variants_are_deleted_with_the_store(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(store=self.store, name='Lamp', description='A lamp', price=1,
+                                             image=self.image('lamp.png'))
+        variants = self.variant_files(product)
+        self.assertTrue(all(default_storage.exists(name) for name in variants.values()))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.delete()
+        self.assertFalse(any(default_storage.exists(name) for name in variants.values()))
+
+
+class CatalogImportTests(MarketplaceFixtures, TestCase):
+
+    def catalog(self, store):
+        return list(store.products.order_by('sku', 'name').values_list('sku', 'name', 'description', 'price', 'stock'))
+
+    def upload(self, store, content, file_format):
+        upload = SimpleUploadedFile(f'catalog.{file_format}', content)
+        return self.client.post(reverse('store-import-products', args=[store.pk]), {'file': upload})
+
+    def test_export_and_import_round_trip(self):
+        Product.objects.create(store=self.stores[0], name='No sku', description='Line one\nline two, "quoted"',
+                               price=Decimal('3.50'), stock=0)
+        self.client.force_login(self.vendor)
+        for file_format in ('csv', 'jsonl'):
+            with self.subTest(file_format):
+                url = reverse('store-export-products', args=[self.stores[0].pk]) + f'?type={file_format}'
+                content = b''.join(self.client.get(url).streaming_content)
+                store = Store.objects.create(vendor=self.vendor, name=f'Copy ({file_format})')
+
+                self.assertEqual(self.upload(store, content, file_format).json()['created'], 16)
+                self.assertEqual(self.catalog(store), self.catalog(self.stores[0]))
+                self.assertEqual(store.products.filter(sku=None).count(), 1)
+                # Again: rows with a sku update their product, the row without one is a new product
+                result = self.upload(store, content, file_format).json()
+                self.assertEqual((result['created'], result['updated'], result['invalid']), (1, 15, 0))
+
+    def test_invalid_rows_are_reported(self):
+        store = self.stores[1]
+        rows = io.StringIO(
+            'sku,name,description,price,stock\n'
+            'OK-1,Valid,A product,2.00,1\n'
+            'BAD-1,Free,A product,0,1\n'
+            'BAD-2,,A product,2.00,-1\n'
+        )
+        result = import_products(store, rows, 'csv')
+        self.assertEqual((result.created, result.invalid), (1, 2))
+        self.assertEqual([error['row'] for error in result.errors], [2, 3])
+        self.assertIn('price', result.errors[0]['errors'])
+        self.assertEqual(set(result.errors[1]['errors']), {'name', 'stock'})
+
+        lines = io.StringIO('{"sku": "OK-2", "name": "Valid", "description": "A product", "price": "1.00", "stock": 1}\n'
+                            '\n{not json\n[1, 2]\n')
+        result = import_products(store, lines, 'jsonl')
+        self.assertEqual((result.created, result.invalid), (1, 2))
+        self.assertIn('Line 3: invalid JSON', result.errors[0]['errors'])
+        self.assertEqual(result.errors[1]['errors'], 'Line 4: expected a JSON object')
+        self.assertEqual(store.products.filter(sku__in=['OK-1', 'OK-2']).count(), 2)
+
+    def test_blank_skus_are_stored_as_null(self):
+        self.client.force_login(self.vendor)
+        for name in ('First', 'Second'):
+            response = self.client.post(reverse('product-list'), {
+                'store': self.stores[0].pk, 'name': name, 'sku': '', 'description': 'A product', 'price': '1.00', 'stock': 1,
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 201, response.content)
+            self.assertIsNone(response.json()['sku'])
+        import_products(self.stores[0], io.StringIO('sku,name,description,price,stock\n ,Third,A product,1.00,1\n'), 'csv')
+        self.assertEqual(self.stores[0].products.filter(sku=None).count(), 3)
+
+    def test_concurrently_created_sku_is_updated(self):
+        store = self.stores[0]
+        rows = io.StringIO('sku,name,description,price,stock\nRACE-1,Imported,Imported product,5.00,3\n')
+        # The other import's row, committed after this import looked for existing skus
+        Product.objects.create(store=store, sku='RACE-1', name='Other import', description='', price=1, stock=1)
+        lookup = Product.objects.select_for_update
+        lookups = []
+
+        def racing_lookup(*args, **kwargs):
+            lookups.append(args)
+            queryset = lookup(*args, **kwargs)
+            return queryset.none() if len(lookups) == 1 else queryset
+
+        with mock.patch.object(Product.objects, 'select_for_update', racing_lookup):
+            result = import_products(store, rows, 'csv')
+
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual(Product.objects.get(store=store, sku='RACE-1').name, 'Imported')
+
+
+class SeedTests(TestCase):
+    """seed_marketplace writes the same rows for the same --seed and --now"""
+
+    SIZES = ['--vendors', '2', '--stores-per-vendor', '2', '--products-per-store', '4', '--buyers', '6',
+             '--orders', '15', '--reviews-per-product', '2', '--now', '2026-01-01']
+
+    def seed(self, *args):
+        call_command('seed_marketplace', *self.SIZES, *args, stdout=io.StringIO())
+        rows = (
+            list(Store.objects.order_by('id').values_list('vendor__username', 'name', 'created_at')),
+            list(Product.objects.order_by('sku').values_list('sku', 'name', 'price', 'stock', 'rating_histogram')),
+            list(Order.objects.order_by('id').values_list('buyer__username', 'total_price', 'created_at')),
+            list(OrderItem.objects.order_by('order_id', 'product__sku')
+                 .values_list('product__sku', 'quantity', 'price')),
+            sorted(Review.objects.values_list('product__sku', 'buyer__username', 'rating', 'verified')),
+        )
+        User.objects.filter(username__startswith=USER_PREFIX).delete()
+        return rows
+
+    def test_same_seed_same_rows(self):
+        first = self.seed('--seed', '7')
+        self.assertTrue(all(first))
+        self.assertEqual(self.seed('--seed', '7', '--batch-size', '3'), first)
+        self.assertNotEqual(self.seed('--seed', '8'), first)
+
+    def test_sizes_are_validated(self):
+        for option in ('--max-order-size', '--batch-size'):
+            with self.subTest(option), self.assertRaisesMessage(CommandError, 'must be at least 1'):
+                call_command('seed_marketplace', *self.SIZES, option, '0', stdout=io.StringIO())
+
+
+class LoadTestStatsTests(SimpleTestCase):
+    """The loadtest report: nearest-rank percentiles and status buckets per label"""
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0)
+        self.assertEqual(percentile([7], 99), 7)
+        self.assertEqual([percentile([1, 2, 3, 4], p) for p in (1, 50, 95, 100)], [1, 2, 4, 4])
+
+    def test_summary(self):
+        stats = Stats()
+        latencies = list(range(1, 101))
+        random.Random(1).shuffle(latencies)
+        for index, milliseconds in enumerate(latencies):
+            status = 404 if index < 5 else 503 if index < 8 else 200
+            stats.record('product detail', status, milliseconds / 1000)
+        stats.fail('product detail')
+        stats.fail('checkout')
+
+        summary = stats.summary(duration=20)
+        self.assertEqual(list(summary), ['checkout', 'product detail'])
+        detail = summary['product detail']
+        self.assertEqual((detail['requests'], detail['rps']), (100, 5))
+        self.assertEqual([round(detail[p], 6) for p in ('p50', 'p95', 'p99')], [50, 95, 99])
+        self.assertEqual((detail['client_errors'], detail['errors']), (5, 4))
+        self.assertEqual(summary['checkout'], {'requests': 0, 'rps': 0, 'p50': 0, 'p95': 0, 'p99': 0,
+                                               'client_errors': 0, 'errors': 1})
+
+
+class FailingTransport:
+    def deliver(self, message):
+        raise DeliveryError('unavailable')
+
+
+class OutboxTests(TestCase):
+    """process_outbox leases a batch, delivers it outside the claim and records each result"""
+
+    def setUp(self):
+        self.message = OutboxMessage.objects.create(kind=OutboxMessage.KIND_STORE_TWEET, payload={'store_id': 1})
+
+    def test_delivers_pending_messages(self):
+        transport = StubTransport()
+        self.assertEqual(process_outbox(transport=transport), {'sent': 1, 'retried': 0, 'failed': 0})
+        self.assertEqual(transport.sent, [(OutboxMessage.KIND_STORE_TWEET, {'store_id': 1})])
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), (OutboxMessage.STATUS_SENT, 1))
+        self.assertEqual(process_outbox(transport=transport)['sent'], 0)
+
+    def test_claimed_messages_are_leased(self):
+        batch, _ = claim_batch(10)
+        self.assertEqual(batch, [self.message])
+        # Another worker finds nothing due until the lease runs out
+        self.assertEqual(process_outbox(transport=StubTransport())['sent'], 0)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_then_given_up(self):
+        self.assertEqual(process_outbox(transport=FailingTransport())['retried'], 1)
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, OutboxMessage.STATUS_PENDING)
+        self.assertEqual(self.message.last_error, 'unavailable')
+
+        OutboxMessage.objects.update(next_attempt_at=self.message.created_at)
+        self.assertEqual(process_outbox(transport=FailingTransport())['failed'], 1)
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.status, self.message.attempts), (OutboxMessage.STATUS_FAILED, 2))
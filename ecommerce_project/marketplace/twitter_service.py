@@ -98,5 +98,31 @@ class TwitterService:
             print(f"Error tweeting about product {product.name}: {e}")
             return False
 
+    
+    def tweet_catalog_import(self, store, product_count):
+        if not self.oauth:
+            return False
+        
+        try:
+            tweet_text = f"📦 {product_count} new products just landed!\n"
+            tweet_text += f"🏪 {store.name}\n"
+            tweet_text += f"#eCommerce #NewProducts"
+            
+            response = self.oauth.post(
+                "https://api.twitter.com/1.1/statuses/update.json",
+                data={"status": tweet_text},
+            )
+            
+            if response.status_code == 200:
+                print(f"Tweeted about catalog import for store: {store.name}")
+                return True
+            else:
+                print(f"Tweet failed: {response.status_code} - {response.text}")
+                return False
+                
+        except Exception as e:
+            print(f"Error tweeting about catalog import for store {store.name}: {e}")
+            return False
+
 
 twitter_service = TwitterService()
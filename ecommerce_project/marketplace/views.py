@@ -2,16 +2,30 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.decorators import login_required, permission_required
-from django.http import HttpResponseRedirect, HttpResponseForbidden
+from django.http import HttpResponseRedirect, HttpResponseBadRequest, Http404, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.core.paginator import Paginator
+from django.conf import settings
 from django.urls import reverse
 from django.core.mail import EmailMessage
 from django.utils import timezone
-from django.db.models import Sum, F
 from datetime import timedelta
 from hashlib import sha1
 import secrets
 
-from .models import Store, Product, Order, OrderItem, Review, ResetToken
+from .models import Store, Product, Review, ResetToken
+from .checkout_service import place_order, CheckoutError, UnknownProductError
+from .purchase_service import has_purchased
+from .cart_service import (
+    get_cart, cart_lines, visitor_cart_lines, add_item, remove_item, clear_cart, price_cart
+)
+from .roles import role_required, VENDORS, BUYERS
+from .serializers import ReviewFilterSerializer
+from .cache_service import cache_anonymous_page, tag_response, product_tags, store_product_tags, PRODUCTS_TAG
+
+
+# Placeholder in home.html where streamed product cards are inserted
+HOME_STREAM_MARKER = '<!-- product-stream -->'
 
 
 # ==================== AUTHENTICATION VIEWS ====================
@@ -155,50 +169,109 @@ def password_reset(request, token):
 
 # ==================== HOME & PRODUCT BROWSING ====================
 
+@cache_anonymous_page(lambda request: [PRODUCTS_TAG])
 def home(request):
-    """Home page showing all products"""
-    products = Product.objects.all().select_related('store')
-    return render(request, 'marketplace/home.html', {'products': products})
+    """
+    Home page showing all products
+    - ?page=N          paginated (default)
+    - ?page=N&partial=1 just the product cards, used by the "Load more" button
+    - ?stream=1         the whole catalog, streamed in chunks
+    """
+    products = home_products()
+    
+    if request.GET.get('stream') and products.exists():
+        return stream_home(request, products)
+    
+    paginator = Paginator(products, getattr(settings, 'HOME_PAGE_SIZE', 24))
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    if request.GET.get('partial'):
+        response = render(request, 'marketplace/product_cards.html', {'products': page_obj})
+        if page_obj.has_next():
+            response['X-Next-Page'] = page_obj.next_page_number()
+        return response
+    
+    return render(request, 'marketplace/home.html', {
+        'products': page_obj,
+        'page_obj': page_obj
+    })
 
 
-def product_detail(request, product_id):
-    """View product details and reviews"""
-    product = get_object_or_404(Product, id=product_id)
-    reviews = product.reviews.all().order_by('-created_at')
+def home_products():
+    """Catalog query for the home page - only the columns the product cards show"""
+    return (
+        Product.objects
+        .select_related('store')
+        .only('name', 'description', 'price', 'stock', 'image_variants', 'store__name')
+        .order_by('-created_at', '-id')
+    )
+
+
+def stream_home(request, products):
+    """Stream the home page, rendering the product cards one chunk at a time"""
+    chunk_size = getattr(settings, 'HOME_STREAM_CHUNK_SIZE', 200)
+    page = render_to_string('marketplace/home.html', {'streaming': True}, request)
+    head, tail = page.split(HOME_STREAM_MARKER, 1)
     
-    # Check if user has purchased this product
-    has_purchased = False
-    if request.user.is_authenticated:
-        has_purchased = OrderItem.objects.filter(
-            order__buyer=request.user,
-            product=product
-        ).exists()
+    def chunks():
+        yield head
+        batch = []
+        # iterator() keeps memory flat: rows are fetched and discarded chunk by chunk
+        for product in products.iterator(chunk_size=chunk_size):
+            batch.append(product)
+            if len(batch) >= chunk_size:
+                yield render_to_string('marketplace/product_cards.html', {'products': batch})
+                batch = []
+        if batch:
+            yield render_to_string('marketplace/product_cards.html', {'products': batch})
+        yield tail
+    
+    return StreamingHttpResponse(chunks(), content_type='text/html; charset=utf-8')
+
+
+@cache_anonymous_page(lambda request, product_id: product_tags(product_id))
+def product_detail(request, product_id):
+    """
+    View product details, the stored star histogram and one page of reviews
+    - ?page=N                  paginated reviews, newest first
+    - ?verified=1 / ?rating=N  only verified purchases / N-star reviews
+    """
+    product = get_object_or_404(Product.objects.select_related('store__vendor'), id=product_id)
+    tag_response(request, *store_product_tags(product.store_id))
+    
+    filters = ReviewFilterSerializer(data=request.GET.dict())
+    review_filters = filters.validated_data if filters.is_valid() else {}
+    reviews = product.reviews.filter_page(**review_filters).select_related('buyer').order_by('-created_at')
+    paginator = Paginator(reviews, getattr(settings, 'PRODUCT_REVIEWS_PAGE_SIZE', 10))
+    stored_count = product.count_reviews(**review_filters)
+    if stored_count is not None:
+        paginator.count = stored_count  # The stored aggregates spare a COUNT(*)
+    page_obj = paginator.get_page(request.GET.get('page'))
     
     return render(request, 'marketplace/product_detail.html', {
         'product': product,
-        'reviews': reviews,
-        'has_purchased': has_purchased
+        'reviews': page_obj,
+        'page_obj': page_obj,
+        'rating_filter': review_filters.get('rating'),
+        'verified_filter': review_filters.get('verified'),
+        'has_purchased': has_purchased(request.user, product)
     })
 
 
 # ==================== VENDOR VIEWS ====================
 
 @login_required
+@role_required(VENDORS, "Only vendors can access this page")
 def my_stores(request):
     """List vendor's stores"""
-    if not request.user.groups.filter(name='Vendors').exists():
-        return HttpResponseForbidden("Only vendors can access this page")
-    
     stores = request.user.stores.all()
     return render(request, 'marketplace/my_stores.html', {'stores': stores})
 
 
 @login_required
+@role_required(VENDORS, "Only vendors can create stores")
 def create_store(request):
     """Create a new store"""
-    if not request.user.groups.filter(name='Vendors').exists():
-        return HttpResponseForbidden("Only vendors can create stores")
-    
     if request.method == 'POST':
         name = request.POST.get('name')
         description = request.POST.get('description')
@@ -350,22 +423,7 @@ def delete_product(request, product_id):
 
 def view_cart(request):
     """View shopping cart"""
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total = 0
-    
-    for product_id, quantity in cart.items():
-        try:
-            product = Product.objects.get(id=product_id)
-            subtotal = product.price * quantity
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'subtotal': subtotal
-            })
-            total += subtotal
-        except Product.DoesNotExist:
-            pass
+    cart_items, total = price_cart(visitor_cart_lines(request))
     
     return render(request, 'marketplace/cart.html', {
         'cart_items': cart_items,
@@ -376,149 +434,81 @@ def view_cart(request):
 def add_to_cart(request, product_id):
     """Add product to cart"""
     product = get_object_or_404(Product, id=product_id)
-    quantity = int(request.POST.get('quantity', 1))
+    try:
+        quantity = int(request.POST.get('quantity', 1))
+    except ValueError:
+        quantity = 0
+    if quantity < 1:
+        return HttpResponseBadRequest("Quantity must be a whole number of at least 1")
     
-    cart = request.session.get('cart', {})
-    cart[str(product_id)] = cart.get(str(product_id), 0) + quantity
-    request.session['cart'] = cart
-    request.session.modified = True
+    add_item(get_cart(request, create=True), product.id, quantity)
     
     return redirect('marketplace:view_cart')
 
 
 def remove_from_cart(request, product_id):
     """Remove product from cart"""
-    cart = request.session.get('cart', {})
+    cart = get_cart(request)
     
-    if str(product_id) in cart:
-        del cart[str(product_id)]
-        request.session['cart'] = cart
-        request.session.modified = True
+    if cart is not None:
+        remove_item(cart, product_id)
     
     return redirect('marketplace:view_cart')
 
 
 @login_required
+@role_required(BUYERS, "Only buyers can checkout")
 def checkout(request):
     """Checkout and create order"""
-    if not request.user.groups.filter(name='Buyers').exists():
-        return HttpResponseForbidden("Only buyers can checkout")
-    
-    cart = request.session.get('cart', {})
+    cart = get_cart(request)
+    lines = cart_lines(cart)
     
-    if not cart:
+    if not lines:
         return redirect('marketplace:view_cart')
     
-    # Calculate total and create order
-    total = 0
-    order_items = []
-    
-    for product_id, quantity in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        
-        if product.stock < quantity:
-            return render(request, 'marketplace/cart.html', {
-                'error': f'Not enough stock for {product.name}'
-            })
-        
-        subtotal = product.price * quantity
-        total += subtotal
-        order_items.append({
-            'product': product,
-            'quantity': quantity,
-            'price': product.price
+    try:
+        order = place_order(request.user, lines)
+    except UnknownProductError:
+        raise Http404("Product not found")
+    except CheckoutError as e:
+        return render(request, 'marketplace/cart.html', {
+            'error': str(e)
         })
     
-    # Create order
-    order = Order.objects.create(
-        buyer=request.user,
-        total_price=total
-    )
-    
-    # Create order items and update stock
-    for item in order_items:
-        OrderItem.objects.create(
-            order=order,
-            product=item['product'],
-            quantity=item['quantity'],
-            price=item['price']
-        )
-        
-        # Reduce stock
-        product = item['product']
-        product.stock -= item['quantity']
-        product.save()
-    
-    # Send invoice email
-    send_invoice_email(order)
-    
     # Clear cart
-    request.session['cart'] = {}
-    request.session.modified = True
+    clear_cart(cart)
     
     return render(request, 'marketplace/order_success.html', {'order': order})
 
 
-def send_invoice_email(order):
-    """Send invoice to buyer"""
-    items_text = "\n".join([
-        f"{item.quantity}x {item.product.name} - ${item.price} = ${item.quantity * item.price}"
-        for item in order.items.all()
-    ])
-    
-    body = f"""
-    Order Invoice #{ order.id}
-    
-    Items:
-    {items_text}
-    
-    Total: ${order.total_price}
-    
-    Thank you for your purchase!
-    """
-    
-    email = EmailMessage(
-        subject=f'Order Invoice #{order.id}',
-        body=body,
-        from_email='noreply@marketplace.com',
-        to=[order.buyer.email]
-    )
-    email.send()
-
-
 # ==================== REVIEWS ====================
 
 @login_required
+@role_required(BUYERS, "Only buyers can leave reviews")
 def add_review(request, product_id):
     """Add a review for a product"""
-    if not request.user.groups.filter(name='Buyers').exists():
-        return HttpResponseForbidden("Only buyers can leave reviews")
-    
     product = get_object_or_404(Product, id=product_id)
     
     # Check if already reviewed
     if Review.objects.filter(product=product, buyer=request.user).exists():
         return redirect('marketplace:product_detail', product_id=product_id)
     
+    # Check if user has purchased this product
+    purchased = has_purchased(request.user, product)
+    
     if request.method == 'POST':
         rating = request.POST.get('rating')
         comment = request.POST.get('comment')
         
-        # Check if user has purchased this product
-        has_purchased = OrderItem.objects.filter(
-            order__buyer=request.user,
-            product=product
-        ).exists()
-        
         Review.objects.create(
             product=product,
             buyer=request.user,
             rating=rating,
             comment=comment,
-            verified=has_purchased
+            verified=purchased
         )
         
         return redirect('marketplace:product_detail', product_id=product_id)
     
-    return render(request, 'marketplace/add_review.html', {'product': product})
+    return render(request, 'marketplace/add_review.html', {'product': product, 'has_purchased': purchased})
 